@@ -0,0 +1,241 @@
+# broadcast.py - Рассылка сообщений всем пользователям с ограничением скорости
+import asyncio
+import logging
+import time
+from typing import Dict, Optional, Set
+
+from aiogram import Bot
+from aiogram.exceptions import (
+    TelegramRetryAfter, TelegramForbiddenError, TelegramBadRequest, TelegramNetworkError, TelegramAPIError
+)
+
+from config import Config
+from database.database import DatabaseManager
+from database.models import Broadcast
+
+logger = logging.getLogger(__name__)
+
+# Не чаще одного сообщения в один чат за столько секунд (повторы после ошибок)
+PER_CHAT_INTERVAL = 1.0
+# Повторы отправки одному пользователю после RetryAfter и сетевых ошибок
+MAX_SEND_ATTEMPTS = 3
+NETWORK_RETRY_DELAY = 2.0
+# Не чаще одного обновления сообщения о прогрессе за столько секунд
+PROGRESS_INTERVAL = 5.0
+
+class TokenBucket:
+    """Общий лимит отправок в секунду; RetryAfter от Telegram приостанавливает всех отправителей"""
+    
+    def __init__(self, rate: float, capacity: float = 1.0):
+        self.rate = rate
+        # Без накопления запаса: отправки идут равномерно, без всплесков сверх лимита Telegram
+        self.capacity = capacity
+        self.tokens = self.capacity
+        self.updated_at = time.monotonic()
+        self.paused_until = 0.0
+        self._lock = asyncio.Lock()
+    
+    def pause(self, seconds: float):
+        """Остановка выдачи токенов (Telegram попросил подождать)"""
+        self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+        self.tokens = 0
+    
+    async def acquire(self):
+        """Ожидание токена; очередь ожидающих обслуживается по одному"""
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                if now < self.paused_until:
+                    await asyncio.sleep(self.paused_until - now)
+                    self.updated_at = time.monotonic()
+                    continue
+                
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+                self.updated_at = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+class BroadcastEngine:
+    """Отправка рассылки пачками пользователей через пул воркеров с общим лимитом скорости"""
+    
+    def __init__(self, bot: Bot, db: DatabaseManager, broadcast: Broadcast,
+                 rate: float = Config.BROADCAST_RATE, workers: int = Config.BROADCAST_WORKERS,
+                 chunk_size: int = Config.BROADCAST_CHUNK_SIZE):
+        self.bot = bot
+        self.db = db
+        self.broadcast = broadcast
+        self.bucket = TokenBucket(rate)
+        self.workers = workers
+        self.chunk_size = chunk_size
+        # Продолжение прерванной рассылки: счетчики и курсор из БД
+        self.sent = broadcast.sent
+        self.failed = broadcast.failed
+        self.last_user_id = broadcast.last_user_id
+        self._last_sent_to: Dict[int, float] = {}
+        self._status_message_id: Optional[int] = None
+        self._last_report = 0.0
+    
+    async def run(self):
+        """Рассылка до конца списка пользователей; прогресс сохраняется после каждой пачки"""
+        queue: asyncio.Queue = asyncio.Queue()
+        workers = [asyncio.create_task(self._worker(queue)) for _ in range(self.workers)]
+        started_at = time.monotonic()
+        done_at_start = self.sent + self.failed
+        
+        try:
+            while True:
+                chunk = await self.db.get_users_after(self.last_user_id, self.chunk_size)
+                if not chunk:
+                    break
+                
+                for _, telegram_id in chunk:
+                    queue.put_nowait(telegram_id)
+                await queue.join()
+                
+                # Курсор двигается только после отправки всей пачки: при перезапуске
+                # пачка, которая была в работе, отправляется заново
+                self.last_user_id = chunk[-1][0]
+                self._last_sent_to.clear()
+                await self.db.save_broadcast_progress(
+                    self.broadcast.id, self.last_user_id, self.sent, self.failed
+                )
+                await self._report(started_at, done_at_start)
+            
+            await self.db.save_broadcast_progress(
+                self.broadcast.id, self.last_user_id, self.sent, self.failed, status='done'
+            )
+            await self._report(started_at, done_at_start, finished=True)
+        except Exception as e:
+            # running заблокировал бы новые рассылки до перезапуска - помечаем рассылку failed
+            logger.error(f"Рассылка #{self.broadcast.id} прервана: {e}")
+            await self._fail(e)
+        finally:
+            for worker in workers:
+                worker.cancel()
+            await asyncio.gather(*workers, return_exceptions=True)
+    
+    async def _fail(self, error: Exception):
+        """Статус failed с сохраненным курсором и сообщение администратору"""
+        try:
+            await self.db.save_broadcast_progress(
+                self.broadcast.id, self.last_user_id, self.sent, self.failed, status='failed'
+            )
+        except Exception as e:
+            # БД недоступна - статус остается running, рассылка продолжится после перезапуска
+            logger.error(f"Не удалось сохранить статус рассылки #{self.broadcast.id}: {e}")
+            return
+        
+        try:
+            await self.bot.send_message(
+                self.broadcast.admin_chat_id,
+                f"❌ Рассылка #{self.broadcast.id} остановлена из-за ошибки: {error}\n\n"
+                f"📨 Доставлено: {self.sent}\n"
+                f"⚠️ Не доставлено: {self.failed}"
+            )
+        except TelegramAPIError as e:
+            logger.warning(f"Не удалось сообщить об ошибке рассылки: {e}")
+    
+    async def _worker(self, queue: asyncio.Queue):
+        while True:
+            chat_id = await queue.get()
+            try:
+                if await self._send(chat_id):
+                    self.sent += 1
+                else:
+                    self.failed += 1
+            except Exception as e:
+                logger.error(f"Ошибка рассылки пользователю {chat_id}: {e}")
+                self.failed += 1
+            finally:
+                queue.task_done()
+    
+    async def _send(self, chat_id: int) -> bool:
+        """Отправка одному пользователю с учетом RetryAfter; False - пользователь недоступен"""
+        for _ in range(MAX_SEND_ATTEMPTS):
+            wait = self._last_sent_to.get(chat_id, 0.0) + PER_CHAT_INTERVAL - time.monotonic()
+            if wait > 0:
+                await asyncio.sleep(wait)
+            await self.bucket.acquire()
+            self._last_sent_to[chat_id] = time.monotonic()
+            
+            try:
+                await self.bot.send_message(chat_id, self.broadcast.text)
+                return True
+            except TelegramRetryAfter as e:
+                logger.warning(f"Рассылка: RetryAfter {e.retry_after} сек")
+                self.bucket.pause(e.retry_after)
+            except (TelegramForbiddenError, TelegramBadRequest):
+                # Бот заблокирован или чат удален - повторять бессмысленно
+                return False
+            except (TelegramNetworkError, TelegramAPIError) as e:
+                logger.warning(f"Рассылка: ошибка отправки пользователю {chat_id}: {e}")
+                await asyncio.sleep(NETWORK_RETRY_DELAY)
+        return False
+    
+    async def _report(self, started_at: float, done_at_start: int, finished: bool = False):
+        """Сообщение администратору о прогрессе: отправлено, скорость и оставшееся время"""
+        now = time.monotonic()
+        if not finished and now - self._last_report < PROGRESS_INTERVAL:
+            return
+        self._last_report = now
+        
+        done = self.sent + self.failed
+        elapsed = now - started_at
+        rate = (done - done_at_start) / elapsed if elapsed > 0 else 0.0
+        total = max(self.broadcast.total, done)
+        if finished:
+            text = (
+                f"✅ Рассылка #{self.broadcast.id} завершена!\n\n"
+                f"📨 Доставлено: {self.sent}\n"
+                f"⚠️ Не доставлено: {self.failed}\n"
+                f"⚡ Скорость: {rate:.1f} сообщ/сек"
+            )
+        else:
+            eta = (total - done) / rate if rate > 0 else 0
+            text = (
+                f"⏳ Рассылка #{self.broadcast.id}: {done} из {total}\n\n"
+                f"📨 Доставлено: {self.sent}\n"
+                f"⚠️ Не доставлено: {self.failed}\n"
+                f"⚡ Скорость: {rate:.1f} сообщ/сек\n"
+                f"🕒 Осталось: ~{int(eta // 60)} мин {int(eta % 60)} сек"
+            )
+        
+        # Сообщения администратору тоже идут через общий лимит
+        await self.bucket.acquire()
+        try:
+            if self._status_message_id is None:
+                message = await self.bot.send_message(self.broadcast.admin_chat_id, text)
+                self._status_message_id = message.message_id
+            else:
+                await self.bot.edit_message_text(
+                    text, chat_id=self.broadcast.admin_chat_id, message_id=self._status_message_id
+                )
+        except TelegramAPIError as e:
+            logger.warning(f"Не удалось обновить прогресс рассылки: {e}")
+
+# Запущенные рассылки - для остановки при завершении бота
+_running: Set[asyncio.Task] = set()
+
+def start_broadcast(bot: Bot, db: DatabaseManager, broadcast: Broadcast) -> asyncio.Task:
+    """Запуск рассылки в фоне"""
+    task = asyncio.create_task(BroadcastEngine(bot, db, broadcast).run())
+    _running.add(task)
+    task.add_done_callback(_running.discard)
+    return task
+
+async def resume_broadcast(bot: Bot, db: DatabaseManager) -> Optional[asyncio.Task]:
+    """Продолжение прерванной рассылки после перезапуска бота"""
+    broadcast = await db.get_active_broadcast()
+    if broadcast is None:
+        return None
+    logger.info(f"Продолжение рассылки #{broadcast.id} с пользователя {broadcast.last_user_id}")
+    return start_broadcast(bot, db, broadcast)
+
+async def stop_broadcasts():
+    """Остановка рассылок; курсор остается на последней сохраненной пачке"""
+    tasks = list(_running)
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
\ No newline at end of file
@@ -23,6 +23,74 @@ class Config:
     # URL базы данных
     DATABASE_URL = os.getenv('DATABASE_URL', 'sqlite+aiosqlite:///bot_database.db')
     
+    # Пул соединений (один движок на весь процесс)
+    DB_POOL_SIZE = int(os.getenv('DB_POOL_SIZE', '5'))
+    DB_MAX_OVERFLOW = int(os.getenv('DB_MAX_OVERFLOW', '5'))
+    DB_POOL_TIMEOUT = float(os.getenv('DB_POOL_TIMEOUT', '30'))  # Ожидание свободного соединения, сек
+    DB_CONNECT_TIMEOUT = float(os.getenv('DB_CONNECT_TIMEOUT', '15'))  # Ожидание блокировки SQLite, сек
+    
+    # Профиль производительности SQLite (применяется к каждому новому соединению)
+    SQLITE_JOURNAL_MODE = os.getenv('SQLITE_JOURNAL_MODE', 'WAL')
+    SQLITE_SYNCHRONOUS = os.getenv('SQLITE_SYNCHRONOUS', 'NORMAL')
+    SQLITE_CACHE_SIZE = int(os.getenv('SQLITE_CACHE_SIZE', '-65536'))  # <0 - в КиБ, >0 - в страницах
+    SQLITE_MMAP_SIZE = int(os.getenv('SQLITE_MMAP_SIZE', str(256 * 1024 * 1024)))
+    SQLITE_TEMP_STORE = os.getenv('SQLITE_TEMP_STORE', 'MEMORY')
+    SQLITE_BUSY_TIMEOUT = int(os.getenv('SQLITE_BUSY_TIMEOUT', str(int(DB_CONNECT_TIMEOUT * 1000))))  # мс
+    SQLITE_WAL_CHECKPOINT_INTERVAL = int(os.getenv('SQLITE_WAL_CHECKPOINT_INTERVAL', '300'))  # сек, 0 - выключено
+    
+    # Сверка счетчиков книг по жанрам с таблицей books
+    GENRE_COUNTS_RECONCILE_INTERVAL = int(os.getenv('GENRE_COUNTS_RECONCILE_INTERVAL', '3600'))  # сек, 0 - выключено
+    
+    # Кэш статистики для админ панели
+    CATALOG_STATS_TTL = float(os.getenv('CATALOG_STATS_TTL', '30'))  # сек, 0 - без кэша
+    
+    # Кэш карточек книг (get_book_by_id)
+    BOOK_CACHE_SIZE = int(os.getenv('BOOK_CACHE_SIZE', '2048'))  # записей
+    BOOK_CACHE_TTL = float(os.getenv('BOOK_CACHE_TTL', '600'))  # сек
+    BOOK_CACHE_MAX_BYTES = int(os.getenv('BOOK_CACHE_MAX_BYTES', str(16 * 1024 * 1024)))
+    
+    # Уже зарегистрированные пользователи: повторный /start не идет в БД
+    USER_SEEN_CACHE_SIZE = int(os.getenv('USER_SEEN_CACHE_SIZE', '100000'))  # записей
+    USER_SEEN_CACHE_TTL = float(os.getenv('USER_SEEN_CACHE_TTL', '86400'))  # сек
+    
+    # telegram_id -> users.id для запросов избранного (включая неизвестных пользователей)
+    USER_ID_CACHE_SIZE = int(os.getenv('USER_ID_CACHE_SIZE', '100000'))  # записей
+    USER_ID_CACHE_TTL = float(os.getenv('USER_ID_CACHE_TTL', '3600'))  # сек
+    
+    # Рекомендации по совместному избранному (фоновый пересчет соседей книг)
+    RECOMMENDER_TOP_K = int(os.getenv('RECOMMENDER_TOP_K', '20'))  # соседей на книгу
+    RECOMMENDER_REFRESH_INTERVAL = int(os.getenv('RECOMMENDER_REFRESH_INTERVAL', '600'))  # сек, 0 - выключено
+    RECOMMENDER_BATCH_SIZE = int(os.getenv('RECOMMENDER_BATCH_SIZE', '5000'))  # строк избранного за одно чтение курсора
+    
+    # Кэш рекомендаций на пользователя (сбрасывается при изменении избранного и каталога)
+    RECOMMENDATION_CACHE_SIZE = int(os.getenv('RECOMMENDATION_CACHE_SIZE', '10000'))  # записей
+    RECOMMENDATION_CACHE_TTL = float(os.getenv('RECOMMENDATION_CACHE_TTL', '900'))  # сек
+    
+    # Множества ID избранных книг по пользователям (отметки ❤️ в списках без запросов к БД)
+    FAVORITE_SETS_CACHE_SIZE = int(os.getenv('FAVORITE_SETS_CACHE_SIZE', '20000'))  # пользователей
+    FAVORITE_SETS_CACHE_MAX_BYTES = int(os.getenv('FAVORITE_SETS_CACHE_MAX_BYTES', str(32 * 1024 * 1024)))
+    
+    # Отложенная запись нажатий "в избранное": пачка пишется через столько секунд, 0 - сразу
+    FAVORITES_WRITE_DELAY = float(os.getenv('FAVORITES_WRITE_DELAY', '0.05'))
+    
+    # Жанры и поджанры каталога: из них строятся меню жанров и клавиатуры добавления книги,
+    # по ним же проверяется импорт. Название жанра без "_" (разделитель в callback_data)
+    GENRES = {
+        'Литература': ('Художественная', 'Классическая', 'Детектив', 'Роман', 'Фантастика', 'Драма'),
+        'Тех литература': ('Программирование', 'Инженерия', 'Наука', 'Архитектура', 'Экономика', 'Медицина'),
+    }
+    
+    # Импорт каталога: книг в одной транзакции
+    IMPORT_BATCH_SIZE = int(os.getenv('IMPORT_BATCH_SIZE', '500'))
+    
+    # Миграции схемы: строк в одной транзакции при заполнении новых колонок
+    MIGRATION_BATCH_SIZE = int(os.getenv('MIGRATION_BATCH_SIZE', '500'))
+    
+    # Рассылка: общий лимит ниже ~30 сообщений/сек Telegram, чтобы оставался запас для ответов бота
+    BROADCAST_RATE = float(os.getenv('BROADCAST_RATE', '25'))  # сообщений в секунду
+    BROADCAST_WORKERS = int(os.getenv('BROADCAST_WORKERS', '8'))
+    BROADCAST_CHUNK_SIZE = int(os.getenv('BROADCAST_CHUNK_SIZE', '200'))  # пользователей между сохранениями прогресса
+    
     @classmethod
     def validate(cls):
         """Валидация конфигурации"""
@@ -0,0 +1,84 @@
+# database/cache.py - In-process кэши для DatabaseManager
+import sys
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, Optional
+
+def approx_size(value: Any) -> int:
+    """Примерный размер значения в байтах (кортеж/NamedTuple и его поля)"""
+    size = sys.getsizeof(value)
+    if isinstance(value, tuple):
+        size += sum(sys.getsizeof(item) for item in value)
+    return size
+
+class LRUCache:
+    """LRU-кэш с TTL, лимитом записей и примерного объема памяти, со счетчиками попаданий"""
+    
+    def __init__(self, maxsize: int = 1024, ttl: Optional[float] = None,
+                 max_bytes: Optional[int] = None, sizeof: Callable[[Any], int] = approx_size):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.sizeof = sizeof
+        # key -> (истекает в, размер, значение); порядок - от давно использованных к недавним
+        self._data: 'OrderedDict[Hashable, tuple]' = OrderedDict()
+        self.current_bytes = 0
+        self.hits = 0
+        self.misses = 0
+    
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        """Значение из кэша или default; просроченная запись удаляется"""
+        entry = self._data.get(key)
+        if entry is None:
+            self.misses += 1
+            return default
+        
+        expires_at, _, value = entry
+        if expires_at is not None and expires_at <= time.monotonic():
+            self.pop(key)
+            self.misses += 1
+            return default
+        
+        self._data.move_to_end(key)
+        self.hits += 1
+        return value
+    
+    def set(self, key: Hashable, value: Any):
+        """Запись значения с вытеснением самых старых записей сверх лимитов"""
+        self.pop(key)
+        size = self.sizeof(value) if self.max_bytes else 0
+        if self.max_bytes and size > self.max_bytes:
+            return
+        
+        expires_at = time.monotonic() + self.ttl if self.ttl else None
+        self._data[key] = (expires_at, size, value)
+        self.current_bytes += size
+        
+        while len(self._data) > self.maxsize or (self.max_bytes and self.current_bytes > self.max_bytes):
+            _, (_, evicted_size, _) = self._data.popitem(last=False)
+            self.current_bytes -= evicted_size
+    
+    def pop(self, key: Hashable):
+        """Удаление записи (инвалидация)"""
+        entry = self._data.pop(key, None)
+        if entry is not None:
+            self.current_bytes -= entry[1]
+    
+    def clear(self):
+        """Полная очистка"""
+        self._data.clear()
+        self.current_bytes = 0
+    
+    def __len__(self) -> int:
+        return len(self._data)
+    
+    def stats(self) -> Dict[str, Any]:
+        """Счетчики для мониторинга"""
+        total = self.hits + self.misses
+        return {
+            'size': len(self._data),
+            'bytes': self.current_bytes,
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / total if total else 0.0
+        }
\ No newline at end of file
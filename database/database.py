@@ -1,62 +1,317 @@
 # database/database.py - Исправленный менеджер базы данных
 from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncSession
-from sqlalchemy import select, func, and_, or_
-from typing import List, Dict, Any, Optional
+from sqlalchemy.orm import Session, aliased
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy import select, insert, update, delete, literal, func, and_, or_, tuple_, event, text, bindparam
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+from typing import List, Dict, Any, Optional, Set, Tuple, Callable, AsyncIterator, Iterable
+from array import array
+from bisect import bisect_left, insort
+from contextlib import asynccontextmanager
+from contextvars import ContextVar
+from concurrent.futures import ProcessPoolExecutor
+import asyncio
 import logging
+import multiprocessing
+import time
 
-from .models import Base, User, Book, FavoriteBook
+from .models import (
+    User, Book, FavoriteBook, GenreCount, UserGenreAffinity, BookNeighbor, Broadcast
+)
+from .cache import LRUCache
+from .write_behind import FavoriteWriteBuffer, pending_changes
+from .recommender import (
+    COFAVORITE_KIND, CONTENT_KIND, MAX_BASKET_SIZE, cofavorite_neighbors, rebuild_content_index, update_content_index
+)
+from .read_models import BookSummary, BookDetail, BookView, BOOK_SUMMARY_COLUMNS, BOOK_DETAIL_COLUMNS
+from .search import (
+    BOOKS_FTS_TABLE, BOOKS_FTS_REBUILD, BOOKS_FTS_OPTIMIZE, BOOKS_FTS_SEARCH,
+    PREFIX_UPPER_BOUND, build_fts_query, normalize_search_text
+)
+from .migrations import migrate
 from config import Config
 
 logger = logging.getLogger(__name__)
 
+# Настройки SQLite, которые выводятся в отчете при запуске
+SQLITE_REPORTED_PRAGMAS = (
+    'journal_mode', 'synchronous', 'cache_size', 'mmap_size',
+    'temp_store', 'busy_timeout', 'wal_autocheckpoint', 'foreign_keys'
+)
+
+# Поле книги -> его нормализованный ключ поиска
+SEARCH_KEY_FIELDS = {'title': 'title_norm', 'author': 'author_norm'}
+
+# Поля книги, от которых зависят соседи по тексту
+CONTENT_FIELDS = ('title', 'author', 'description')
+
+def _sqlite_pragmas() -> List[str]:
+    """PRAGMA-команды профиля производительности из конфигурации"""
+    return [
+        f"PRAGMA journal_mode={Config.SQLITE_JOURNAL_MODE}",
+        f"PRAGMA synchronous={Config.SQLITE_SYNCHRONOUS}",
+        f"PRAGMA cache_size={Config.SQLITE_CACHE_SIZE}",
+        f"PRAGMA mmap_size={Config.SQLITE_MMAP_SIZE}",
+        f"PRAGMA temp_store={Config.SQLITE_TEMP_STORE}",
+        f"PRAGMA busy_timeout={Config.SQLITE_BUSY_TIMEOUT}",
+        # Без этого SQLite игнорирует внешние ключи и ON DELETE CASCADE
+        "PRAGMA foreign_keys=ON",
+    ]
+
+def _apply_sqlite_pragmas(dbapi_connection, connection_record):
+    """Применение профиля SQLite к новому соединению пула"""
+    cursor = dbapi_connection.cursor()
+    try:
+        for pragma in _sqlite_pragmas():
+            cursor.execute(pragma)
+    finally:
+        cursor.close()
+
+class _Session(Session):
+    """Синхронная сессия с колбэками, которые выполняются только после успешного коммита"""
+
+@event.listens_for(_Session, 'after_commit')
+def _run_after_commit(session):
+    session.info.pop('after_rollback', None)
+    for callback in session.info.pop('after_commit', []):
+        callback()
+
+@event.listens_for(_Session, 'after_rollback')
+def _drop_after_commit(session):
+    session.info.pop('after_commit', None)
+    for callback in session.info.pop('after_rollback', []):
+        callback()
+
+def _after_commit(session: AsyncSession, callback: Callable[[], None]):
+    """Отложить обновление in-process состояния до коммита транзакции"""
+    session.sync_session.info.setdefault('after_commit', []).append(callback)
+
+def _after_rollback(session: AsyncSession, callback: Callable[[], None]):
+    """Вернуть in-process состояние, если транзакция откатится"""
+    session.sync_session.info.setdefault('after_rollback', []).append(callback)
+
+def _has_pending_writes(session: AsyncSession) -> bool:
+    """В транзакции есть незакоммиченные записи - прочитанное из нее нельзя класть в кэш"""
+    return bool(session.sync_session.info.get('after_commit'))
+
+# Отрицательная запись кэша users.id (в SQLite id начинаются с 1)
+UNKNOWN_USER = 0
+
 class DatabaseManager:
     """Менеджер для работы с базой данных"""
     
     def __init__(self, database_url: str = None):
         self.database_url = database_url or Config.DATABASE_URL
-        self.engine = create_async_engine(self.database_url, echo=False)
-        self.session_maker = async_sessionmaker(self.engine, expire_on_commit=False)
+        self.engine = create_async_engine(self.database_url, echo=False, **self._engine_options())
+        self.session_maker = async_sessionmaker(
+            self.engine, expire_on_commit=False, sync_session_class=_Session
+        )
+        self.is_sqlite = self.engine.dialect.name == 'sqlite'
+        self.fts_enabled = False
+        if self.is_sqlite:
+            event.listen(self.engine.sync_engine, 'connect', _apply_sqlite_pragmas)
+        # In-process копия таблицы genre_counts: (жанр, поджанр) -> число книг
+        self._genre_counts: Optional[Dict[Tuple[str, str], int]] = None
+        # Кэш карточек книг: book_id -> BookDetail
+        self._book_cache = LRUCache(
+            maxsize=Config.BOOK_CACHE_SIZE,
+            ttl=Config.BOOK_CACHE_TTL,
+            max_bytes=Config.BOOK_CACHE_MAX_BYTES
+        )
+        # Уже записанные в БД пользователи: telegram_id -> (users.id, username)
+        self._seen_users = LRUCache(maxsize=Config.USER_SEEN_CACHE_SIZE, ttl=Config.USER_SEEN_CACHE_TTL)
+        # telegram_id -> users.id; UNKNOWN_USER - пользователя нет в БД
+        self._user_ids = LRUCache(maxsize=Config.USER_ID_CACHE_SIZE, ttl=Config.USER_ID_CACHE_TTL)
+        # Рекомендации: users.id -> (версия каталога, limit, список книг)
+        self._recommendation_cache = LRUCache(
+            maxsize=Config.RECOMMENDATION_CACHE_SIZE, ttl=Config.RECOMMENDATION_CACHE_TTL
+        )
+        # Версия каталога растет при записи книг и пересчете соседей; старые рекомендации не отдаются
+        self._catalog_version = 0
+        # Избранное по пользователям: users.id -> отсортированный array('I') ID книг
+        self._favorite_ids = LRUCache(
+            maxsize=Config.FAVORITE_SETS_CACHE_SIZE, max_bytes=Config.FAVORITE_SETS_CACHE_MAX_BYTES
+        )
+        # Растет при каждом коммите изменений избранного; загрузка, пересекшаяся с ним, не кэшируется
+        self._favorites_epoch = 0
+        # Отложенная пакетная запись нажатий "в избранное"
+        self._favorites_buffer = FavoriteWriteBuffer(self._apply_favorite_changes, Config.FAVORITES_WRITE_DELAY)
+        # Избранное менялось после последнего расчета соседей по совместному избранному
+        self._cofavorites_dirty = True
+        # Соседи по тексту: полная перестройка индекса при запуске, затем только измененные книги
+        self._content_full_rebuild = True
+        self._content_dirty: set = set()
+        self._process_pool: Optional[ProcessPoolExecutor] = None
+        # Кэш статистики каталога: (время расчета, результат)
+        self._catalog_stats: Optional[Tuple[float, Dict[str, Any]]] = None
+        # Сессия текущего апдейта (unit of work), открывается middleware
+        self._current_session: ContextVar[Optional[AsyncSession]] = ContextVar(
+            f'db_session_{id(self)}', default=None
+        )
+    
+    def _engine_options(self) -> Dict[str, Any]:
+        """Параметры пула и таймаутов из конфигурации"""
+        options = {}
+        if self.database_url.startswith('sqlite'):
+            # timeout драйвера sqlite3 - сколько ждать снятия блокировки записи
+            options['connect_args'] = {'timeout': Config.DB_CONNECT_TIMEOUT}
+            if ':memory:' in self.database_url or self.database_url.endswith('://'):
+                # In-memory база живет в одном соединении (StaticPool), размер пула не задается
+                return options
+            # Для файла aiosqlite по умолчанию использует NullPool (новое соединение на каждую сессию)
+            options['poolclass'] = AsyncAdaptedQueuePool
+        options.update(
+            pool_size=Config.DB_POOL_SIZE,
+            max_overflow=Config.DB_MAX_OVERFLOW,
+            pool_timeout=Config.DB_POOL_TIMEOUT
+        )
+        return options
     
     # ИСПРАВЛЕНИЕ: Убираем async из get_session
     def get_session(self) -> AsyncSession:
         """Получение сессии базы данных"""
         return self.session_maker()
     
+    @asynccontextmanager
+    async def session_scope(self) -> AsyncIterator[AsyncSession]:
+        """Одна сессия и одна транзакция на весь апдейт, коммит в конце"""
+        current = self._current_session.get()
+        if current is not None:
+            # Вложенный scope использует уже открытую сессию
+            yield current
+            return
+        
+        async with self.session_maker() as session:
+            token = self._current_session.set(session)
+            try:
+                yield session
+                await session.commit()
+            except BaseException:
+                await session.rollback()
+                raise
+            finally:
+                self._current_session.reset(token)
+    
+    @asynccontextmanager
+    async def _session(self) -> AsyncIterator[AsyncSession]:
+        """Сессия апдейта, а вне апдейта - отдельная короткая сессия со своим коммитом"""
+        current = self._current_session.get()
+        if current is not None:
+            yield current
+            return
+        
+        async with self.session_maker() as session:
+            yield session
+            await session.commit()
+    
     async def init_db(self):
-        """Инициализация базы данных"""
-        async with self.engine.begin() as conn:
-            await conn.run_sync(Base.metadata.create_all)
+        """Инициализация базы данных: проверка версии схемы и применение недостающих миграций"""
+        await migrate(self)
+        if self.is_sqlite:
+            async with self.engine.connect() as conn:
+                self.fts_enabled = bool((await conn.execute(
+                    text("SELECT 1 FROM sqlite_master WHERE name = :name"),
+                    {'name': BOOKS_FTS_TABLE}
+                )).scalar())
+            if not self.fts_enabled:
+                logger.warning("FTS5 недоступен, используется поиск через LIKE")
         logger.info("База данных инициализирована")
     
+    async def close(self):
+        """Закрытие пула соединений"""
+        # Незаписанные нажатия "в избранное" сохраняются до закрытия пула
+        await self._favorites_buffer.close()
+        if self._process_pool is not None:
+            self._process_pool.shutdown(cancel_futures=True)
+        await self.engine.dispose()
+    
+    # =============== ОБСЛУЖИВАНИЕ SQLITE ===============
+    
+    async def get_sqlite_settings(self) -> Dict[str, Any]:
+        """Фактические значения PRAGMA на соединении из пула"""
+        if not self.is_sqlite:
+            return {}
+        
+        settings = {}
+        async with self.engine.connect() as conn:
+            for pragma in SQLITE_REPORTED_PRAGMAS:
+                result = await conn.execute(text(f"PRAGMA {pragma}"))
+                settings[pragma] = result.scalar()
+        return settings
+    
+    async def wal_checkpoint(self, mode: str = 'PASSIVE') -> Optional[Dict[str, int]]:
+        """Перенос WAL в основной файл базы (PASSIVE не блокирует читателей и писателей)"""
+        if not self.is_sqlite:
+            return None
+        
+        async with self.engine.connect() as conn:
+            result = await conn.execute(text(f"PRAGMA wal_checkpoint({mode})"))
+            busy, log_pages, checkpointed = result.one()
+        return {'busy': busy, 'log': log_pages, 'checkpointed': checkpointed}
+    
+    async def run_wal_checkpoints(self, interval: int = None):
+        """Фоновая задача периодического checkpoint, чтобы WAL не разрастался"""
+        interval = interval or Config.SQLITE_WAL_CHECKPOINT_INTERVAL
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                stats = await self.wal_checkpoint()
+                logger.debug(f"WAL checkpoint: {stats}")
+            except Exception as e:
+                logger.warning(f"Ошибка WAL checkpoint: {e}")
+    
     # =============== МЕТОДЫ ДЛЯ РАБОТЫ С ПОЛЬЗОВАТЕЛЯМИ ===============
     
-    async def add_user(self, telegram_id: int, username: str = None) -> User:
-        """Добавление или обновление пользователя"""
-        async with self.get_session() as session:
-            # Проверяем, существует ли пользователь
-            result = await session.execute(
-                select(User).where(User.telegram_id == telegram_id)
-            )
-            existing_user = result.scalar_one_or_none()
-            
-            if existing_user:
-                # Обновляем username если изменился
-                if existing_user.username != username:
-                    existing_user.username = username
-                    await session.commit()
-                return existing_user
-            
-            # Создаем нового пользователя
-            user = User(telegram_id=telegram_id, username=username)
-            session.add(user)
-            await session.commit()
-            await session.refresh(user)
-            logger.info(f"Добавлен новый пользователь: {telegram_id}")
-            return user
+    async def add_user(self, telegram_id: int, username: str = None) -> int:
+        """Добавление или обновление пользователя, возвращает users.id"""
+        seen = self._seen_users.get(telegram_id)
+        if seen is not None and seen[1] == username:
+            # Повторный /start известного пользователя без смены username - БД не нужна
+            return seen[0]
+        
+        async with self._session() as session:
+            # Один upsert: запись происходит только для нового пользователя или при смене username
+            stmt = sqlite_insert(User).values(telegram_id=telegram_id, username=username)
+            stmt = stmt.on_conflict_do_update(
+                index_elements=[User.telegram_id],
+                set_={'username': stmt.excluded.username},
+                where=User.username.is_distinct_from(stmt.excluded.username)
+            ).returning(User.id)
+            user_id = (await session.execute(stmt)).scalar_one_or_none()
+            
+            if user_id is not None:
+                logger.info(f"Пользователь {telegram_id} добавлен или обновлен")
+            else:
+                # Конфликт без изменений - RETURNING пуст, id берем по уникальному индексу
+                user_id = (await session.execute(
+                    select(User.id).where(User.telegram_id == telegram_id)
+                )).scalar_one()
+            
+            # Отрицательная запись больше не верна уже внутри этой транзакции
+            if self._user_ids.get(telegram_id) == UNKNOWN_USER:
+                self._user_ids.pop(telegram_id)
+            
+            def remember():
+                self._seen_users.set(telegram_id, (user_id, username))
+                self._user_ids.set(telegram_id, user_id)
+            
+            _after_commit(session, remember)
+            return user_id
+    
+    async def _resolve_user_id(self, session: AsyncSession, telegram_id: int) -> Optional[int]:
+        """users.id по telegram_id через кэш; None - пользователь не зарегистрирован"""
+        user_id = self._user_ids.get(telegram_id)
+        if user_id is None:
+            user_id = (await session.execute(
+                select(User.id).where(User.telegram_id == telegram_id)
+            )).scalar_one_or_none() or UNKNOWN_USER
+            if not _has_pending_writes(session):
+                self._user_ids.set(telegram_id, user_id)
+        return user_id or None
     
     async def get_user_by_telegram_id(self, telegram_id: int) -> Optional[User]:
         """Получение пользователя по Telegram ID"""
-        async with self.get_session() as session:
+        async with self._session() as session:
             result = await session.execute(
                 select(User).where(User.telegram_id == telegram_id)
             )
@@ -64,7 +319,7 @@ class DatabaseManager:
     
     async def get_all_users(self) -> List[Dict[str, Any]]:
         """Получение всех пользователей"""
-        async with self.get_session() as session:
+        async with self._session() as session:
             result = await session.execute(select(User))
             users = result.scalars().all()
             
@@ -77,13 +332,65 @@ class DatabaseManager:
                 for user in users
             ]
     
+    async def stream_users(self, batch_size: int = 1000) -> AsyncIterator[Dict[str, Any]]:
+        """Все пользователи по одному через серверный курсор (пачками по batch_size)"""
+        async with self.session_maker() as session:
+            result = await session.stream(
+                select(User.id, User.telegram_id, User.username)
+                .order_by(User.id)
+                .execution_options(yield_per=batch_size)
+            )
+            async for row in result.mappings():
+                yield dict(row)
+    
+    async def get_users_after(self, after_id: int, limit: int) -> List[Tuple[int, int]]:
+        """Следующая пачка (users.id, telegram_id) по первичному ключу - keyset-пагинация"""
+        async with self.session_maker() as session:
+            result = await session.execute(
+                select(User.id, User.telegram_id)
+                .where(User.id > after_id)
+                .order_by(User.id)
+                .limit(limit)
+            )
+            return [tuple(row) for row in result]
+    
+    # =============== МЕТОДЫ ДЛЯ РАБОТЫ С РАССЫЛКАМИ ===============
+    
+    async def create_broadcast(self, text: str, admin_chat_id: int) -> Broadcast:
+        """Новая рассылка; сохраняется сразу, чтобы ее можно было продолжить после перезапуска"""
+        async with self.session_maker() as session:
+            total = (await session.execute(select(func.count(User.id)))).scalar_one()
+            broadcast = Broadcast(text=text, admin_chat_id=admin_chat_id, total=total)
+            session.add(broadcast)
+            await session.commit()
+            return broadcast
+    
+    async def get_active_broadcast(self) -> Optional[Broadcast]:
+        """Незавершенная рассылка, если есть"""
+        async with self.session_maker() as session:
+            result = await session.execute(
+                select(Broadcast).where(Broadcast.status == 'running').order_by(Broadcast.id).limit(1)
+            )
+            return result.scalar_one_or_none()
+    
+    async def save_broadcast_progress(self, broadcast_id: int, last_user_id: int, sent: int, failed: int,
+                                      status: str = 'running'):
+        """Сохранение курсора и счетчиков рассылки отдельной транзакцией"""
+        async with self.session_maker() as session:
+            await session.execute(
+                update(Broadcast)
+                .where(Broadcast.id == broadcast_id)
+                .values(last_user_id=last_user_id, sent=sent, failed=failed, status=status)
+            )
+            await session.commit()
+    
     # =============== МЕТОДЫ ДЛЯ РАБОТЫ С КНИГАМИ ===============
     
     async def add_book(self, title: str, author: str, year: int, description: str, 
                   genre: str, subgenre: str = None, file_id: str = None, 
                   file_name: str = None, file_size: int = None, file_type: str = None) -> int:
 
-        async with self.get_session() as session:
+        async with self._session() as session:
             book = Book(
                 title=title,
                 author=author,
@@ -94,330 +401,987 @@ class DatabaseManager:
                 file_id=file_id,
                 file_name=file_name,
                 file_size=file_size,
-                file_type=file_type
+                file_type=file_type,
+                title_norm=normalize_search_text(title),
+                author_norm=normalize_search_text(author)
             )
             session.add(book)
-            await session.commit()
-            await session.refresh(book)
+            await session.flush()
+            await self._bump_genre_count(session, genre, subgenre, 1)
+            self._mark_content_dirty(session, book.id)
+            _after_commit(session, self._bump_catalog_version)
             logger.info(f"Добавлена книга: {title} - {author}" + 
                     (f" с файлом {file_name}" if file_id else ""))
             return book.id
 
-    async def get_book_by_id(self, book_id: int) -> Optional[Dict[str, Any]]:
-        """Получение книги по ID с информацией о файле"""
-        async with self.get_session() as session:
+    async def add_books_batch(self, records: List[Dict[str, Any]]) -> int:
+        """Пакетная вставка книг отдельной транзакцией; дубли по нормализованным (название, автор, год) пропускаются"""
+        rows: Dict[Tuple[str, str, int], Dict[str, Any]] = {}
+        for record in records:
+            row = dict(
+                record,
+                description=record.get('description') or '',
+                title_norm=normalize_search_text(record['title']),
+                author_norm=normalize_search_text(record['author'])
+            )
+            rows.setdefault((row['title_norm'], row['author_norm'], row['year']), row)
+        if not rows:
+            return 0
+        
+        async with self.session_maker() as session:
+            # Дубли с уже загруженными книгами - один запрос по индексу title_norm на пачку
             result = await session.execute(
-                select(Book).where(Book.id == book_id)
+                select(Book.title_norm, Book.author_norm, Book.year)
+                .where(Book.title_norm.in_({key[0] for key in rows}))
             )
-            book = result.scalar_one_or_none()
+            for key in result.all():
+                rows.pop(tuple(key), None)
+            if not rows:
+                return 0
             
-            if book:
-                return {
-                    'id': book.id,
-                    'title': book.title,
-                    'author': book.author,
-                    'year': book.year,
-                    'description': book.description,
-                    'genre': book.genre,
-                    'subgenre': book.subgenre,
-                    'file_id': book.file_id,
-                    'file_name': book.file_name,
-                    'file_size': book.file_size,
-                    'file_type': book.file_type
-                }
-            return None
+            # executemany одним INSERT; FTS-индекс заполняют триггеры
+            await session.execute(insert(Book), list(rows.values()))
+            genre_deltas: Dict[Tuple[str, Optional[str]], int] = {}
+            for row in rows.values():
+                key = (row['genre'], row.get('subgenre'))
+                genre_deltas[key] = genre_deltas.get(key, 0) + 1
+            for (genre, subgenre), delta in genre_deltas.items():
+                await self._bump_genre_count(session, genre, subgenre, delta)
+            
+            _after_commit(session, self._bump_catalog_version)
+            # Для пачки дешевле пересчитать соседей по тексту целиком, чем по одной книге
+            _after_commit(session, self._request_content_rebuild)
+            await session.commit()
+        
+        return len(rows)
+    
+    async def get_book_by_id(self, book_id: int) -> Optional[BookDetail]:
+        """Получение книги по ID с информацией о файле (через кэш)"""
+        book = self._book_cache.get(book_id)
+        if book is not None:
+            return book
+        
+        async with self._session() as session:
+            result = await session.execute(
+                select(*BOOK_DETAIL_COLUMNS).where(Book.id == book_id)
+            )
+            row = result.one_or_none()
+            if row is None:
+                return None
+            
+            book = BookDetail._make(row)
+            if not _has_pending_writes(session):
+                self._book_cache.set(book_id, book)
+            return book
+    
+    async def get_book_view(self, telegram_id: int, book_id: int) -> Optional[BookView]:
+        """Карточка книги, отметка избранного пользователя и число добавлений в избранное одним запросом"""
+        user_id = select(User.id).where(User.telegram_id == telegram_id).scalar_subquery()
+        is_favorite = select(FavoriteBook.id).where(
+            FavoriteBook.user_id == user_id,
+            FavoriteBook.book_id == Book.id
+        ).exists()
+        favorite_count = select(func.count(FavoriteBook.id)).where(
+            FavoriteBook.book_id == Book.id
+        ).scalar_subquery()
+        
+        async with self._session() as session:
+            result = await session.execute(
+                select(*BOOK_DETAIL_COLUMNS, is_favorite, favorite_count).where(Book.id == book_id)
+            )
+            row = result.one_or_none()
+            if row is None:
+                return None
+        
+        *columns, stored, count = row
+        view = BookView(BookDetail._make(columns), bool(stored), count)
+        
+        # Отложенное нажатие еще не в БД - поправляем отметку и счетчик
+        pending_user_id = self._user_ids.get(telegram_id)
+        pending = self._favorites_buffer.get(pending_user_id, book_id) if pending_user_id else None
+        if pending is not None and pending != view.is_favorite:
+            view = view._replace(is_favorite=pending, favorite_count=count + (1 if pending else -1))
+        return view
+    
+    def _invalidate_book(self, session: AsyncSession, book_id: int):
+        """Сброс книги из кэша сейчас и повторно после коммита"""
+        self._book_cache.pop(book_id)
+        _after_commit(session, lambda: self._book_cache.pop(book_id))
+        _after_commit(session, self._bump_catalog_version)
+    
+    def _bump_catalog_version(self):
+        self._catalog_version += 1
+    
+    async def stream_books(self, batch_size: int = 1000) -> AsyncIterator[BookDetail]:
+        """Все книги по одной через серверный курсор (пачками по batch_size)"""
+        async with self.session_maker() as session:
+            result = await session.stream(
+                select(*BOOK_DETAIL_COLUMNS)
+                .order_by(Book.id)
+                .execution_options(yield_per=batch_size)
+            )
+            async for row in result:
+                yield BookDetail._make(row)
     
-    async def get_all_books(self, limit: int = None, offset: int = 0) -> List[Dict[str, Any]]:
+    async def get_all_books(self, limit: int = None, offset: int = 0) -> List[BookSummary]:
         """Получение всех книг"""
-        async with self.get_session() as session:
-            query = select(Book).offset(offset).order_by(Book.id.desc())
+        async with self._session() as session:
+            query = select(*BOOK_SUMMARY_COLUMNS).offset(offset).order_by(Book.id.desc())
             if limit:
                 query = query.limit(limit)
             
             result = await session.execute(query)
-            books = result.scalars().all()
+            return [BookSummary._make(row) for row in result]
+    
+    async def get_books_by_genre(self, genre: str, limit: int = 5, after: Tuple[int, int] = None,
+                                 before: Tuple[int, int] = None) -> List[BookSummary]:
+        """Страница книг жанра по курсору (year, id): after - следующая, before - предыдущая"""
+        async with self._session() as session:
+            query = select(*BOOK_SUMMARY_COLUMNS).where(Book.genre == genre)
+            position = tuple_(Book.year, Book.id)
             
-            return [
-                {
-                    'id': book.id,
-                    'title': book.title,
-                    'author': book.author,
-                    'year': book.year,
-                    'description': book.description,
-                    'genre': book.genre,
-                    'subgenre': book.subgenre
+            if before:
+                # Идем по индексу в обратную сторону и разворачиваем результат
+                query = query.where(position > tuple_(*before)).order_by(Book.year, Book.id)
+            else:
+                if after:
+                    query = query.where(position < tuple_(*after))
+                query = query.order_by(Book.year.desc(), Book.id.desc())
+            
+            result = await session.execute(query.limit(limit))
+            books = [BookSummary._make(row) for row in result]
+            if before:
+                books.reverse()
+            return books
+    
+    async def get_books_count_by_genre(self, genre: str) -> int:
+        """Подсчет книг по жанру из поддерживаемых счетчиков (без COUNT по books)"""
+        counts = await self.get_genre_counts()
+        return sum(count for (count_genre, _), count in counts.items() if count_genre == genre)
+    
+    # =============== СТАТИСТИКА ===============
+    
+    async def get_catalog_stats(self, ttl: float = None) -> Dict[str, Any]:
+        """Статистика каталога и пользователей агрегатными запросами, с кэшем на ttl секунд"""
+        ttl = Config.CATALOG_STATS_TTL if ttl is None else ttl
+        if self._catalog_stats and time.monotonic() - self._catalog_stats[0] < ttl:
+            return self._catalog_stats[1]
+        
+        async def fetch_all(query):
+            # Отдельная сессия на запрос, чтобы запросы шли параллельно на разных соединениях
+            async with self.session_maker() as session:
+                return (await session.execute(query)).all()
+        
+        subgenre = func.coalesce(Book.subgenre, '')
+        books_rows, users_rows, favorites_rows = await asyncio.gather(
+            fetch_all(
+                select(Book.genre, subgenre, func.count(Book.id), func.count(Book.file_id),
+                       func.coalesce(func.sum(Book.file_size), 0))
+                .group_by(Book.genre, subgenre)
+            ),
+            fetch_all(select(func.count(User.id))),
+            fetch_all(select(func.count(FavoriteBook.id), func.count(func.distinct(FavoriteBook.user_id))))
+        )
+        
+        stats = {
+            'total_books': 0,
+            'books_with_files': 0,
+            'total_file_size': 0,
+            'genres': {},
+            'subgenres': {},
+            'total_users': users_rows[0][0],
+            'total_favorites': favorites_rows[0][0],
+            'users_with_favorites': favorites_rows[0][1]
+        }
+        for genre, book_subgenre, count, with_files, file_size in books_rows:
+            stats['total_books'] += count
+            stats['books_with_files'] += with_files
+            stats['total_file_size'] += file_size
+            stats['genres'][genre] = stats['genres'].get(genre, 0) + count
+            if book_subgenre:
+                stats['subgenres'][(genre, book_subgenre)] = count
+        
+        self._catalog_stats = (time.monotonic(), stats)
+        return stats
+    
+    def get_cache_stats(self) -> Dict[str, Dict[str, Any]]:
+        """Счетчики попаданий in-process кэшей"""
+        return {
+            'books': self._book_cache.stats(),
+            'users': self._seen_users.stats(),
+            'user_ids': self._user_ids.stats(),
+            'recommendations': self._recommendation_cache.stats(),
+            'favorite_sets': self._favorite_ids.stats()
+        }
+    
+    # =============== СЧЕТЧИКИ КНИГ ПО ЖАНРАМ ===============
+    
+    async def get_genre_counts(self) -> Dict[Tuple[str, str], int]:
+        """Счетчики (жанр, поджанр) -> число книг; поджанр '' - книги без поджанра"""
+        if self._genre_counts is None:
+            async with self.session_maker() as session:
+                result = await session.execute(
+                    select(GenreCount.genre, GenreCount.subgenre, GenreCount.book_count)
+                )
+                self._genre_counts = {
+                    (genre, subgenre): count for genre, subgenre, count in result.all()
                 }
-                for book in books
-            ]
+        return self._genre_counts
+    
+    async def _bump_genre_count(self, session: AsyncSession, genre: str, subgenre: Optional[str], delta: int):
+        """Изменение счетчика в той же транзакции, что и запись книги"""
+        key = (genre, subgenre or '')
+        stmt = sqlite_insert(GenreCount).values(genre=key[0], subgenre=key[1], book_count=delta)
+        await session.execute(stmt.on_conflict_do_update(
+            index_elements=[GenreCount.genre, GenreCount.subgenre],
+            set_={'book_count': GenreCount.book_count + stmt.excluded.book_count}
+        ))
+        
+        def apply():
+            if self._genre_counts is not None:
+                self._genre_counts[key] = self._genre_counts.get(key, 0) + delta
+        
+        _after_commit(session, apply)
     
-    async def get_books_by_genre(self, genre: str, limit: int = 5, offset: int = 0) -> List[Dict[str, Any]]:
-        """Получение книг по жанру"""
-        async with self.get_session() as session:
+    async def reconcile_genre_counts(self) -> int:
+        """Пересчет счетчиков по таблице books; возвращает число исправленных записей"""
+        async with self.session_maker() as session:
             result = await session.execute(
-                select(Book)
-                .where(Book.genre == genre)
-                .offset(offset)
-                .limit(limit)
-                .order_by(Book.year.desc())
+                select(Book.genre, func.coalesce(Book.subgenre, ''), func.count(Book.id))
+                .group_by(Book.genre, func.coalesce(Book.subgenre, ''))
             )
-            books = result.scalars().all()
+            actual = {(genre, subgenre): count for genre, subgenre, count in result.all()}
             
-            return [
-                {
-                    'id': book.id,
-                    'title': book.title,
-                    'author': book.author,
-                    'year': book.year,
-                    'description': book.description,
-                    'genre': book.genre,
-                    'subgenre': book.subgenre
-                }
-                for book in books
-            ]
+            result = await session.execute(
+                select(GenreCount.genre, GenreCount.subgenre, GenreCount.book_count)
+            )
+            stored = {(genre, subgenre): count for genre, subgenre, count in result.all()}
+            
+            drift = {key for key in actual.keys() | stored.keys() if actual.get(key, 0) != stored.get(key, 0)}
+            if drift:
+                await session.execute(GenreCount.__table__.delete())
+                if actual:
+                    await session.execute(
+                        GenreCount.__table__.insert(),
+                        [
+                            {'genre': genre, 'subgenre': subgenre, 'book_count': count}
+                            for (genre, subgenre), count in actual.items()
+                        ]
+                    )
+                await session.commit()
+                logger.warning(f"Исправлены счетчики жанров: {sorted(drift)}")
+        
+        if drift or self._genre_counts is None:
+            self._genre_counts = actual
+        return len(drift)
     
-    async def get_books_count_by_genre(self, genre: str) -> int:
-        """Подсчет книг по жанру"""
-        async with self.get_session() as session:
+    async def reconcile_genre_affinity(self) -> int:
+        """Пересчет профилей вкуса по избранному; возвращает число исправленных записей"""
+        async with self.session_maker() as session:
+            subgenre = func.coalesce(Book.subgenre, '')
             result = await session.execute(
-                select(func.count(Book.id)).where(Book.genre == genre)
+                select(FavoriteBook.user_id, Book.genre, subgenre, func.count(FavoriteBook.id))
+                .join(Book, Book.id == FavoriteBook.book_id)
+                .group_by(FavoriteBook.user_id, Book.genre, subgenre)
             )
-            return result.scalar()
+            actual = {(user_id, genre, sub): count for user_id, genre, sub, count in result.all()}
+            
+            result = await session.execute(
+                select(UserGenreAffinity.user_id, UserGenreAffinity.genre,
+                       UserGenreAffinity.subgenre, UserGenreAffinity.weight)
+            )
+            stored = {(user_id, genre, sub): weight for user_id, genre, sub, weight in result.all()}
+            
+            drift = {key for key in actual.keys() | stored.keys() if actual.get(key) != stored.get(key)}
+            if drift:
+                await session.execute(UserGenreAffinity.__table__.delete())
+                if actual:
+                    await session.execute(
+                        UserGenreAffinity.__table__.insert(),
+                        [
+                            {'user_id': user_id, 'genre': genre, 'subgenre': sub, 'weight': weight}
+                            for (user_id, genre, sub), weight in actual.items()
+                        ]
+                    )
+                await session.commit()
+                self._bump_catalog_version()
+                logger.info(f"Исправлены профили вкуса: {len(drift)} записей")
+        return len(drift)
+    
+    async def run_genre_counts_reconcile(self, interval: int = None):
+        """Фоновая задача периодической сверки счетчиков жанров и профилей вкуса"""
+        interval = interval or Config.GENRE_COUNTS_RECONCILE_INTERVAL
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await self.reconcile_genre_counts()
+                await self.reconcile_genre_affinity()
+            except Exception as e:
+                logger.warning(f"Ошибка сверки счетчиков жанров: {e}")
     
-    async def search_books_by_title(self, query: str) -> List[Dict[str, Any]]:
-        """Поиск книг по названию и автору"""
-        async with self.get_session() as session:
+    async def search_books_by_title(self, query: str, limit: int = 10, offset: int = 0) -> List[BookSummary]:
+        """Поиск книг: сначала совпадения по началу названия/автора, затем полнотекстовые по bm25"""
+        key = normalize_search_text(query)
+        if not key:
+            return []
+        
+        async with self._session() as session:
+            # Префиксный поиск диапазоном по нормализованным ключам использует B-tree индексы
             result = await session.execute(
-                select(Book)
+                select(*BOOK_SUMMARY_COLUMNS)
                 .where(or_(
-                    Book.title.ilike(f'%{query}%'),
-                    Book.author.ilike(f'%{query}%')
+                    and_(Book.title_norm >= key, Book.title_norm < key + PREFIX_UPPER_BOUND),
+                    and_(Book.author_norm >= key, Book.author_norm < key + PREFIX_UPPER_BOUND)
                 ))
-                .order_by(Book.year.desc())
-                .limit(20)
+                .order_by(Book.title_norm, Book.id)
+                .limit(offset + limit)
             )
-            books = result.scalars().all()
+            prefix_books = [BookSummary._make(row) for row in result]
             
-            return [
-                {
-                    'id': book.id,
-                    'title': book.title,
-                    'author': book.author,
-                    'year': book.year,
-                    'description': book.description,
-                    'genre': book.genre,
-                    'subgenre': book.subgenre
-                }
-                for book in books
-            ]
+            if len(prefix_books) >= offset + limit:
+                return prefix_books[offset:offset + limit]
+            
+            # Остаток страницы добираем из полнотекстовой выдачи
+            rest_offset = max(0, offset - len(prefix_books))
+            rest_limit = offset + limit - len(prefix_books) - rest_offset
+            exclude_ids = [book.id for book in prefix_books]
+            
+            if self.fts_enabled:
+                result = await session.execute(
+                    text(BOOKS_FTS_SEARCH).bindparams(bindparam('exclude_ids', expanding=True)),
+                    {
+                        'match': build_fts_query(query),
+                        'exclude_ids': exclude_ids,
+                        'limit': rest_limit,
+                        'offset': rest_offset
+                    }
+                )
+            else:
+                result = await session.execute(
+                    select(*BOOK_SUMMARY_COLUMNS)
+                    .where(and_(
+                        or_(Book.title_norm.contains(key), Book.author_norm.contains(key)),
+                        ~Book.id.in_(exclude_ids)
+                    ))
+                    .order_by(Book.year.desc(), Book.id.desc())
+                    .offset(rest_offset)
+                    .limit(rest_limit)
+                )
+            
+            return prefix_books[offset:] + [BookSummary._make(row) for row in result]
+    
+    async def backfill_search_keys(self, batch_size: int = 500) -> int:
+        """Заполнение нормализованных ключей поиска небольшими пачками, каждая в своей транзакции"""
+        total = 0
+        while True:
+            async with self.session_maker() as session:
+                result = await session.execute(
+                    select(Book.id, Book.title, Book.author)
+                    .where(or_(Book.title_norm.is_(None), Book.author_norm.is_(None)))
+                    .limit(batch_size)
+                )
+                rows = result.all()
+                if not rows:
+                    break
+                
+                await session.execute(
+                    update(Book),
+                    [
+                        {
+                            'id': book_id,
+                            'title_norm': normalize_search_text(title),
+                            'author_norm': normalize_search_text(author)
+                        }
+                        for book_id, title, author in rows
+                    ]
+                )
+                await session.commit()
+            
+            total += len(rows)
+            # Отдаем управление циклу событий между пачками
+            await asyncio.sleep(0)
+        
+        if total:
+            logger.info(f"Заполнены ключи поиска для {total} книг")
+        return total
+    
+    async def rebuild_search_index(self) -> bool:
+        """Полная перестройка FTS-индекса из таблицы books"""
+        if not self.fts_enabled:
+            return False
+        
+        async with self._session() as session:
+            await session.execute(text(BOOKS_FTS_REBUILD))
+            await session.execute(text(BOOKS_FTS_OPTIMIZE))
+        logger.info("Полнотекстовый индекс книг перестроен")
+        return True
     
     async def update_book_field(self, book_id: int, field: str, value: Any) -> bool:
         """Обновление поля книги"""
-        async with self.get_session() as session:
+        async with self._session() as session:
             result = await session.execute(
                 select(Book).where(Book.id == book_id)
             )
             book = result.scalar_one_or_none()
             
             if book:
+                old_genre = (book.genre, book.subgenre)
                 setattr(book, field, value)
-                await session.commit()
+                if (book.genre, book.subgenre) != old_genre:
+                    await self._bump_genre_count(session, *old_genre, -1)
+                    await self._bump_genre_count(session, book.genre, book.subgenre, 1)
+                    # Книга переехала в другой жанр и у всех, кто добавил ее в избранное
+                    await self._bump_genre_affinity(session, -1, book_id, genre=old_genre[0], subgenre=old_genre[1])
+                    await self._bump_genre_affinity(session, 1, book_id, genre=book.genre, subgenre=book.subgenre)
+                if field in SEARCH_KEY_FIELDS:
+                    setattr(book, SEARCH_KEY_FIELDS[field], normalize_search_text(value))
+                if field in CONTENT_FIELDS:
+                    self._mark_content_dirty(session, book_id)
+                await session.flush()
+                self._invalidate_book(session, book_id)
                 logger.info(f"Обновлено поле {field} книги ID {book_id}")
                 return True
             return False
     
     async def delete_book(self, book_id: int) -> bool:
         """Удаление книги"""
-        async with self.get_session() as session:
+        if await self.delete_books([book_id]):
+            logger.info(f"Удалена книга ID {book_id}")
+            return True
+        return False
+    
+    async def delete_books(self, book_ids: List[int]) -> int:
+        """Удаление книг по первичному ключу без загрузки строк; избранное удаляет каскад в БД"""
+        if not book_ids:
+            return 0
+        
+        async with self._session() as session:
+            # Профили вкуса: вычитаем удаляемые книги у всех, кто их добавил, пока избранное на месте
+            subgenre = func.coalesce(Book.subgenre, '')
+            source = (
+                select(FavoriteBook.user_id, Book.genre, subgenre, -func.count(FavoriteBook.id))
+                .join(Book, Book.id == FavoriteBook.book_id)
+                .where(FavoriteBook.book_id.in_(book_ids))
+                .group_by(FavoriteBook.user_id, Book.genre, subgenre)
+            )
+            stmt = sqlite_insert(UserGenreAffinity).from_select(['user_id', 'genre', 'subgenre', 'weight'], source)
+            await session.execute(stmt.on_conflict_do_update(
+                index_elements=[UserGenreAffinity.user_id, UserGenreAffinity.genre, UserGenreAffinity.subgenre],
+                set_={'weight': UserGenreAffinity.weight + stmt.excluded.weight}
+            ))
+            await session.execute(delete(UserGenreAffinity).where(UserGenreAffinity.weight <= 0))
+            
             result = await session.execute(
-                select(Book).where(Book.id == book_id)
+                delete(Book)
+                .where(Book.id.in_(book_ids))
+                .returning(Book.id, Book.genre, Book.subgenre)
+                .execution_options(synchronize_session=False)
             )
-            book = result.scalar_one_or_none()
+            deleted = result.all()
+            if not deleted:
+                return 0
             
-            if book:
-                await session.delete(book)
-                await session.commit()
-                logger.info(f"Удалена книга ID {book_id}")
-                return True
-            return False
+            deleted_ids = [book_id for book_id, _, _ in deleted]
+            await session.execute(delete(BookNeighbor).where(
+                or_(BookNeighbor.book_id.in_(deleted_ids), BookNeighbor.neighbor_id.in_(deleted_ids))
+            ))
+            
+            genre_deltas: Dict[Tuple[str, Optional[str]], int] = {}
+            for book_id, genre, subgenre in deleted:
+                genre_deltas[(genre, subgenre)] = genre_deltas.get((genre, subgenre), 0) - 1
+                self._invalidate_book(session, book_id)
+                # Удаленная книга уходит из индекса похожих книг при следующем пересчете
+                self._mark_content_dirty(session, book_id)
+            for (genre, subgenre), delta in genre_deltas.items():
+                await self._bump_genre_count(session, genre, subgenre, delta)
+            
+            # Книги ушли из избранного сразу у многих пользователей
+            _after_commit(session, self._drop_favorite_sets)
+            return len(deleted)
+    
+    def _drop_favorite_sets(self):
+        """Сброс всех множеств избранного; загрузка, начатая до сброса, не попадет в кэш"""
+        self._favorites_epoch += 1
+        self._cofavorites_dirty = True
+        self._favorite_ids.clear()
     
     # =============== МЕТОДЫ ДЛЯ РАБОТЫ С ИЗБРАННЫМ ===============
     
     async def add_to_favorites(self, telegram_id: int, book_id: int) -> bool:
         """Добавление книги в избранное"""
-        async with self.get_session() as session:
-            # Получаем пользователя
-            user_result = await session.execute(
-                select(User).where(User.telegram_id == telegram_id)
-            )
-            user = user_result.scalar_one_or_none()
-            
-            if not user:
+        async with self._session() as session:
+            user_id = await self._resolve_user_id(session, telegram_id)
+            if user_id is None:
                 return False
+            self._favorites_buffer.discard(user_id, book_id)
             
-            # Проверяем, нет ли уже в избранном
-            existing_result = await session.execute(
-                select(FavoriteBook).where(
-                    and_(FavoriteBook.user_id == user.id, FavoriteBook.book_id == book_id)
-                )
-            )
-            existing = existing_result.scalar_one_or_none()
-            
-            if existing:
-                return False  # Уже в избранном
-            
-            # Добавляем в избранное
-            favorite = FavoriteBook(user_id=user.id, book_id=book_id)
-            session.add(favorite)
-            await session.commit()
-            logger.info(f"Пользователь {telegram_id} добавил книгу {book_id} в избранное")
-            return True
+            added = await self._insert_favorite(session, user_id, book_id)
+            if added:
+                logger.info(f"Пользователь {telegram_id} добавил книгу {book_id} в избранное")
+            return added
     
     async def remove_from_favorites(self, telegram_id: int, book_id: int) -> bool:
         """Удаление книги из избранного"""
-        async with self.get_session() as session:
-            # Получаем пользователя
-            user_result = await session.execute(
-                select(User).where(User.telegram_id == telegram_id)
-            )
-            user = user_result.scalar_one_or_none()
-            
-            if not user:
+        async with self._session() as session:
+            user_id = await self._resolve_user_id(session, telegram_id)
+            if user_id is None:
                 return False
+            self._favorites_buffer.discard(user_id, book_id)
             
-            # Находим запись в избранном
-            favorite_result = await session.execute(
-                select(FavoriteBook).where(
-                    and_(FavoriteBook.user_id == user.id, FavoriteBook.book_id == book_id)
-                )
-            )
-            favorite = favorite_result.scalar_one_or_none()
+            removed = await self._delete_favorite(session, user_id, book_id)
+            if removed:
+                logger.info(f"Пользователь {telegram_id} удалил книгу {book_id} из избранного")
+            return removed
+    
+    async def toggle_favorite(self, telegram_id: int, book_id: int) -> Optional[bool]:
+        """Переключение избранного; возвращает новое состояние или None, если пользователь/книга не найдены"""
+        async with self._session() as session:
+            user_id = await self._resolve_user_id(session, telegram_id)
+            if user_id is None:
+                return None
+            pending = self._favorites_buffer.get(user_id, book_id)
+            self._favorites_buffer.discard(user_id, book_id)
+            if pending is not None:
+                # Нажатие поверх отложенного: итог - состояние, обратное отложенному
+                if pending:
+                    await self._delete_favorite(session, user_id, book_id)
+                    return False
+                return True if await self._insert_favorite(session, user_id, book_id) or \
+                    await self._is_favorite(session, user_id, book_id) else None
             
-            if favorite:
-                await session.delete(favorite)
-                await session.commit()
+            # Удаление срабатывает, если книга была в избранном - тогда это единственный запрос
+            if await self._delete_favorite(session, user_id, book_id):
                 logger.info(f"Пользователь {telegram_id} удалил книгу {book_id} из избранного")
+                return False
+            if await self._insert_favorite(session, user_id, book_id):
+                logger.info(f"Пользователь {telegram_id} добавил книгу {book_id} в избранное")
                 return True
+            return None
+    
+    async def toggle_favorite_deferred(self, telegram_id: int, book_id: int) -> Optional[bool]:
+        """Оптимистичное переключение: новое состояние сразу, запись в БД - пачкой через FAVORITES_WRITE_DELAY"""
+        if self._favorites_buffer.delay <= 0:
+            return await self.toggle_favorite(telegram_id, book_id)
+        
+        async with self._session() as session:
+            user_id = await self._resolve_user_id(session, telegram_id)
+            if user_id is None:
+                return None
+            
+            current = self._favorites_buffer.get(user_id, book_id)
+            stored = current
+            if current is None:
+                current = stored = await self._is_favorite(session, user_id, book_id)
+        
+        self._favorites_buffer.put(user_id, book_id, not current, stored)
+        return not current
+    
+    async def _apply_favorite_changes(self, changes: Dict[Tuple[int, int], bool]):
+        """Запись пачки из буфера в отдельной транзакции (фоновая задача, вне апдейтов)"""
+        async with self.session_maker() as session:
+            await self._write_favorite_changes(session, changes)
+            await session.commit()
+        logger.info(f"Записано изменений избранного: {len(changes)}")
+    
+    async def _write_favorite_changes(self, session: AsyncSession, changes: Dict[Tuple[int, int], bool]):
+        for (user_id, book_id), is_favorite in changes.items():
+            if is_favorite:
+                await self._insert_favorite(session, user_id, book_id)
+            else:
+                await self._delete_favorite(session, user_id, book_id)
+    
+    async def _flush_pending_favorites(self, telegram_id: int):
+        """Запись отложенных изменений пользователя до чтения его списков из БД.
+        Пишутся в транзакции апдейта: второе соединение-писатель ждало бы блокировку, которую держит она же"""
+        user_id = self._user_ids.get(telegram_id)
+        if not user_id:
+            return
+        pending = self._favorites_buffer.take_user(user_id)
+        changes = pending_changes(pending)
+        if not changes:
+            self._favorites_buffer.written_back(pending)
+            return
+        
+        async with self._session() as session:
+            # До коммита нажатия видны через буфер; при откате возвращаются в него и запишутся фоновой пачкой
+            _after_commit(session, lambda: self._favorites_buffer.written_back(pending))
+            _after_rollback(session, lambda: self._favorites_buffer.restore(pending))
+            try:
+                await self._write_favorite_changes(session, changes)
+            except BaseException:
+                self._favorites_buffer.restore(pending)
+                raise
+        self._favorites_buffer.written += len(changes)
+    
+    async def _insert_favorite(self, session: AsyncSession, user_id: int, book_id: int) -> bool:
+        """INSERT ... SELECT ... ON CONFLICT DO NOTHING RETURNING: True, если запись добавлена"""
+        stmt = sqlite_insert(FavoriteBook).from_select(
+            ['user_id', 'book_id'],
+            select(literal(user_id), literal(book_id))
+            .where(select(Book.id).where(Book.id == book_id).exists())
+        ).on_conflict_do_nothing(
+            index_elements=[FavoriteBook.user_id, FavoriteBook.book_id]
+        ).returning(FavoriteBook.id)
+        result = await session.execute(stmt)
+        if result.first() is None:
             return False
+        await self._bump_genre_affinity(session, 1, book_id, user_id=user_id)
+        self._favorites_changed(session, user_id, book_id, True)
+        return True
+    
+    async def _delete_favorite(self, session: AsyncSession, user_id: int, book_id: int) -> bool:
+        """DELETE ... RETURNING: True, если запись была и удалена"""
+        stmt = delete(FavoriteBook).where(
+            FavoriteBook.user_id == user_id,
+            FavoriteBook.book_id == book_id
+        ).returning(FavoriteBook.id).execution_options(synchronize_session=False)
+        result = await session.execute(stmt)
+        if result.first() is None:
+            return False
+        await self._bump_genre_affinity(session, -1, book_id, user_id=user_id)
+        self._favorites_changed(session, user_id, book_id, False)
+        return True
+    
+    async def _bump_genre_affinity(self, session: AsyncSession, delta: int, book_id: int, user_id: int = None,
+                                   genre: str = None, subgenre: Optional[str] = None):
+        """Изменение профиля вкуса: одного пользователя по текущему жанру книги
+        или всех, у кого книга в избранном, по указанному жанру"""
+        if user_id is not None:
+            source = select(
+                literal(user_id), Book.genre, func.coalesce(Book.subgenre, ''), literal(delta)
+            ).where(Book.id == book_id)
+        else:
+            source = select(
+                FavoriteBook.user_id, literal(genre), literal(subgenre or ''), literal(delta)
+            ).where(FavoriteBook.book_id == book_id)
+        
+        stmt = sqlite_insert(UserGenreAffinity).from_select(['user_id', 'genre', 'subgenre', 'weight'], source)
+        await session.execute(stmt.on_conflict_do_update(
+            index_elements=[UserGenreAffinity.user_id, UserGenreAffinity.genre, UserGenreAffinity.subgenre],
+            set_={'weight': UserGenreAffinity.weight + stmt.excluded.weight}
+        ))
+        
+        if delta < 0:
+            # Обнулившиеся веса удаляем сразу, чтобы таблица не росла
+            stale = delete(UserGenreAffinity).where(UserGenreAffinity.weight <= 0)
+            if user_id is not None:
+                stale = stale.where(UserGenreAffinity.user_id == user_id)
+            else:
+                stale = stale.where(UserGenreAffinity.genre == genre, UserGenreAffinity.subgenre == (subgenre or ''))
+            await session.execute(stale)
+    
+    def _favorites_changed(self, session: AsyncSession, user_id: int, book_id: int, is_favorite: bool):
+        """Сброс рекомендаций пользователя, правка его множества избранного после коммита, пометка для пересчета соседей"""
+        self._recommendation_cache.pop(user_id)
+        
+        def apply():
+            self._favorites_epoch += 1
+            self._recommendation_cache.pop(user_id)
+            self._cofavorites_dirty = True
+            ids = self._favorite_ids.get(user_id)
+            if ids is not None:
+                index = bisect_left(ids, book_id)
+                present = index < len(ids) and ids[index] == book_id
+                if is_favorite and not present:
+                    insort(ids, book_id)
+                elif not is_favorite and present:
+                    del ids[index]
+                else:
+                    return
+                # Размер массива изменился - повторная запись пересчитывает объем кэша и лимит
+                self._favorite_ids.set(user_id, ids)
+        
+        _after_commit(session, apply)
     
     async def is_book_in_favorites(self, telegram_id: int, book_id: int) -> bool:
         """Проверка, находится ли книга в избранном"""
-        async with self.get_session() as session:
-            # Получаем пользователя
-            user_result = await session.execute(
-                select(User).where(User.telegram_id == telegram_id)
-            )
-            user = user_result.scalar_one_or_none()
-            
-            if not user:
+        async with self._session() as session:
+            user_id = await self._resolve_user_id(session, telegram_id)
+            if user_id is None:
                 return False
             
-            # Проверяем наличие в избранном
+            # Отложенное нажатие новее, чем состояние в БД
+            pending = self._favorites_buffer.get(user_id, book_id)
+            if pending is not None:
+                return pending
+            return await self._is_favorite(session, user_id, book_id)
+    
+    async def favorite_book_ids(self, telegram_id: int, book_ids: Iterable[int]) -> Set[int]:
+        """Какие из book_ids в избранном у пользователя - для отметок на целой странице списка"""
+        async with self._session() as session:
+            user_id = await self._resolve_user_id(session, telegram_id)
+            if user_id is None:
+                return set()
+            
+            favorites = set()
+            for book_id in book_ids:
+                is_favorite = self._favorites_buffer.get(user_id, book_id)
+                if is_favorite is None:
+                    is_favorite = await self._is_favorite(session, user_id, book_id)
+                if is_favorite:
+                    favorites.add(book_id)
+            return favorites
+    
+    async def _is_favorite(self, session: AsyncSession, user_id: int, book_id: int) -> bool:
+        """Проверка наличия в избранном по множеству пользователя в памяти"""
+        if _has_pending_writes(session):
+            # Незакоммиченные изменения транзакции в множество еще не попали
             result = await session.execute(
-                select(FavoriteBook).where(
-                    and_(FavoriteBook.user_id == user.id, FavoriteBook.book_id == book_id)
+                select(FavoriteBook.id).where(
+                    and_(FavoriteBook.user_id == user_id, FavoriteBook.book_id == book_id)
                 )
             )
-            return result.scalar_one_or_none() is not None
+            return result.first() is not None
+        
+        ids = await self._load_favorite_ids(session, user_id)
+        index = bisect_left(ids, book_id)
+        return index < len(ids) and ids[index] == book_id
     
-    async def get_user_favorite_books(self, telegram_id: int) -> List[Dict[str, Any]]:
-        """Получение избранных книг пользователя"""
-        async with self.get_session() as session:
-            # Получаем пользователя
-            user_result = await session.execute(
-                select(User).where(User.telegram_id == telegram_id)
+    async def _load_favorite_ids(self, session: AsyncSession, user_id: int) -> array:
+        """Отсортированные ID избранных книг пользователя из кэша или одним запросом по индексу"""
+        ids = self._favorite_ids.get(user_id)
+        if ids is None:
+            epoch = self._favorites_epoch
+            result = await session.execute(
+                select(FavoriteBook.book_id)
+                .where(FavoriteBook.user_id == user_id)
+                .order_by(FavoriteBook.book_id)
             )
-            user = user_result.scalar_one_or_none()
-            
-            if not user:
+            ids = array('I', result.scalars())
+            if epoch == self._favorites_epoch:
+                self._favorite_ids.set(user_id, ids)
+        return ids
+    
+    async def get_user_favorite_books(self, telegram_id: int) -> List[BookSummary]:
+        """Получение избранных книг пользователя"""
+        # Списки читаются из БД - сначала дописываем отложенные нажатия пользователя
+        await self._flush_pending_favorites(telegram_id)
+        async with self._session() as session:
+            user_id = await self._resolve_user_id(session, telegram_id)
+            if user_id is None:
                 return []
             
             # Получаем избранные книги
             result = await session.execute(
-                select(Book)
+                select(*BOOK_SUMMARY_COLUMNS)
                 .join(FavoriteBook, Book.id == FavoriteBook.book_id)
-                .where(FavoriteBook.user_id == user.id)
+                .where(FavoriteBook.user_id == user_id)
                 .order_by(Book.title)
             )
-            books = result.scalars().all()
-            
-            return [
-                {
-                    'id': book.id,
-                    'title': book.title,
-                    'author': book.author,
-                    'year': book.year,
-                    'description': book.description,
-                    'genre': book.genre,
-                    'subgenre': book.subgenre
-                }
-                for book in books
-            ]
+            return [BookSummary._make(row) for row in result]
     
-    async def get_recommendations_for_user(self, telegram_id: int) -> List[Dict[str, Any]]:
-        """Получение рекомендаций на основе жанров любимых книг"""
-        async with self.get_session() as session:
-            # Получаем пользователя
-            user_result = await session.execute(
-                select(User).where(User.telegram_id == telegram_id)
-            )
-            user = user_result.scalar_one_or_none()
-            
-            if not user:
+    async def get_recommendations_for_user(self, telegram_id: int, limit: int = 5) -> List[BookSummary]:
+        """Рекомендации: соседи любимых книг по совместному избранному, добор по профилю вкуса"""
+        # Списки читаются из БД - сначала дописываем отложенные нажатия пользователя
+        await self._flush_pending_favorites(telegram_id)
+        async with self._session() as session:
+            user_id = await self._resolve_user_id(session, telegram_id)
+            if user_id is None:
                 return []
             
-            # Получаем жанры любимых книг
-            favorite_genres_result = await session.execute(
-                select(Book.genre, Book.subgenre)
-                .join(FavoriteBook, Book.id == FavoriteBook.book_id)
-                .where(FavoriteBook.user_id == user.id)
-                .distinct()
+            version = self._catalog_version
+            cached = self._recommendation_cache.get(user_id)
+            if cached is not None and cached[:2] == (version, limit):
+                return cached[2]
+            
+            # Один запрос: соседи всех любимых книг, оценки одного кандидата суммируются
+            favorite = aliased(FavoriteBook)
+            result = await session.execute(
+                select(*BOOK_SUMMARY_COLUMNS)
+                .select_from(BookNeighbor)
+                .join(FavoriteBook, and_(
+                    FavoriteBook.book_id == BookNeighbor.book_id,
+                    FavoriteBook.user_id == user_id
+                ))
+                .join(Book, Book.id == BookNeighbor.neighbor_id)
+                .where(BookNeighbor.kind == COFAVORITE_KIND)
+                .where(~select(favorite.id).where(
+                    favorite.user_id == user_id,
+                    favorite.book_id == BookNeighbor.neighbor_id
+                ).exists())
+                .group_by(Book.id)
+                .order_by(func.sum(BookNeighbor.score).desc(), Book.id)
+                .limit(limit)
             )
-            favorite_genres = favorite_genres_result.all()
+            books = [BookSummary._make(row) for row in result]
             
-            if not favorite_genres:
-                return []
+            # Холодный старт (нет соседей) - рекомендации по жанрам
+            if len(books) < limit:
+                books += await self._genre_recommendations(
+                    session, user_id, limit - len(books), [book.id for book in books]
+                )
             
-            # Получаем ID любимых книг чтобы исключить их из рекомендаций
-            favorite_books_result = await session.execute(
-                select(FavoriteBook.book_id).where(FavoriteBook.user_id == user.id)
+            if not _has_pending_writes(session):
+                self._recommendation_cache.set(user_id, (version, limit, books))
+            return books
+    
+    async def _genre_recommendations(self, session: AsyncSession, user_id: int, limit: int,
+                                     exclude_ids: List[int]) -> List[BookSummary]:
+        """Рекомендации по профилю вкуса: книги оцениваются суммой весов подходящих жанров"""
+        # Вес без поджанра подходит к любой книге жанра, с поджанром - только к книгам этого поджанра
+        score = func.sum(UserGenreAffinity.weight)
+        result = await session.execute(
+            select(*BOOK_SUMMARY_COLUMNS)
+            .join(UserGenreAffinity, and_(
+                UserGenreAffinity.user_id == user_id,
+                UserGenreAffinity.genre == Book.genre,
+                or_(UserGenreAffinity.subgenre == '', UserGenreAffinity.subgenre == func.coalesce(Book.subgenre, '')),
+                UserGenreAffinity.weight > 0
+            ))
+            # Анти-join вместо списка ID любимых книг
+            .where(~select(FavoriteBook.id).where(
+                FavoriteBook.user_id == user_id,
+                FavoriteBook.book_id == Book.id
+            ).exists())
+            .where(~Book.id.in_(exclude_ids))
+            .group_by(Book.id)
+            .order_by(score.desc(), Book.year.desc(), Book.id.desc())
+            .limit(limit)
+        )
+        return [BookSummary._make(row) for row in result]
+    
+    # =============== СОСЕДИ КНИГ ДЛЯ РЕКОМЕНДАЦИЙ ===============
+    
+    async def refresh_cofavorite_neighbors(self, top_k: int = None) -> int:
+        """Пересчет соседей по совместному избранному; возвращает число записанных пар"""
+        top_k = top_k or Config.RECOMMENDER_TOP_K
+        # Изменения избранного во время расчета снова поднимут флаг
+        self._cofavorites_dirty = False
+        
+        # Избранное читается курсором по уникальному индексу (user_id, book_id) и сразу
+        # складывается в компактные корзины пользователей, без списка всех строк таблицы
+        baskets: List[array] = []
+        last_user_id = None
+        async with self.session_maker() as session:
+            result = await session.stream(
+                select(FavoriteBook.user_id, FavoriteBook.book_id)
+                .order_by(FavoriteBook.user_id, FavoriteBook.book_id)
+                .execution_options(yield_per=Config.RECOMMENDER_BATCH_SIZE)
             )
-            favorite_book_ids = [row[0] for row in favorite_books_result.all()]
-            
-            # Строим условия для поиска рекомендаций
-            genre_conditions = []
-            for genre, subgenre in favorite_genres:
-                if subgenre:
-                    genre_conditions.append(
-                        and_(Book.genre == genre, Book.subgenre == subgenre)
-                    )
-                else:
-                    genre_conditions.append(Book.genre == genre)
-            
-            # Ищем книги похожих жанров, исключая уже любимые
-            if favorite_book_ids:
-                query = select(Book).where(
-                    and_(
-                        or_(*genre_conditions),
-                        ~Book.id.in_(favorite_book_ids)  # Исключаем любимые книги
-                    )
-                ).order_by(Book.year.desc()).limit(5)
-            else:
-                query = select(Book).where(
-                    or_(*genre_conditions)
-                ).order_by(Book.year.desc()).limit(5)
+            async for user_id, book_id in result:
+                if user_id != last_user_id:
+                    baskets.append(array('I'))
+                    last_user_id = user_id
+                if len(baskets[-1]) < MAX_BASKET_SIZE:
+                    baskets[-1].append(book_id)
+        
+        neighbors = await self._run_in_process(cofavorite_neighbors, baskets, top_k)
+        rows = [
+            {'book_id': book_id, 'kind': COFAVORITE_KIND, 'neighbor_id': neighbor_id, 'score': score}
+            for book_id, book_neighbors in neighbors.items()
+            for neighbor_id, score in book_neighbors
+        ]
+        
+        async with self.session_maker() as session:
+            await session.execute(delete(BookNeighbor).where(BookNeighbor.kind == COFAVORITE_KIND))
+            if rows:
+                await session.execute(BookNeighbor.__table__.insert(), rows)
+            await session.commit()
+        self._bump_catalog_version()
+        
+        logger.info(f"Соседи по избранному пересчитаны: {len(neighbors)} книг, {len(rows)} пар")
+        return len(rows)
+    
+    async def _run_in_process(self, func: Callable, *args) -> Any:
+        """Расчет соседей (совместное избранное, TF-IDF) в отдельном процессе: работа CPU-bound
+        и держит GIL, в потоке она все равно тормозила бы цикл событий. Индекс похожих книг
+        хранится в этом процессе между запусками"""
+        if self._process_pool is None:
+            # spawn: fork многопоточного процесса (цикл событий, потоки aiosqlite) может зависнуть
+            self._process_pool = ProcessPoolExecutor(
+                max_workers=1, mp_context=multiprocessing.get_context('spawn')
+            )
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._process_pool, func, *args)
+    
+    def _request_content_rebuild(self):
+        self._content_full_rebuild = True
+    
+    def _mark_content_dirty(self, session: AsyncSession, book_id: int):
+        """Текст книги изменился - пересчитать ее соседей после коммита"""
+        _after_commit(session, lambda: self._content_dirty.add(book_id))
+    
+    async def refresh_content_neighbors(self, book_ids: Optional[List[int]] = None, top_k: int = None) -> int:
+        """Пересчет соседей по тексту: всех книг или только book_ids; возвращает число записанных пар"""
+        top_k = top_k or Config.RECOMMENDER_TOP_K
+        columns = (Book.id, Book.title, Book.author, Book.description)
+        neighbors = None
+        if book_ids is not None:
+            # Инкрементально читаются и векторизуются только измененные книги
+            async with self.session_maker() as session:
+                result = await session.execute(select(*columns).where(Book.id.in_(book_ids)))
+                documents = [tuple(row) for row in result]
+            neighbors = await self._run_in_process(update_content_index, documents, book_ids, top_k)
+            if neighbors is None:
+                logger.info("Индекс похожих книг отсутствует или устарел, полная перестройка")
+                book_ids = None
+        
+        if neighbors is None:
+            async with self.session_maker() as session:
+                result = await session.execute(select(*columns))
+                documents = [tuple(row) for row in result]
+            neighbors = await self._run_in_process(rebuild_content_index, documents, top_k)
+        
+        rows = [
+            {'book_id': book_id, 'kind': CONTENT_KIND, 'neighbor_id': neighbor_id, 'score': score}
+            for book_id, book_neighbors in neighbors.items()
+            for neighbor_id, score in book_neighbors
+        ]
+        
+        async with self.session_maker() as session:
+            stale = delete(BookNeighbor).where(BookNeighbor.kind == CONTENT_KIND)
+            if book_ids is not None:
+                # Инкрементально: списки измененных книг и обратные ссылки на них;
+                # списки остальных книг могут ненадолго превышать top_k до полного пересчета
+                stale = stale.where(or_(
+                    BookNeighbor.book_id.in_(book_ids), BookNeighbor.neighbor_id.in_(book_ids)
+                ))
+                rows += [
+                    {'book_id': row['neighbor_id'], 'kind': CONTENT_KIND,
+                     'neighbor_id': row['book_id'], 'score': row['score']}
+                    for row in rows
+                    if row['neighbor_id'] not in neighbors
+                ]
+            await session.execute(stale)
+            if rows:
+                await session.execute(BookNeighbor.__table__.insert(), rows)
+            await session.commit()
+        
+        logger.info(f"Соседи по тексту пересчитаны: {len(neighbors)} книг, {len(rows)} пар")
+        return len(rows)
+    
+    async def get_similar_books(self, book_id: int, limit: int = 5) -> List[BookSummary]:
+        """Похожие книги из предрасчитанных соседей по тексту (одно чтение по первичному ключу)"""
+        async with self._session() as session:
+            result = await session.execute(
+                select(*BOOK_SUMMARY_COLUMNS)
+                .join(BookNeighbor, Book.id == BookNeighbor.neighbor_id)
+                .where(BookNeighbor.book_id == book_id, BookNeighbor.kind == CONTENT_KIND)
+                .order_by(BookNeighbor.score.desc())
+                .limit(limit)
+            )
+            return [BookSummary._make(row) for row in result]
+    
+    async def run_recommender_refresh(self, interval: int = None):
+        """Фоновая задача: пересчет соседей, если избранное или тексты книг изменились"""
+        interval = interval or Config.RECOMMENDER_REFRESH_INTERVAL
+        while True:
+            if self._cofavorites_dirty:
+                try:
+                    await self.refresh_cofavorite_neighbors()
+                except Exception as e:
+                    self._cofavorites_dirty = True
+                    logger.warning(f"Ошибка пересчета рекомендаций: {e}")
             
-            result = await session.execute(query)
-            books = result.scalars().all()
+            if self._content_full_rebuild or self._content_dirty:
+                book_ids = None if self._content_full_rebuild else sorted(self._content_dirty)
+                full_rebuild, dirty = self._content_full_rebuild, self._content_dirty
+                self._content_full_rebuild, self._content_dirty = False, set()
+                try:
+                    await self.refresh_content_neighbors(book_ids)
+                except Exception as e:
+                    self._content_full_rebuild = full_rebuild
+                    self._content_dirty |= dirty
+                    logger.warning(f"Ошибка пересчета похожих книг: {e}")
             
-            return [
-                {
-                    'id': book.id,
-                    'title': book.title,
-                    'author': book.author,
-                    'year': book.year,
-                    'description': book.description,
-                    'genre': book.genre,
-                    'subgenre': book.subgenre
-                }
-                for book in books
-            ]
\ No newline at end of file
+            await asyncio.sleep(interval)
\ No newline at end of file
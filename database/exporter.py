@@ -0,0 +1,47 @@
+# database/exporter.py - Потоковая выгрузка каталога и пользователей в CSV/JSONL
+import csv
+import gzip
+import json
+from typing import Any, AsyncIterator, Dict, Sequence, TextIO
+
+from .read_models import BookDetail
+
+EXPORT_FORMATS = ('csv', 'jsonl')
+
+# Что можно выгрузить: имя -> колонки файла
+EXPORT_FIELDS = {
+    'books': BookDetail._fields,
+    'users': ('id', 'telegram_id', 'username'),
+}
+
+def _as_dict(row: Any) -> Dict[str, Any]:
+    """Строка выгрузки как словарь: NamedTuple-модели чтения или dict"""
+    return row._asdict() if hasattr(row, '_asdict') else dict(row)
+
+async def write_csv(rows: AsyncIterator[Any], fields: Sequence[str], stream: TextIO) -> int:
+    """Запись строк в CSV по мере получения; возвращает число строк"""
+    writer = csv.DictWriter(stream, fieldnames=fields, extrasaction='ignore')
+    writer.writeheader()
+    count = 0
+    async for row in rows:
+        writer.writerow(_as_dict(row))
+        count += 1
+    return count
+
+async def write_jsonl(rows: AsyncIterator[Any], fields: Sequence[str], stream: TextIO) -> int:
+    """Запись строк в JSONL (одна строка - один объект); возвращает число строк"""
+    count = 0
+    async for row in rows:
+        data = _as_dict(row)
+        stream.write(json.dumps({field: data.get(field) for field in fields}, ensure_ascii=False))
+        stream.write('\n')
+        count += 1
+    return count
+
+async def export_rows(rows: AsyncIterator[Any], fields: Sequence[str], path: str,
+                      fmt: str = 'csv', compress: bool = False) -> int:
+    """Выгрузка в файл, при compress - в gzip; в памяти только текущая пачка курсора"""
+    writer = write_csv if fmt == 'csv' else write_jsonl
+    opener = gzip.open if compress else open
+    with opener(path, 'wt', encoding='utf-8', newline='') as stream:
+        return await writer(rows, fields, stream)
@@ -0,0 +1,86 @@
+# database/importer.py - Потоковый импорт каталога книг из CSV/JSONL
+import asyncio
+import csv
+import json
+from itertools import islice
+from typing import Any, Awaitable, Callable, Dict, Iterator, Optional, TextIO
+
+from config import Config
+from utils import validate_year, clean_text
+
+# Колонки CSV / ключи JSONL; обязательные - как при ручном добавлении через админ панель
+IMPORT_FIELDS = ('title', 'author', 'year', 'description', 'genre', 'subgenre')
+REQUIRED_FIELDS = ('title', 'author', 'year', 'genre')
+
+def detect_format(file_name: str) -> Optional[str]:
+    """Формат файла по расширению: 'csv', 'jsonl' или None"""
+    name = (file_name or '').lower()
+    if name.endswith('.csv'):
+        return 'csv'
+    if name.endswith(('.jsonl', '.ndjson')):
+        return 'jsonl'
+    return None
+
+def iter_raw_records(stream: TextIO, fmt: str) -> Iterator[Any]:
+    """Записи файла по одной, без чтения файла целиком; битая строка JSONL дает None"""
+    if fmt == 'csv':
+        yield from csv.DictReader(stream)
+        return
+    
+    for line in stream:
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            yield json.loads(line)
+        except json.JSONDecodeError:
+            yield None
+
+def validate_record(raw: Any) -> Optional[Dict[str, Any]]:
+    """Запись, приведенная к полям Book, или None, если она не проходит проверку"""
+    if not isinstance(raw, dict):
+        return None
+    
+    record = {field: str(raw.get(field) or '').strip() for field in IMPORT_FIELDS}
+    if any(not record[field] for field in REQUIRED_FIELDS):
+        return None
+    
+    is_valid, year = validate_year(record['year'])
+    if not is_valid:
+        return None
+    
+    record['year'] = year
+    for field in ('title', 'author', 'genre', 'subgenre'):
+        record[field] = clean_text(record[field])
+    record['subgenre'] = record['subgenre'] or None
+    
+    # Жанр и поджанр - только из Config.GENRES, по которому строятся меню жанров
+    subgenres = Config.GENRES.get(record['genre'])
+    if subgenres is None or (record['subgenre'] is not None and record['subgenre'] not in subgenres):
+        return None
+    return record
+
+async def import_books(db, stream: TextIO, fmt: str, batch_size: int = 500,
+                       progress: Callable[[Dict[str, int]], Awaitable[None]] = None) -> Dict[str, int]:
+    """Импорт пачками по batch_size: каждая пачка - одна транзакция, в памяти только текущая пачка"""
+    stats = {'read': 0, 'inserted': 0, 'duplicates': 0, 'invalid': 0}
+    records = iter_raw_records(stream, fmt)
+    
+    while True:
+        chunk = list(islice(records, batch_size))
+        if not chunk:
+            break
+        
+        valid = [record for record in map(validate_record, chunk) if record is not None]
+        inserted = await db.add_books_batch(valid)
+        
+        stats['read'] += len(chunk)
+        stats['invalid'] += len(chunk) - len(valid)
+        stats['inserted'] += inserted
+        stats['duplicates'] += len(valid) - inserted
+        if progress:
+            await progress(stats)
+        # Отдаем управление циклу событий между пачками
+        await asyncio.sleep(0)
+    
+    return stats
@@ -0,0 +1,186 @@
+# database/migrations.py - Версионированные миграции схемы
+import logging
+import time
+from typing import TYPE_CHECKING, Awaitable, Callable, List, NamedTuple, Optional
+
+from sqlalchemy import inspect, select, func, text
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.exc import OperationalError
+
+from .models import Base, FavoriteBook, SchemaVersion
+from .search import BOOKS_FTS_TABLE, BOOKS_FTS_DDL, BOOKS_FTS_DROP, BOOKS_FTS_REBUILD
+from config import Config
+
+if TYPE_CHECKING:
+    from .database import DatabaseManager
+
+logger = logging.getLogger(__name__)
+
+class Migration(NamedTuple):
+    """Шаг миграции; apply должен быть идемпотентным - шаг может выполниться повторно после сбоя"""
+    version: int
+    description: str
+    apply: Callable[['DatabaseManager'], Awaitable[None]]
+
+async def _table_columns(db: 'DatabaseManager', table: str) -> set:
+    """Колонки одной таблицы (без отражения всей схемы)"""
+    async with db.engine.connect() as conn:
+        return await conn.run_sync(lambda sync_conn: {
+            column['name'] for column in inspect(sync_conn).get_columns(table)
+        })
+
+async def _add_missing_columns(db: 'DatabaseManager', table: str, columns: List[tuple]):
+    """ALTER TABLE ADD COLUMN только для отсутствующих колонок"""
+    existing = await _table_columns(db, table)
+    async with db.engine.begin() as conn:
+        for name, ddl_type in columns:
+            if name not in existing:
+                await conn.execute(text(f"ALTER TABLE {table} ADD COLUMN {name} {ddl_type}"))
+
+# =============== ШАГИ МИГРАЦИЙ ===============
+
+async def _create_tables(db: 'DatabaseManager'):
+    """Недостающие таблицы; у существующих create_all ничего не меняет"""
+    async with db.engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+
+async def _add_book_file_columns(db: 'DatabaseManager'):
+    await _add_missing_columns(db, 'books', [
+        ('file_id', 'VARCHAR(255)'),
+        ('file_name', 'VARCHAR(255)'),
+        ('file_size', 'INTEGER'),
+        ('file_type', 'VARCHAR(50)'),
+    ])
+
+async def _add_search_key_columns(db: 'DatabaseManager'):
+    await _add_missing_columns(db, 'books', [
+        ('title_norm', 'VARCHAR(500)'),
+        ('author_norm', 'VARCHAR(255)'),
+    ])
+
+async def _dedupe_favorites(db: 'DatabaseManager'):
+    """Удаление дублей избранного перед уникальным индексом; остается самая ранняя запись пары"""
+    async with db.engine.begin() as conn:
+        result = await conn.execute(text(
+            "DELETE FROM favorite_books WHERE id NOT IN "
+            "(SELECT MIN(id) FROM favorite_books GROUP BY user_id, book_id)"
+        ))
+    if result.rowcount:
+        logger.info(f"Удалено дублей избранного: {result.rowcount}")
+
+async def _favorites_cascade(db: 'DatabaseManager'):
+    """Пересоздание favorite_books с ON DELETE CASCADE (SQLite не меняет внешние ключи ALTER-ом)"""
+    if not db.is_sqlite:
+        return
+    
+    async with db.engine.begin() as conn:
+        foreign_keys = (await conn.execute(text("PRAGMA foreign_key_list(favorite_books)"))).all()
+        # Колонка 6 - on_delete
+        if foreign_keys and all(fk[6] == 'CASCADE' for fk in foreign_keys):
+            return
+        
+        await conn.execute(text("ALTER TABLE favorite_books RENAME TO favorite_books_old"))
+        await conn.execute(text("DROP INDEX IF EXISTS uq_favorite_books_user_book"))
+        await conn.execute(text("DROP INDEX IF EXISTS ix_favorite_books_book_id"))
+        await conn.run_sync(FavoriteBook.__table__.create)
+        # Строки, ссылающиеся на удаленные книги или пользователей, не переносим
+        result = await conn.execute(text(
+            "INSERT OR IGNORE INTO favorite_books (id, user_id, book_id) "
+            "SELECT id, user_id, book_id FROM favorite_books_old "
+            "WHERE user_id IN (SELECT id FROM users) AND book_id IN (SELECT id FROM books)"
+        ))
+        await conn.execute(text("DROP TABLE favorite_books_old"))
+    logger.info(f"Избранное пересоздано с каскадным удалением: {result.rowcount} записей")
+
+async def _create_indexes(db: 'DatabaseManager'):
+    """Все индексы моделей, включая добавленные после создания таблиц"""
+    async with db.engine.begin() as conn:
+        for table in Base.metadata.sorted_tables:
+            for index in table.indexes:
+                await conn.run_sync(index.create, checkfirst=True)
+
+async def _backfill_search_keys(db: 'DatabaseManager'):
+    await db.backfill_search_keys(Config.MIGRATION_BATCH_SIZE)
+
+async def _create_fts(db: 'DatabaseManager'):
+    """FTS5-индекс книг по нормализованным колонкам; индекс старой версии пересоздается"""
+    if not db.is_sqlite:
+        return
+    
+    try:
+        async with db.engine.begin() as conn:
+            existing_sql = (await conn.execute(
+                text("SELECT sql FROM sqlite_master WHERE name = :name"),
+                {'name': BOOKS_FTS_TABLE}
+            )).scalar()
+            if existing_sql and 'title_norm' not in existing_sql:
+                for ddl in BOOKS_FTS_DROP:
+                    await conn.execute(text(ddl))
+                existing_sql = None
+            for ddl in BOOKS_FTS_DDL:
+                await conn.execute(text(ddl))
+            if not existing_sql:
+                await conn.execute(text(BOOKS_FTS_REBUILD))
+                logger.info("Создан полнотекстовый индекс книг")
+    except OperationalError as e:
+        # SQLite собран без FTS5 - поиск работает через LIKE, шаг считается выполненным
+        logger.warning(f"FTS5 недоступен, используется поиск через LIKE: {e}")
+
+async def _fill_genre_aggregates(db: 'DatabaseManager'):
+    """Счетчики книг по жанрам и профили вкуса по уже существующим данным"""
+    await db.reconcile_genre_counts()
+    await db.reconcile_genre_affinity()
+
+# Порядок важен: дубли удаляются до уникального индекса, ключи поиска заполняются до FTS
+MIGRATIONS: List[Migration] = [
+    Migration(1, "Создание таблиц", _create_tables),
+    Migration(2, "Колонки файлов книг", _add_book_file_columns),
+    Migration(3, "Колонки ключей поиска", _add_search_key_columns),
+    Migration(4, "Удаление дублей избранного", _dedupe_favorites),
+    Migration(5, "Каскадное удаление избранного", _favorites_cascade),
+    Migration(6, "Индексы", _create_indexes),
+    Migration(7, "Заполнение ключей поиска", _backfill_search_keys),
+    Migration(8, "Полнотекстовый индекс книг", _create_fts),
+    Migration(9, "Счетчики жанров и профили вкуса", _fill_genre_aggregates),
+]
+
+LATEST_VERSION = MIGRATIONS[-1].version
+
+# =============== ЗАПУСК ===============
+
+async def get_schema_version(db: 'DatabaseManager') -> int:
+    """Текущая версия схемы: один запрос к schema_version"""
+    async with db.engine.begin() as conn:
+        await conn.run_sync(SchemaVersion.__table__.create, checkfirst=True)
+        return (await conn.execute(select(func.max(SchemaVersion.version)))).scalar() or 0
+
+async def migrate(db: 'DatabaseManager', target: Optional[int] = None) -> List[Migration]:
+    """Применение недостающих миграций по порядку; версия записывается после каждого шага"""
+    if target is None:
+        target = LATEST_VERSION
+    if not 1 <= target <= LATEST_VERSION:
+        raise ValueError(f"Версия {target} вне диапазона миграций 1..{LATEST_VERSION}")
+    
+    current = await get_schema_version(db)
+    if current >= target:
+        return []
+    
+    applied = []
+    for migration in MIGRATIONS:
+        if migration.version <= current or migration.version > target:
+            continue
+        
+        logger.info(f"Миграция {migration.version}: {migration.description}")
+        await migration.apply(db)
+        # Параллельный процесс мог записать ту же версию - повтор не ошибка
+        async with db.engine.begin() as conn:
+            await conn.execute(
+                sqlite_insert(SchemaVersion)
+                .values(version=migration.version, description=migration.description, applied_at=time.time())
+                .on_conflict_do_nothing()
+            )
+        applied.append(migration)
+    
+    if applied:
+        logger.info(f"Схема обновлена до версии {applied[-1].version}")
+    return applied
\ No newline at end of file
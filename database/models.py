@@ -1,6 +1,6 @@
 # models.py - Модели базы данных
 from sqlalchemy.orm import DeclarativeBase, Mapped, mapped_column, relationship
-from sqlalchemy import String, Integer, Text, ForeignKey
+from sqlalchemy import String, Integer, Float, Text, ForeignKey, Index
 from typing import Optional
 
 class Base(DeclarativeBase):
@@ -16,7 +16,10 @@ class User(Base):
     username: Mapped[Optional[str]] = mapped_column(String(255))
     
     # Связь с избранными книгами
-    favorite_books = relationship("FavoriteBook", back_populates="user", cascade="all, delete-orphan")
+    # Строки избранного удаляет сама БД (ON DELETE CASCADE), ORM их не загружает
+    favorite_books = relationship(
+        "FavoriteBook", back_populates="user", cascade="all, delete-orphan", passive_deletes=True
+    )
     
     def __repr__(self):
         return f"<User(telegram_id={self.telegram_id}, username='{self.username}')>"
@@ -39,21 +42,100 @@ class Book(Base):
     file_size: Mapped[Optional[int]] = mapped_column(Integer)  # Размер файла в байтах
     file_type: Mapped[Optional[str]] = mapped_column(String(50))  # Тип файла (pdf, epub, txt)
     
-    favorite_by_users = relationship("FavoriteBook", back_populates="book", cascade="all, delete-orphan")
+    # Нормализованные ключи поиска (casefold, ё -> е, без пунктуации) - см. database/search.py
+    title_norm: Mapped[Optional[str]] = mapped_column(String(500), index=True)
+    author_norm: Mapped[Optional[str]] = mapped_column(String(255), index=True)
+    
+    favorite_by_users = relationship(
+        "FavoriteBook", back_populates="book", cascade="all, delete-orphan", passive_deletes=True
+    )
 
 
-    
+# Keyset-пагинация по жанру: WHERE genre = ? AND (year, id) < (?, ?) ORDER BY year DESC, id DESC
+books_genre_page_index = Index('ix_books_genre_year_id', Book.genre, Book.year.desc(), Book.id.desc())
+
 class FavoriteBook(Base):
     """Связь пользователя с избранными книгами"""
     __tablename__ = 'favorite_books'
     
     id: Mapped[int] = mapped_column(Integer, primary_key=True)
-    user_id: Mapped[int] = mapped_column(Integer, ForeignKey('users.id'), nullable=False)
-    book_id: Mapped[int] = mapped_column(Integer, ForeignKey('books.id'), nullable=False)
+    user_id: Mapped[int] = mapped_column(Integer, ForeignKey('users.id', ondelete='CASCADE'), nullable=False)
+    book_id: Mapped[int] = mapped_column(Integer, ForeignKey('books.id', ondelete='CASCADE'), nullable=False)
     
     # Связи
     user = relationship("User", back_populates="favorite_books")
     book = relationship("Book", back_populates="favorite_by_users")
     
+    # Одна книга в избранном пользователя - один раз (цель для INSERT ... ON CONFLICT)
+    __table_args__ = (
+        Index('uq_favorite_books_user_book', 'user_id', 'book_id', unique=True),
+    )
+    
+    def __repr__(self):
+        return f"<FavoriteBook(user_id={self.user_id}, book_id={self.book_id})>"
+
+# Число добавлений книги в избранное и каскадное удаление: WHERE book_id = ?
+favorite_books_book_index = Index('ix_favorite_books_book_id', FavoriteBook.book_id)
+
+class GenreCount(Base):
+    """Поддерживаемый счетчик книг по жанру и поджанру (поджанр '' - без поджанра)"""
+    __tablename__ = 'genre_counts'
+    
+    genre: Mapped[str] = mapped_column(String(100), primary_key=True)
+    subgenre: Mapped[str] = mapped_column(String(100), primary_key=True, default='')
+    book_count: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+    
+    def __repr__(self):
+        return f"<GenreCount(genre='{self.genre}', subgenre='{self.subgenre}', book_count={self.book_count})>"
+
+class UserGenreAffinity(Base):
+    """Профиль вкуса: число избранных книг пользователя по жанру и поджанру (поджанр '' - без поджанра)"""
+    __tablename__ = 'user_genre_affinity'
+    
+    user_id: Mapped[int] = mapped_column(Integer, primary_key=True)
+    genre: Mapped[str] = mapped_column(String(100), primary_key=True)
+    subgenre: Mapped[str] = mapped_column(String(100), primary_key=True, default='')
+    weight: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+    
+    def __repr__(self):
+        return f"<UserGenreAffinity(user_id={self.user_id}, genre='{self.genre}', subgenre='{self.subgenre}', weight={self.weight})>"
+
+class BookNeighbor(Base):
+    """Предрасчитанный сосед книги для рекомендаций (kind - способ расчета)"""
+    __tablename__ = 'book_neighbors'
+    
+    book_id: Mapped[int] = mapped_column(Integer, primary_key=True)
+    kind: Mapped[str] = mapped_column(String(20), primary_key=True)
+    neighbor_id: Mapped[int] = mapped_column(Integer, primary_key=True)
+    score: Mapped[float] = mapped_column(Float, nullable=False)
+    
+    def __repr__(self):
+        return f"<BookNeighbor(book_id={self.book_id}, kind='{self.kind}', neighbor_id={self.neighbor_id}, score={self.score:.3f})>"
+
+class Broadcast(Base):
+    """Рассылка всем пользователям; last_user_id - курсор по users.id для продолжения после перезапуска"""
+    __tablename__ = 'broadcasts'
+    
+    id: Mapped[int] = mapped_column(Integer, primary_key=True)
+    text: Mapped[str] = mapped_column(Text, nullable=False)
+    admin_chat_id: Mapped[int] = mapped_column(Integer, nullable=False)
+    # running - идет или продолжится после перезапуска, done - завершена, failed - остановлена ошибкой
+    status: Mapped[str] = mapped_column(String(20), nullable=False, default='running', index=True)
+    last_user_id: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+    total: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+    sent: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+    failed: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+    
+    def __repr__(self):
+        return f"<Broadcast(id={self.id}, status='{self.status}', sent={self.sent}/{self.total})>"
+
+class SchemaVersion(Base):
+    """Примененная миграция схемы (см. database/migrations.py)"""
+    __tablename__ = 'schema_version'
+    
+    version: Mapped[int] = mapped_column(Integer, primary_key=True)
+    description: Mapped[str] = mapped_column(String(255), nullable=False)
+    applied_at: Mapped[float] = mapped_column(Float, nullable=False)
+    
     def __repr__(self):
-        return f"<FavoriteBook(user_id={self.user_id}, book_id={self.book_id})>"
\ No newline at end of file
+        return f"<SchemaVersion(version={self.version}, description='{self.description}')>"
\ No newline at end of file
@@ -0,0 +1,41 @@
+# database/read_models.py - Легкие модели чтения книг (без ORM-объектов)
+from typing import NamedTuple, Optional
+
+from .models import Book
+
+class BookSummary(NamedTuple):
+    """Книга для списков: без описания и файла"""
+    id: int
+    title: str
+    author: str
+    year: int
+    genre: str
+    subgenre: Optional[str]
+
+class BookDetail(NamedTuple):
+    """Карточка книги: все поля, включая описание и файл"""
+    id: int
+    title: str
+    author: str
+    year: int
+    description: str
+    genre: str
+    subgenre: Optional[str]
+    file_id: Optional[str]
+    file_name: Optional[str]
+    file_size: Optional[int]
+    file_type: Optional[str]
+
+class BookView(NamedTuple):
+    """Карточка книги для пользователя: книга, отметка избранного и сколько раз ее добавили в избранное"""
+    book: BookDetail
+    is_favorite: bool
+    favorite_count: int
+
+# Колонки в порядке полей моделей: select(*BOOK_SUMMARY_COLUMNS) -> BookSummary._make(row)
+BOOK_SUMMARY_COLUMNS = (Book.id, Book.title, Book.author, Book.year, Book.genre, Book.subgenre)
+
+BOOK_DETAIL_COLUMNS = (
+    Book.id, Book.title, Book.author, Book.year, Book.description, Book.genre, Book.subgenre,
+    Book.file_id, Book.file_name, Book.file_size, Book.file_type
+)
\ No newline at end of file
@@ -0,0 +1,180 @@
+# database/recommender.py - Расчет соседей книг для рекомендаций (выполняется вне цикла событий)
+import heapq
+import math
+from collections import Counter, defaultdict
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+from .search import normalize_search_text
+
+# Виды соседства в таблице book_neighbors
+COFAVORITE_KIND = 'cofav'
+CONTENT_KIND = 'content'
+
+# Корзины больше этого размера обрезаются: пары считаются за O(n^2) на пользователя
+MAX_BASKET_SIZE = 500
+
+def cofavorite_neighbors(baskets: Iterable[Sequence[int]], top_k: int) -> Dict[int, List[Tuple[int, float]]]:
+    """Item-to-item по совместному избранному (корзина - ID книг одного пользователя):
+    косинус co(a, b) / sqrt(n(a) * n(b)), top_k соседей на книгу"""
+    # Разреженная матрица совместной встречаемости: строка книги -> {сосед: число пользователей}
+    popularity: Dict[int, int] = defaultdict(int)
+    co_counts: Dict[int, Dict[int, int]] = defaultdict(lambda: defaultdict(int))
+    for books in baskets:
+        books = sorted(set(books))[:MAX_BASKET_SIZE]
+        for book_id in books:
+            popularity[book_id] += 1
+        for i, first in enumerate(books):
+            row = co_counts[first]
+            for second in books[i + 1:]:
+                row[second] += 1
+                co_counts[second][first] += 1
+    
+    neighbors = {}
+    for book_id, row in co_counts.items():
+        scored = (
+            (count / math.sqrt(popularity[book_id] * popularity[other]), other)
+            for other, count in row.items()
+        )
+        neighbors[book_id] = [(other, score) for score, other in heapq.nlargest(top_k, scored)]
+    return neighbors
+
+
+# =============== ПОХОЖИЕ КНИГИ ПО ТЕКСТУ (TF-IDF) ===============
+
+RUSSIAN_STOP_WORDS = frozenset("""
+и в во не что он на я с со как а то все она так его но да ты к у же вы за бы по только
+ее мне было вот от меня еще нет о из ему теперь когда даже ну вдруг ли если уже или ни
+быть был него до вас нибудь опять уж вам ведь там потом себя ничего ей может они тут где
+есть надо ней для мы тебя их чем была сам чтоб без будто чего раз тоже себе под будет ж
+тогда кто этот того потому этого какой совсем ним здесь этом один почти мой тем чтобы нее
+сейчас были куда зачем всех никогда можно при наконец два об другой хоть после над больше
+тот через эти нас про всего них какая много разве три эту моя впрочем хорошо свою этой
+перед иногда лучше чуть том нельзя такой им более всегда конечно всю между это также книга
+книги книгу роман автор
+""".split())
+
+# Грубый стемминг для русского: отбрасывание окончания склеивает падежные формы (война/войне)
+RUSSIAN_ENDINGS = tuple(sorted("""
+иями ями ами ого его ому ему ыми ими ая яя ое ее ые ие ый ий ой ом ем ах ях ов ев ей ам ям
+ию ью ия ья а я о е ы и у ю ь й
+""".split(), key=len, reverse=True))
+
+MIN_STEM_LENGTH = 3
+
+# Вес полей: название повторяется, чтобы совпадение в нем весило больше, чем в описании
+TITLE_WEIGHT = 2
+
+# Термины, встречающиеся больше чем в такой доле книг, не различают книги и пропускаются
+MAX_DOCUMENT_FREQUENCY = 0.5
+
+def stem(token: str) -> str:
+    """Слово без самого длинного подходящего окончания"""
+    for ending in RUSSIAN_ENDINGS:
+        if token.endswith(ending) and len(token) - len(ending) >= MIN_STEM_LENGTH:
+            return token[:-len(ending)]
+    return token
+
+def tokenize(value: str) -> List[str]:
+    """Нормализованные основы слов без стоп-слов и чисел"""
+    return [
+        stem(token)
+        for token in normalize_search_text(value).split()
+        if len(token) > 2 and token not in RUSSIAN_STOP_WORDS and not token.isdigit()
+    ]
+
+# Доля книг, измененных после полной перестройки, после которой idf считается устаревшим
+MAX_CHANGED_FRACTION = 0.2
+
+def _term_counts(title: str, author: str, description: Optional[str]) -> Counter:
+    """Термины книги с повтором названия по TITLE_WEIGHT"""
+    return Counter(tokenize(title) * TITLE_WEIGHT + tokenize(author) + tokenize(description or ''))
+
+class ContentIndex:
+    """TF-IDF индекс книг: idf фиксируется при полной перестройке, векторы измененных книг
+    пересчитываются по нему, не трогая остальные книги"""
+    
+    def __init__(self, documents: Sequence[Tuple[int, str, str, Optional[str]]]):
+        term_counts = {
+            book_id: _term_counts(title, author, description)
+            for book_id, title, author, description in documents
+        }
+        
+        self.size = len(term_counts)
+        document_frequency = Counter(term for counts in term_counts.values() for term in counts)
+        max_df = max(2, int(self.size * MAX_DOCUMENT_FREQUENCY))
+        self.idf = {
+            term: math.log(self.size / df) + 1.0
+            for term, df in document_frequency.items()
+            # Термин из одной книги не дает ни одной пары
+            if 1 < df <= max_df
+        }
+        
+        # Разреженные L2-нормированные векторы и инвертированный индекс по терминам
+        self.vectors: Dict[int, Dict[str, float]] = {}
+        self.postings: Dict[str, Dict[int, float]] = defaultdict(dict)
+        self.changed = 0
+        for book_id, counts in term_counts.items():
+            self._add(book_id, counts)
+    
+    def _add(self, book_id: int, counts: Counter):
+        # Сублинейный tf; термины вне словаря последней перестройки не учитываются
+        vector = {term: (1.0 + math.log(tf)) * self.idf[term] for term, tf in counts.items() if term in self.idf}
+        norm = math.sqrt(sum(weight * weight for weight in vector.values()))
+        if not norm:
+            return
+        vector = {term: weight / norm for term, weight in vector.items()}
+        self.vectors[book_id] = vector
+        for term, weight in vector.items():
+            self.postings[term][book_id] = weight
+    
+    def _remove(self, book_id: int):
+        for term in self.vectors.pop(book_id, {}):
+            self.postings[term].pop(book_id, None)
+    
+    def update(self, documents: Sequence[Tuple[int, str, str, Optional[str]]], book_ids: Iterable[int]):
+        """Пересчет векторов book_ids; книги из book_ids, которых нет в documents, удалены"""
+        for book_id in book_ids:
+            self._remove(book_id)
+        for book_id, title, author, description in documents:
+            self._add(book_id, _term_counts(title, author, description))
+        self.changed += len(set(book_ids))
+    
+    def is_stale(self) -> bool:
+        """Изменилось слишком много книг - idf и словарь пора пересчитать полной перестройкой"""
+        return self.changed > max(1, self.size * MAX_CHANGED_FRACTION)
+    
+    def neighbors(self, top_k: int, book_ids: Optional[Iterable[int]] = None) -> Dict[int, List[Tuple[int, float]]]:
+        """Косинусная близость: top_k соседей для book_ids или всех книг"""
+        neighbors = {}
+        for book_id in (self.vectors if book_ids is None else book_ids):
+            vector = self.vectors.get(book_id)
+            if vector is None:
+                neighbors[book_id] = []
+                continue
+            # Скалярные произведения только с книгами, у которых есть общие термины
+            scores: Dict[int, float] = defaultdict(float)
+            for term, weight in vector.items():
+                for other, other_weight in self.postings[term].items():
+                    if other != book_id:
+                        scores[other] += weight * other_weight
+            best = heapq.nlargest(top_k, ((score, other) for other, score in scores.items()))
+            neighbors[book_id] = [(other, score) for score, other in best]
+        return neighbors
+
+# Индекс живет в процессе пула между запусками; в главном процессе остается None
+_content_index: Optional[ContentIndex] = None
+
+def rebuild_content_index(documents: Sequence[Tuple[int, str, str, Optional[str]]],
+                          top_k: int) -> Dict[int, List[Tuple[int, float]]]:
+    """Полная перестройка индекса процесса и соседи всех книг"""
+    global _content_index
+    _content_index = ContentIndex(documents)
+    return _content_index.neighbors(top_k)
+
+def update_content_index(documents: Sequence[Tuple[int, str, str, Optional[str]]], book_ids: List[int],
+                         top_k: int) -> Optional[Dict[int, List[Tuple[int, float]]]]:
+    """Пересчет только измененных книг; None - индекса нет (новый процесс) или он устарел"""
+    if _content_index is None or _content_index.is_stale():
+        return None
+    _content_index.update(documents, book_ids)
+    return _content_index.neighbors(top_k, book_ids)
@@ -0,0 +1,77 @@
+# database/search.py - Полнотекстовый поиск по книгам (SQLite FTS5)
+import re
+
+# Внешний контент: FTS хранит только индекс, сами тексты остаются в books.
+# Название и автор индексируются по нормализованным колонкам (ё -> е, без пунктуации),
+# unicode61 приводит к нижнему регистру в том числе кириллицу.
+BOOKS_FTS_TABLE = 'books_fts'
+
+BOOKS_FTS_DDL = [
+    """
+    CREATE VIRTUAL TABLE IF NOT EXISTS books_fts USING fts5(
+        title_norm, author_norm, description,
+        content='books', content_rowid='id',
+        tokenize='unicode61 remove_diacritics 2'
+    )
+    """,
+    # Триггеры держат индекс в синхронизации при любой записи в books
+    """
+    CREATE TRIGGER IF NOT EXISTS books_fts_ai AFTER INSERT ON books BEGIN
+        INSERT INTO books_fts(rowid, title_norm, author_norm, description)
+        VALUES (new.id, new.title_norm, new.author_norm, new.description);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS books_fts_ad AFTER DELETE ON books BEGIN
+        INSERT INTO books_fts(books_fts, rowid, title_norm, author_norm, description)
+        VALUES ('delete', old.id, old.title_norm, old.author_norm, old.description);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS books_fts_au AFTER UPDATE OF title_norm, author_norm, description ON books BEGIN
+        INSERT INTO books_fts(books_fts, rowid, title_norm, author_norm, description)
+        VALUES ('delete', old.id, old.title_norm, old.author_norm, old.description);
+        INSERT INTO books_fts(rowid, title_norm, author_norm, description)
+        VALUES (new.id, new.title_norm, new.author_norm, new.description);
+    END
+    """,
+]
+
+# Удаление старой версии индекса (по исходным title/author) перед пересозданием
+BOOKS_FTS_DROP = [
+    "DROP TRIGGER IF EXISTS books_fts_ai",
+    "DROP TRIGGER IF EXISTS books_fts_ad",
+    "DROP TRIGGER IF EXISTS books_fts_au",
+    "DROP TABLE IF EXISTS books_fts",
+]
+
+BOOKS_FTS_REBUILD = "INSERT INTO books_fts(books_fts) VALUES ('rebuild')"
+BOOKS_FTS_OPTIMIZE = "INSERT INTO books_fts(books_fts) VALUES ('optimize')"
+
+# Веса bm25 по колонкам: совпадение в названии важнее, чем в авторе и описании.
+# Книги из префиксной выдачи (уже показанные выше) исключаются через :exclude_ids.
+BOOKS_FTS_SEARCH = """
+    SELECT b.id, b.title, b.author, b.year, b.genre, b.subgenre
+    FROM books_fts
+    JOIN books AS b ON b.id = books_fts.rowid
+    WHERE books_fts MATCH :match AND b.id NOT IN :exclude_ids
+    ORDER BY bm25(books_fts, 10.0, 5.0, 1.0), b.id
+    LIMIT :limit OFFSET :offset
+"""
+
+# Верхняя граница для префиксного поиска диапазоном: q <= key < q + PREFIX_UPPER_BOUND
+PREFIX_UPPER_BOUND = '\uffff'
+
+_PUNCTUATION_RE = re.compile(r'[\W_]+', re.UNICODE)
+
+def normalize_search_text(value: str) -> str:
+    """Ключ поиска: casefold, ё -> е, пунктуация и пробелы схлопнуты в один пробел"""
+    if not value:
+        return ''
+    value = value.casefold().replace('ё', 'е')
+    return _PUNCTUATION_RE.sub(' ', value).strip()
+
+def build_fts_query(query: str) -> str:
+    """Запрос пользователя -> выражение MATCH: каждое слово как префикс, все слова обязательны"""
+    tokens = normalize_search_text(query).split()
+    return ' '.join(f'"{token}"*' for token in tokens)
\ No newline at end of file
@@ -0,0 +1,121 @@
+# database/write_behind.py - Отложенная пакетная запись избранного (write-behind)
+import asyncio
+import logging
+from typing import Awaitable, Callable, Dict, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# (user_id, book_id) -> (состояние в БД до первого нажатия, желаемое состояние)
+PendingFavorites = Dict[Tuple[int, int], Tuple[bool, bool]]
+
+# Пауза перед повторной попыткой, если запись пачки не удалась
+RETRY_DELAY = 1.0
+
+def pending_changes(entries: PendingFavorites) -> Dict[Tuple[int, int], bool]:
+    """Пары, которые нужно записать; четное число нажатий вернуло пару в исходное состояние"""
+    return {key: wanted for key, (stored, wanted) in entries.items() if stored != wanted}
+
+class FavoriteWriteBuffer:
+    """Буфер желаемых состояний избранного: повторные нажатия на одну пару (user_id, book_id) склеиваются"""
+    
+    def __init__(self, apply: Callable[[Dict[Tuple[int, int], bool]], Awaitable[None]], delay: float):
+        self._apply = apply
+        self.delay = delay
+        self._pending: PendingFavorites = {}
+        # Взятые на запись, но еще не закоммиченные изменения: до коммита множества избранного
+        # в памяти их не видят, поэтому желаемое состояние отдается отсюда
+        self._writing: PendingFavorites = {}
+        self._flush_task: Optional[asyncio.Task] = None
+        self._lock = asyncio.Lock()
+        self.coalesced = 0
+        self.written = 0
+    
+    def get(self, user_id: int, book_id: int) -> Optional[bool]:
+        """Желаемое состояние из буфера (в том числе записываемое сейчас) или None, если изменений нет"""
+        key = (user_id, book_id)
+        entry = self._pending.get(key) or self._writing.get(key)
+        return entry[1] if entry is not None else None
+    
+    def put(self, user_id: int, book_id: int, is_favorite: bool, stored: bool):
+        """Новое желаемое состояние; stored - состояние в БД (учитывается только для первого нажатия)"""
+        key = (user_id, book_id)
+        entry = self._pending.get(key)
+        if entry is not None:
+            self.coalesced += 1
+            stored = entry[0]
+        self._pending[key] = (stored, is_favorite)
+        self._schedule(self.delay)
+    
+    def discard(self, user_id: int, book_id: int):
+        """Снять отложенное изменение (пара записывается напрямую)"""
+        self._pending.pop((user_id, book_id), None)
+    
+    def take_user(self, user_id: int) -> PendingFavorites:
+        """Забрать из буфера изменения пользователя, чтобы записать их в транзакции вызывающего"""
+        entries = {key: entry for key, entry in self._pending.items() if key[0] == user_id}
+        for key in entries:
+            del self._pending[key]
+        self._writing.update(entries)
+        return entries
+    
+    def written_back(self, entries: PendingFavorites):
+        """Транзакция с изменениями take_user закоммичена - состояние уже в множествах избранного"""
+        for key, entry in entries.items():
+            if self._writing.get(key) is entry:
+                del self._writing[key]
+    
+    def restore(self, entries: PendingFavorites):
+        """Вернуть изменения, взятые take_user, если транзакция вызывающего откатилась"""
+        self._requeue(entries)
+        if self._pending:
+            self._schedule(self.delay)
+    
+    def _requeue(self, entries: PendingFavorites):
+        self.written_back(entries)
+        for key, entry in entries.items():
+            newer = self._pending.get(key)
+            # Более новое нажатие сохраняет желаемое состояние, но считалось от незаписанного:
+            # состояние в БД - то, что было до неудавшейся записи
+            self._pending[key] = entry if newer is None else (entry[0], newer[1])
+    
+    def _schedule(self, delay: float):
+        if self._flush_task is None or self._flush_task.done():
+            self._flush_task = asyncio.create_task(self._flush_later(delay))
+    
+    async def _flush_later(self, delay: float):
+        await asyncio.sleep(delay)
+        try:
+            await self.flush()
+            delay = self.delay
+        except Exception as e:
+            logger.error(f"Ошибка записи избранного, повтор через {RETRY_DELAY} сек: {e}")
+            delay = RETRY_DELAY
+        # Нажатия, пришедшие во время записи, уходят следующей пачкой
+        self._flush_task = None
+        if self._pending:
+            self._schedule(delay)
+    
+    async def flush(self):
+        """Запись накопленных изменений одной транзакцией"""
+        async with self._lock:
+            if not self._pending:
+                return
+            batch, self._pending = self._pending, {}
+            self._writing.update(batch)
+            changes = pending_changes(batch)
+            try:
+                if changes:
+                    await self._apply(changes)
+            except BaseException:
+                self._requeue(batch)
+                raise
+            # После коммита изменения уже в множествах избранного (колбэки after_commit)
+            self.written_back(batch)
+            self.written += len(changes)
+    
+    async def close(self):
+        """Гарантированная запись при остановке"""
+        if self._flush_task is not None and not self._flush_task.done():
+            self._flush_task.cancel()
+            await asyncio.gather(self._flush_task, return_exceptions=True)
+        await self.flush()
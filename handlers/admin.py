@@ -1,16 +1,26 @@
 # handlers/admin.py - Обработчики для администраторов
+import os
+import tempfile
+import time
+
 from aiogram import F, Router
-from aiogram.types import Message, CallbackQuery, InlineKeyboardMarkup, InlineKeyboardButton
-from aiogram.filters import StateFilter
+from aiogram.types import Message, CallbackQuery, InlineKeyboardMarkup, InlineKeyboardButton, FSInputFile
+from aiogram.filters import Command, CommandObject, StateFilter
 from aiogram.fsm.context import FSMContext
 
+from config import Config
 from database.database import DatabaseManager
-from keyboards import get_admin_keyboard, get_main_keyboard
-from utils import is_admin, format_book_info
+from database.importer import detect_format, import_books
+from database.exporter import EXPORT_FIELDS, EXPORT_FORMATS, export_rows
+from keyboards import (
+    get_admin_keyboard, get_main_keyboard, get_broadcast_confirm_keyboard,
+    get_genre_selection_keyboard, get_subgenres_keyboard
+)
+from broadcast import start_broadcast
+from utils import is_admin, format_book_info, format_admin_stats
 from states import AdminStates
 
 router = Router()
-db = DatabaseManager()
 
 @router.message(F.text == "⚙️ Админ панель")
 async def admin_panel(message: Message):
@@ -62,12 +72,7 @@ async def add_book_description(message: Message, state: FSMContext):
     await state.update_data(description=message.text.strip())
     
     # Выбор жанра
-    keyboard = InlineKeyboardMarkup(inline_keyboard=[
-        [InlineKeyboardButton(text="📚 Литература", callback_data="admin_genre_Литература")],
-        [InlineKeyboardButton(text="💻 Тех литература", callback_data="admin_genre_Тех литература")]
-    ])
-    
-    await message.answer("Выберите жанр:", reply_markup=keyboard)
+    await message.answer("Выберите жанр:", reply_markup=get_genre_selection_keyboard())
     await state.set_state(AdminStates.waiting_for_genre)
 
 @router.callback_query(F.data.startswith("admin_genre_"), StateFilter(AdminStates.waiting_for_genre))
@@ -77,26 +82,7 @@ async def add_book_genre(callback: CallbackQuery, state: FSMContext):
     await state.update_data(genre=genre)
     
     # Поджанры в зависимости от основного жанра
-    if genre == "Литература":
-        keyboard = InlineKeyboardMarkup(inline_keyboard=[
-            [InlineKeyboardButton(text="📖 Художественная", callback_data="admin_subgenre_Художественная")],
-            [InlineKeyboardButton(text="📚 Классическая", callback_data="admin_subgenre_Классическая")],
-            [InlineKeyboardButton(text="🕵️ Детектив", callback_data="admin_subgenre_Детектив")],
-            [InlineKeyboardButton(text="💝 Роман", callback_data="admin_subgenre_Роман")],
-            [InlineKeyboardButton(text="🚀 Фантастика", callback_data="admin_subgenre_Фантастика")],
-            [InlineKeyboardButton(text="🎭 Драма", callback_data="admin_subgenre_Драма")],
-            [InlineKeyboardButton(text="⏭️ Пропустить", callback_data="admin_subgenre_")]
-        ])
-    else:  # Тех литература
-        keyboard = InlineKeyboardMarkup(inline_keyboard=[
-            [InlineKeyboardButton(text="💻 Программирование", callback_data="admin_subgenre_Программирование")],
-            [InlineKeyboardButton(text="🔧 Инженерия", callback_data="admin_subgenre_Инженерия")],
-            [InlineKeyboardButton(text="🔬 Наука", callback_data="admin_subgenre_Наука")],
-            [InlineKeyboardButton(text="🏗️ Архитектура", callback_data="admin_subgenre_Архитектура")],
-            [InlineKeyboardButton(text="📊 Экономика", callback_data="admin_subgenre_Экономика")],
-            [InlineKeyboardButton(text="🏥 Медицина", callback_data="admin_subgenre_Медицина")],
-            [InlineKeyboardButton(text="⏭️ Пропустить", callback_data="admin_subgenre_")]
-        ])
+    keyboard = get_subgenres_keyboard(genre)
     
     await callback.message.edit_text("Выберите поджанр (или пропустите):", reply_markup=keyboard)
     await state.set_state(AdminStates.waiting_for_subgenre)
@@ -134,12 +120,12 @@ async def request_file(callback: CallbackQuery, state: FSMContext):
     )
 
 @router.callback_query(F.data == "skip_file", StateFilter(AdminStates.waiting_for_file))
-async def skip_file_and_save(callback: CallbackQuery, state: FSMContext):
+async def skip_file_and_save(callback: CallbackQuery, state: FSMContext, db: DatabaseManager):
     """Пропускаем файл и сохраняем книгу"""
-    await save_book_to_database(callback.message, state, file_data=None)
+    await save_book_to_database(callback.message, state, db, file_data=None)
 
 @router.message(F.document, StateFilter(AdminStates.waiting_for_file))
-async def handle_book_file(message: Message, state: FSMContext):
+async def handle_book_file(message: Message, state: FSMContext, db: DatabaseManager):
     """Обработка загруженного файла"""
     document = message.document
     
@@ -180,9 +166,9 @@ async def handle_book_file(message: Message, state: FSMContext):
         f"Сохраняю книгу..."
     )
     
-    await save_book_to_database(message, state, file_data)
+    await save_book_to_database(message, state, db, file_data)
 
-async def save_book_to_database(message: Message, state: FSMContext, file_data: dict = None):
+async def save_book_to_database(message: Message, state: FSMContext, db: DatabaseManager, file_data: dict = None):
     """Сохранение книги в базу данных"""
     data = await state.get_data()
     
@@ -219,8 +205,71 @@ async def save_book_to_database(message: Message, state: FSMContext, file_data:
     await state.clear()
 
 
+# Не чаще одного обновления сообщения о прогрессе импорта за столько секунд
+IMPORT_PROGRESS_INTERVAL = 2.0
+
+@router.message(F.text == "📥 Импорт книг")
+async def import_books_start(message: Message, state: FSMContext):
+    """Начало импорта каталога из файла"""
+    if not is_admin(message.from_user.id):
+        await message.answer("У вас нет прав для добавления книг ❌")
+        return
+    
+    await message.answer(
+        "📥 Отправьте файл каталога:\n\n"
+        "• CSV (.csv) с колонками title, author, year, description, genre, subgenre\n"
+        "• JSONL (.jsonl) - по одной книге в строке с теми же ключами\n\n"
+        f"Жанры: {', '.join(Config.GENRES)}; поджанр - из поджанров жанра или пусто.\n"
+        "Дубли (название, автор, год) пропускаются. Максимальный размер: 20 МБ"
+    )
+    await state.set_state(AdminStates.waiting_for_import_file)
+
+@router.message(F.document, StateFilter(AdminStates.waiting_for_import_file))
+async def import_books_file(message: Message, state: FSMContext, db: DatabaseManager):
+    """Потоковый импорт загруженного файла пачками"""
+    document = message.document
+    fmt = detect_format(document.file_name)
+    if fmt is None:
+        await message.answer("❌ Неподдерживаемый формат! Нужен файл .csv или .jsonl")
+        return
+    
+    await state.clear()
+    status = await message.answer("⏳ Импорт начат...")
+    last_update = time.monotonic()
+    
+    async def report(stats):
+        nonlocal last_update
+        if time.monotonic() - last_update < IMPORT_PROGRESS_INTERVAL:
+            return
+        last_update = time.monotonic()
+        await status.edit_text(
+            f"⏳ Прочитано: {stats['read']}, добавлено: {stats['inserted']}, "
+            f"дублей: {stats['duplicates']}, с ошибками: {stats['invalid']}"
+        )
+    
+    # Файл скачивается на диск и читается построчно - в памяти только текущая пачка
+    fd, path = tempfile.mkstemp(suffix=f'.{fmt}')
+    os.close(fd)
+    try:
+        await message.bot.download(document, destination=path)
+        with open(path, encoding='utf-8-sig', newline='') as stream:
+            stats = await import_books(db, stream, fmt, Config.IMPORT_BATCH_SIZE, report)
+    except Exception as e:
+        await status.edit_text(f"❌ Ошибка импорта: {e}")
+        return
+    finally:
+        os.remove(path)
+    
+    await status.edit_text(
+        f"✅ Импорт завершен!\n\n"
+        f"📄 Записей в файле: {stats['read']}\n"
+        f"➕ Добавлено книг: {stats['inserted']}\n"
+        f"🔁 Дублей пропущено: {stats['duplicates']}\n"
+        f"⚠️ С ошибками: {stats['invalid']}"
+    )
+
 @router.message(F.text == "✏️ Редактировать книги")
-async def edit_books_list(message: Message):
+async def edit_books_list(message: Message, db: DatabaseManager):
     """Список книг для редактирования"""
     if not is_admin(message.from_user.id):
         await message.answer("У вас нет прав для редактирования книг ❌")
@@ -236,11 +285,11 @@ async def edit_books_list(message: Message):
     text = "Выберите книгу для редактирования:\n\n"
     
     for book in books:
-        text += f"📖 {book['title']} - {book['author']}\n"
+        text += f"📖 {book.title} - {book.author}\n"
         keyboard_buttons.append([
             InlineKeyboardButton(
-                text=f"✏️ {book['title']}", 
-                callback_data=f"edit_book_{book['id']}"
+                text=f"✏️ {book.title}", 
+                callback_data=f"edit_book_{book.id}"
             )
         ])
     
@@ -248,14 +297,14 @@ async def edit_books_list(message: Message):
     await message.answer(text, reply_markup=keyboard)
 
 @router.callback_query(F.data.startswith("edit_book_"))
-async def edit_book_menu(callback: CallbackQuery):
+async def edit_book_menu(callback: CallbackQuery, db: DatabaseManager):
     """Меню редактирования конкретной книги"""
     book_id = int(callback.data.split("_")[2])
     book = await db.get_book_by_id(book_id)
     
-    text = f"📖 Редактирование: {book['title']}\n\n"
+    text = f"📖 Редактирование: {book.title}\n\n"
     text += format_book_info(book, show_description=False)
-    text += f"\n📝 Описание: {book['description'][:100]}...\n\n"
+    text += f"\n📝 Описание: {book.description[:100]}...\n\n"
     text += "Что хотите изменить?"
     
     keyboard = InlineKeyboardMarkup(inline_keyboard=[
@@ -288,7 +337,7 @@ async def edit_field_start(callback: CallbackQuery, state: FSMContext):
     await state.set_state(AdminStates.edit_waiting_value)
 
 @router.message(StateFilter(AdminStates.edit_waiting_value))
-async def edit_field_process(message: Message, state: FSMContext):
+async def edit_field_process(message: Message, state: FSMContext, db: DatabaseManager):
     """Обработка редактирования поля"""
     data = await state.get_data()
     book_id = data['book_id']
@@ -314,7 +363,7 @@ async def edit_field_process(message: Message, state: FSMContext):
     await state.clear()
 
 @router.callback_query(F.data.startswith("delete_book_"))
-async def confirm_delete_book(callback: CallbackQuery):
+async def confirm_delete_book(callback: CallbackQuery, db: DatabaseManager):
     """Подтверждение удаления книги"""  
     book_id = int(callback.data.split("_")[2])
     book = await db.get_book_by_id(book_id)
@@ -325,40 +374,120 @@ async def confirm_delete_book(callback: CallbackQuery):
     ])
     
     await callback.message.edit_text(
-        f"⚠️ Вы уверены, что хотите удалить книгу '{book['title']}'?",
+        f"⚠️ Вы уверены, что хотите удалить книгу '{book.title}'?",
         reply_markup=keyboard
     )
 
 @router.callback_query(F.data.startswith("confirm_delete_"))
-async def delete_book_confirmed(callback: CallbackQuery):
+async def delete_book_confirmed(callback: CallbackQuery, db: DatabaseManager):
     """Удаление книги"""
     book_id = int(callback.data.split("_")[2])
     await db.delete_book(book_id)
     await callback.message.edit_text("✅ Книга успешно удалена!")
 
 @router.callback_query(F.data == "back_to_edit_list")
-async def back_to_edit_list(callback: CallbackQuery):
+async def back_to_edit_list(callback: CallbackQuery, db: DatabaseManager):
     """Возврат к списку редактирования"""
-    await edit_books_list(callback.message)
+    await edit_books_list(callback.message, db)
 
 @router.message(F.text == "📊 Статистика")
-async def admin_statistics(message: Message):
+async def admin_statistics(message: Message, db: DatabaseManager):
     """Статистика для админа"""
     if not is_admin(message.from_user.id):
         await message.answer("У вас нет доступа к статистике ❌")
         return
     
-    # Получаем статистику
-    total_books = len(await db.get_all_books())
-    total_users = len(await db.get_all_users())
+    # Получаем статистику агрегатными запросами
+    stats = await db.get_catalog_stats()
+    await message.answer(format_admin_stats(stats, db.get_cache_stats()))
+
+@router.message(Command("rebuild_search"))
+async def rebuild_search_index(message: Message, db: DatabaseManager):
+    """Перестройка поискового индекса"""
+    if not is_admin(message.from_user.id):
+        await message.answer("У вас нет доступа к этой команде ❌")
+        return
+    
+    if await db.rebuild_search_index():
+        await message.answer("✅ Поисковый индекс перестроен!")
+    else:
+        await message.answer("❌ Полнотекстовый поиск недоступен в этой базе данных.")
+
+@router.message(Command("export"))
+async def export_data(message: Message, command: CommandObject, db: DatabaseManager):
+    """Выгрузка книг или пользователей файлом: /export [books|users] [csv|jsonl] [gz]"""
+    if not is_admin(message.from_user.id):
+        await message.answer("У вас нет доступа к этой команде ❌")
+        return
     
-    literature_books = len(await db.get_books_by_genre("Литература", limit=1000))
-    tech_books = len(await db.get_books_by_genre("Тех литература", limit=1000))
+    args = (command.args or '').lower().split()
+    target = next((arg for arg in args if arg in EXPORT_FIELDS), 'books')
+    fmt = next((arg for arg in args if arg in EXPORT_FORMATS), 'csv')
+    compress = 'gz' in args
+    rows = db.stream_books() if target == 'books' else db.stream_users()
     
-    stats_text = "📊 Статистика бота:\n\n"
-    stats_text += f"📚 Всего книг: {total_books}\n"
-    stats_text += f"👥 Всего пользователей: {total_users}\n\n"
-    stats_text += f"📖 Литература: {literature_books} книг\n"
-    stats_text += f"💻 Тех литература: {tech_books} книг\n"
+    file_name = f"{target}.{fmt}" + (".gz" if compress else "")
+    fd, path = tempfile.mkstemp(suffix=f'_{file_name}')
+    os.close(fd)
+    try:
+        count = await export_rows(rows, EXPORT_FIELDS[target], path, fmt, compress)
+        await message.answer_document(
+            FSInputFile(path, filename=file_name),
+            caption=f"📤 Выгружено записей: {count}"
+        )
+    except Exception as e:
+        await message.answer(f"❌ Ошибка выгрузки: {e}")
+    finally:
+        os.remove(path)
+
+@router.message(F.text == "📣 Рассылка")
+async def broadcast_start(message: Message, state: FSMContext, db: DatabaseManager):
+    """Начало рассылки всем пользователям"""
+    if not is_admin(message.from_user.id):
+        await message.answer("У вас нет доступа к рассылке ❌")
+        return
     
-    await message.answer(stats_text)
\ No newline at end of file
+    active = await db.get_active_broadcast()
+    if active is not None:
+        await message.answer(
+            f"⏳ Рассылка #{active.id} еще идет: {active.sent + active.failed} из {active.total}. "
+            f"Новую можно начать после ее завершения."
+        )
+        return
+    
+    await message.answer("📣 Введите текст рассылки:")
+    await state.set_state(AdminStates.waiting_for_broadcast_text)
+
+@router.message(F.text, StateFilter(AdminStates.waiting_for_broadcast_text))
+async def broadcast_preview(message: Message, state: FSMContext):
+    """Предпросмотр текста рассылки"""
+    await state.update_data(broadcast_text=message.text)
+    await message.answer(message.text)
+    await message.answer(
+        "👆 Так сообщение увидят пользователи. Отправить?",
+        reply_markup=get_broadcast_confirm_keyboard()
+    )
+    await state.set_state(AdminStates.confirming_broadcast)
+
+@router.callback_query(F.data == "broadcast_confirm", StateFilter(AdminStates.confirming_broadcast))
+async def broadcast_confirmed(callback: CallbackQuery, state: FSMContext, db: DatabaseManager):
+    """Запуск рассылки в фоне; прогресс приходит отдельным сообщением"""
+    data = await state.get_data()
+    await state.clear()
+    
+    if await db.get_active_broadcast() is not None:
+        await callback.message.edit_text("❌ Другая рассылка уже идет")
+        await callback.answer()
+        return
+    
+    broadcast = await db.create_broadcast(data['broadcast_text'], callback.message.chat.id)
+    start_broadcast(callback.bot, db, broadcast)
+    await callback.message.edit_text(f"🚀 Рассылка #{broadcast.id} запущена для {broadcast.total} пользователей")
+    await callback.answer()
+
+@router.callback_query(F.data == "broadcast_cancel")
+async def broadcast_cancelled(callback: CallbackQuery, state: FSMContext):
+    """Отмена рассылки до запуска"""
+    await state.clear()
+    await callback.message.edit_text("❌ Рассылка отменена")
+    await callback.answer()
\ No newline at end of file
@@ -5,17 +5,20 @@ from aiogram.filters import Command, StateFilter
 from aiogram.fsm.context import FSMContext
 import logging
 from database.database import DatabaseManager
+from database.read_models import BookDetail
 from keyboards import get_main_keyboard, get_genres_keyboard
 from utils import is_admin, format_book_info, format_books_list
 from states import SearchStates
 
 router = Router()
-db = DatabaseManager()
 
 logger = logging.getLogger(__name__)
 
+SEARCH_PAGE_SIZE = 10
+GENRE_PAGE_SIZE = 5
+
 @router.message(Command("start"))
-async def start_command(message: Message):
+async def start_command(message: Message, db: DatabaseManager):
     """Стартовая команда"""
     user_id = message.from_user.id
     username = message.from_user.username or "Неизвестно"
@@ -30,7 +33,7 @@ async def start_command(message: Message):
     await message.answer(welcome_text, reply_markup=get_main_keyboard(is_admin(user_id)))
 
 @router.message(F.text == "👤 Мой профиль")
-async def my_profile(message: Message):
+async def my_profile(message: Message, db: DatabaseManager):
     """Показ профиля пользователя"""
     user_id = message.from_user.id
     favorite_books = await db.get_user_favorite_books(user_id)
@@ -41,14 +44,14 @@ async def my_profile(message: Message):
     else:
         profile_text = "📚 Ваш профиль:\n\n❤️ Любимые книги:\n"
         for book in favorite_books:
-            profile_text += f"• {book['title']} - {book['author']} ({book['year']})\n"
+            profile_text += f"• {book.title} - {book.author} ({book.year})\n"
         
         # Получаем рекомендации
         recommendations = await db.get_recommendations_for_user(user_id)
         if recommendations:
             profile_text += "\n💡 Рекомендации для вас:\n"
             for rec in recommendations[:3]:  # Показываем топ-3 рекомендации
-                profile_text += f"• {rec['title']} - {rec['author']}\n"
+                profile_text += f"• {rec.title} - {rec.author}\n"
     
     # Добавляем кнопки управления избранным
     keyboard = InlineKeyboardMarkup(inline_keyboard=[
@@ -64,18 +67,30 @@ async def show_genres(message: Message):
     await message.answer("Выберите жанр:", reply_markup=get_genres_keyboard())
 
 @router.callback_query(F.data.startswith("genre_"))
-async def handle_genre_selection(callback: CallbackQuery):
+async def handle_genre_selection(callback: CallbackQuery, db: DatabaseManager):
     """Обработка выбора жанра"""
-    genre = callback.data.split("_")[1]
-    page = int(callback.data.split("_")[2]) if len(callback.data.split("_")) > 2 else 0
-    
-    books = await db.get_books_by_genre(genre, limit=5, offset=page*5)
+    # genre_<жанр>_<страница>[_<n|p>_<год>_<id>] - курсор указывает на край соседней страницы
+    parts = callback.data.split("_")
+    genre = parts[1]
+    page = int(parts[2]) if len(parts) > 2 else 0
+    after = before = None
+    if len(parts) > 5:
+        cursor = (int(parts[4]), int(parts[5]))
+        if parts[3] == "n":
+            after = cursor
+        else:
+            before = cursor
+    
+    books = await db.get_books_by_genre(genre, limit=GENRE_PAGE_SIZE, after=after, before=before)
     total_books = await db.get_books_count_by_genre(genre)
     
     if not books:
         await callback.message.edit_text("В этом жанре пока нет книг 😔")
         return
     
+    # Отметки избранного для всей страницы - из памяти, без запроса на каждую книгу
+    favorite_ids = await db.favorite_book_ids(callback.from_user.id, [book.id for book in books])
+    
     text = f"📚 Книги жанра '{genre}':\n\n"
     keyboard_buttons = []
     
@@ -85,17 +100,24 @@ async def handle_genre_selection(callback: CallbackQuery):
         # Кнопка для каждой книги
         keyboard_buttons.append([
             InlineKeyboardButton(
-                text=f"📖 {book['title']}", 
-                callback_data=f"book_action_{book['id']}"
+                text=f"{'❤️' if book.id in favorite_ids else '📖'} {book.title}", 
+                callback_data=f"book_action_{book.id}"
             )
         ])
     
     # Кнопки навигации
+    first, last = books[0], books[-1]
     nav_buttons = []
     if page > 0:
-        nav_buttons.append(InlineKeyboardButton(text="⬅️ Назад", callback_data=f"genre_{genre}_{page-1}"))
-    if (page + 1) * 5 < total_books:
-        nav_buttons.append(InlineKeyboardButton(text="➡️ Далее", callback_data=f"genre_{genre}_{page+1}"))
+        nav_buttons.append(InlineKeyboardButton(
+            text="⬅️ Назад",
+            callback_data=f"genre_{genre}_{page-1}_p_{first.year}_{first.id}"
+        ))
+    if (page + 1) * GENRE_PAGE_SIZE < total_books:
+        nav_buttons.append(InlineKeyboardButton(
+            text="➡️ Далее",
+            callback_data=f"genre_{genre}_{page+1}_n_{last.year}_{last.id}"
+        ))
     
     if nav_buttons:
         keyboard_buttons.append(nav_buttons)
@@ -110,64 +132,106 @@ async def back_to_genres(callback: CallbackQuery):
     """Возврат к жанрам"""
     await callback.message.edit_text("Выберите жанр:", reply_markup=get_genres_keyboard())
 
-@router.callback_query(F.data.startswith("book_action_"))
-async def handle_book_action(callback: CallbackQuery):
-    """Действия с книгой (обновленная версия)"""
-    book_id = int(callback.data.split("_")[2])
-    user_id = callback.from_user.id
-    
-    book = await db.get_book_by_id(book_id)
-    is_favorite = await db.is_book_in_favorites(user_id, book_id)
-    
-    # Создаем клавиатуру с учетом наличия файла
+def build_book_card_keyboard(book: BookDetail, is_favorite: bool) -> InlineKeyboardMarkup:
+    """Клавиатура карточки книги: избранное, скачивание файла, похожие, назад к жанру"""
     keyboard_buttons = []
     
     # Кнопка избранного
     keyboard_buttons.append([InlineKeyboardButton(
         text="💔 Удалить из избранного" if is_favorite else "❤️ Добавить в избранное",
-        callback_data=f"toggle_favorite_{book_id}"
+        callback_data=f"toggle_favorite_{book.id}"
     )])
     
     # Кнопка скачивания файла (если есть)
-    if book['file_id']:
+    if book.file_id:
         keyboard_buttons.append([InlineKeyboardButton(
-            text=f"📎 Скачать {book['file_type'].upper()}",
-            callback_data=f"download_file_{book_id}"
+            text=f"📎 Скачать {book.file_type.upper()}",
+            callback_data=f"download_file_{book.id}"
         )])
     
+    # Похожие книги (соседи по тексту рассчитаны заранее)
+    keyboard_buttons.append([InlineKeyboardButton(
+        text="📚 Похожие",
+        callback_data=f"similar_{book.id}"
+    )])
+    
     # Кнопка назад
     keyboard_buttons.append([InlineKeyboardButton(
         text="🔙 Назад", 
-        callback_data=f"genre_{book['genre']}_0"
+        callback_data=f"genre_{book.genre}_0"
     )])
     
-    keyboard = InlineKeyboardMarkup(inline_keyboard=keyboard_buttons)
+    return InlineKeyboardMarkup(inline_keyboard=keyboard_buttons)
+
+@router.callback_query(F.data.startswith("book_action_"))
+async def handle_book_action(callback: CallbackQuery, db: DatabaseManager):
+    """Действия с книгой (обновленная версия)"""
+    book_id = int(callback.data.split("_")[2])
+    user_id = callback.from_user.id
+    
+    # Книга, отметка избранного и популярность - один запрос
+    view = await db.get_book_view(user_id, book_id)
+    if view is None:
+        await callback.answer("Книга не найдена ❌")
+        return
+    book, is_favorite = view.book, view.is_favorite
+    
+    keyboard = build_book_card_keyboard(book, is_favorite)
     
     # Формируем текст с информацией о файле
     text = format_book_info(book, show_description=True)
+    if view.favorite_count:
+        text += f"\n\n❤️ В избранном у {view.favorite_count} чел."
+    
+    if book.file_id:
+        text += f"\n\n📎 Доступен файл: {book.file_name}"
+        text += f"\n📊 Размер: {book.file_size / 1024 / 1024:.1f} МБ"
+        text += f"\n📄 Формат: {book.file_type.upper()}"
+    
+    await callback.message.edit_text(text, reply_markup=keyboard)
+
+@router.callback_query(F.data.startswith("similar_"))
+async def show_similar_books(callback: CallbackQuery, db: DatabaseManager):
+    """Похожие книги по названию, автору и описанию"""
+    book_id = int(callback.data.split("_")[1])
+    books = await db.get_similar_books(book_id)
+    
+    if not books:
+        await callback.answer("Похожих книг пока нет 😔")
+        return
+    
+    text = "📚 Похожие книги:\n\n"
+    keyboard_buttons = []
+    
+    for book in books:
+        text += format_book_info(book, show_description=False) + "\n\n"
+        keyboard_buttons.append([
+            InlineKeyboardButton(
+                text=f"📖 {book.title}", 
+                callback_data=f"book_action_{book.id}"
+            )
+        ])
     
-    if book['file_id']:
-        text += f"\n\n📎 Доступен файл: {book['file_name']}"
-        text += f"\n📊 Размер: {book['file_size'] / 1024 / 1024:.1f} МБ"
-        text += f"\n📄 Формат: {book['file_type'].upper()}"
+    keyboard_buttons.append([InlineKeyboardButton(text="🔙 Назад", callback_data=f"book_action_{book_id}")])
     
+    keyboard = InlineKeyboardMarkup(inline_keyboard=keyboard_buttons)
     await callback.message.edit_text(text, reply_markup=keyboard)
 
 @router.callback_query(F.data.startswith("download_file_"))
-async def download_book_file(callback: CallbackQuery):
+async def download_book_file(callback: CallbackQuery, db: DatabaseManager):
     """Отправка файла книги пользователю"""
     book_id = int(callback.data.split("_")[2])
     book = await db.get_book_by_id(book_id)
     
-    if not book or not book['file_id']:
+    if not book or not book.file_id:
         await callback.answer("Файл не найден ❌")
         return
     
     try:
         # Отправляем файл пользователю
         await callback.message.answer_document(
-            document=book['file_id'],
-            caption=f"📖 {book['title']}\n👤 {book['author']}\n📅 {book['year']}"
+            document=book.file_id,
+            caption=f"📖 {book.title}\n👤 {book.author}\n📅 {book.year}"
         )
         await callback.answer("Файл отправлен! 📎")
         
@@ -179,33 +243,28 @@ async def download_book_file(callback: CallbackQuery):
         await callback.answer("Ошибка при отправке файла ❌")
 
 @router.callback_query(F.data.startswith("toggle_favorite_"))
-async def toggle_favorite(callback: CallbackQuery):
+async def toggle_favorite(callback: CallbackQuery, db: DatabaseManager):
     """Переключение избранного"""
     book_id = int(callback.data.split("_")[2])
     user_id = callback.from_user.id
     
-    is_favorite = await db.is_book_in_favorites(user_id, book_id)
+    # Книга из кэша карточек: нужна для кнопок карточки и проверки существования
+    book = await db.get_book_by_id(book_id)
     
-    if is_favorite:
-        await db.remove_from_favorites(user_id, book_id)
-        await callback.answer("Книга удалена из избранного ❌")
-    else:
-        await db.add_to_favorites(user_id, book_id)
-        await callback.answer("Книга добавлена в избранное ❤️")
+    # Ответ сразу по состоянию в памяти, запись в БД - отложенной пачкой
+    is_favorite = await db.toggle_favorite_deferred(user_id, book_id) if book else None
     
-    # Обновляем кнопки
-    book = await db.get_book_by_id(book_id)
-    is_favorite = not is_favorite  # Инвертируем состояние
+    if is_favorite is None:
+        await callback.answer("Не удалось изменить избранное ❌")
+        return
     
-    keyboard = InlineKeyboardMarkup(inline_keyboard=[
-        [InlineKeyboardButton(
-            text="💔 Удалить из избранного" if is_favorite else "❤️ Добавить в избранное",
-            callback_data=f"toggle_favorite_{book_id}"
-        )],
-        [InlineKeyboardButton(text="🔙 Назад", callback_data=f"genre_{book['genre']}_0")]
-    ])
+    if is_favorite:
+        await callback.answer("Книга добавлена в избранное ❤️")
+    else:
+        await callback.answer("Книга удалена из избранного ❌")
     
-    await callback.message.edit_reply_markup(reply_markup=keyboard)
+    # Обновляем кнопки - те же, что в карточке книги, с новым состоянием избранного
+    await callback.message.edit_reply_markup(reply_markup=build_book_card_keyboard(book, is_favorite))
 
 @router.message(F.text == "🔍 Поиск книг")
 async def search_books_start(message: Message, state: FSMContext):
@@ -213,34 +272,76 @@ async def search_books_start(message: Message, state: FSMContext):
     await message.answer("Введите название книги для поиска:")
     await state.set_state(SearchStates.waiting_for_search_query)
 
+def build_search_page(query: str, books: list, page: int,
+                      favorite_ids: set = frozenset()) -> tuple[str, InlineKeyboardMarkup]:
+    """Текст и клавиатура страницы результатов поиска; книги из favorite_ids отмечаются ❤️"""
+    has_next = len(books) > SEARCH_PAGE_SIZE
+    books = books[:SEARCH_PAGE_SIZE]
+    
+    text = f"🔍 Результаты поиска для '{query}':\n\n"
+    keyboard_buttons = []
+    
+    for book in books:
+        mark = '❤️' if book.id in favorite_ids else '📖'
+        text += f"{mark} {book.title} - {book.author} ({book.year})\n"
+        keyboard_buttons.append([
+            InlineKeyboardButton(
+                text=f"{mark} {book.title}", 
+                callback_data=f"book_action_{book.id}"
+            )
+        ])
+    
+    # Кнопки навигации по страницам
+    nav_buttons = []
+    if page > 0:
+        nav_buttons.append(InlineKeyboardButton(text="⬅️ Назад", callback_data=f"search_page_{page-1}"))
+    if has_next:
+        nav_buttons.append(InlineKeyboardButton(text="➡️ Далее", callback_data=f"search_page_{page+1}"))
+    if nav_buttons:
+        keyboard_buttons.append(nav_buttons)
+    
+    return text, InlineKeyboardMarkup(inline_keyboard=keyboard_buttons)
+
 @router.message(StateFilter(SearchStates.waiting_for_search_query))
-async def search_books_process(message: Message, state: FSMContext):
+async def search_books_process(message: Message, state: FSMContext, db: DatabaseManager):
     """Обработка поиска книг"""
     query = message.text.strip()
-    books = await db.search_books_by_title(query)
+    # Берем на одну книгу больше, чтобы понять, есть ли следующая страница
+    books = await db.search_books_by_title(query, limit=SEARCH_PAGE_SIZE + 1)
+    
+    await state.set_state(None)
     
     if not books:
         await message.answer("Книги не найдены 😔\nПопробуйте изменить запрос.")
-    else:
-        text = f"🔍 Результаты поиска для '{query}':\n\n"
-        keyboard_buttons = []
-        
-        for book in books[:10]:  # Показываем максимум 10 результатов
-            text += f"📖 {book['title']} - {book['author']} ({book['year']})\n"
-            keyboard_buttons.append([
-                InlineKeyboardButton(
-                    text=f"📖 {book['title']}", 
-                    callback_data=f"book_action_{book['id']}"
-                )
-            ])
-        
-        keyboard = InlineKeyboardMarkup(inline_keyboard=keyboard_buttons)
-        await message.answer(text, reply_markup=keyboard)
+        return
+    
+    # Запрос сохраняем для перелистывания страниц
+    await state.update_data(search_query=query)
+    favorite_ids = await db.favorite_book_ids(message.from_user.id, [book.id for book in books])
+    text, keyboard = build_search_page(query, books, page=0, favorite_ids=favorite_ids)
+    await message.answer(text, reply_markup=keyboard)
+
+@router.callback_query(F.data.startswith("search_page_"))
+async def search_books_page(callback: CallbackQuery, state: FSMContext, db: DatabaseManager):
+    """Перелистывание результатов поиска"""
+    page = int(callback.data.split("_")[2])
+    query = (await state.get_data()).get('search_query')
+    
+    if not query:
+        await callback.answer("Поиск устарел, введите запрос заново 🔍")
+        return
     
-    await state.clear()
+    books = await db.search_books_by_title(query, limit=SEARCH_PAGE_SIZE + 1, offset=page * SEARCH_PAGE_SIZE)
+    if not books:
+        await callback.answer("Больше результатов нет")
+        return
+    
+    favorite_ids = await db.favorite_book_ids(callback.from_user.id, [book.id for book in books])
+    text, keyboard = build_search_page(query, books, page, favorite_ids)
+    await callback.message.edit_text(text, reply_markup=keyboard)
 
 @router.callback_query(F.data == "add_favorite")
-async def add_favorite_from_profile(callback: CallbackQuery):
+async def add_favorite_from_profile(callback: CallbackQuery, db: DatabaseManager):
     """Добавление в избранное из профиля"""
     books = await db.get_all_books(limit=10)
     
@@ -252,11 +353,11 @@ async def add_favorite_from_profile(callback: CallbackQuery):
     text = "Выберите книгу для добавления в избранное:\n\n"
     
     for book in books:
-        text += f"📖 {book['title']} - {book['author']}\n"
+        text += f"📖 {book.title} - {book.author}\n"
         keyboard_buttons.append([
             InlineKeyboardButton(
-                text=f"➕ {book['title']}", 
-                callback_data=f"add_to_fav_{book['id']}"
+                text=f"➕ {book.title}", 
+                callback_data=f"add_to_fav_{book.id}"
             )
         ])
     
@@ -265,7 +366,7 @@ async def add_favorite_from_profile(callback: CallbackQuery):
     await callback.message.edit_text(text, reply_markup=keyboard)
 
 @router.callback_query(F.data.startswith("add_to_fav_"))
-async def add_to_favorites_process(callback: CallbackQuery):
+async def add_to_favorites_process(callback: CallbackQuery, db: DatabaseManager):
     """Обработка добавления в избранное"""
     book_id = int(callback.data.split("_")[3])
     user_id = callback.from_user.id
@@ -278,7 +379,7 @@ async def add_to_favorites_process(callback: CallbackQuery):
         await callback.answer("Книга уже в избранном или произошла ошибка ❌")
 
 @router.callback_query(F.data == "remove_favorite")
-async def remove_favorite_from_profile(callback: CallbackQuery):
+async def remove_favorite_from_profile(callback: CallbackQuery, db: DatabaseManager):
     """Удаление из избранного из профиля"""
     user_id = callback.from_user.id
     favorite_books = await db.get_user_favorite_books(user_id)
@@ -291,11 +392,11 @@ async def remove_favorite_from_profile(callback: CallbackQuery):
     text = "Выберите книгу для удаления из избранного:\n\n"
     
     for book in favorite_books:
-        text += f"📖 {book['title']} - {book['author']}\n"
+        text += f"📖 {book.title} - {book.author}\n"
         keyboard_buttons.append([
             InlineKeyboardButton(
-                text=f"➖ {book['title']}", 
-                callback_data=f"remove_from_fav_{book['id']}"
+                text=f"➖ {book.title}", 
+                callback_data=f"remove_from_fav_{book.id}"
             )
         ])
     
@@ -304,7 +405,7 @@ async def remove_favorite_from_profile(callback: CallbackQuery):
     await callback.message.edit_text(text, reply_markup=keyboard)
 
 @router.callback_query(F.data.startswith("remove_from_fav_"))
-async def remove_from_favorites_process(callback: CallbackQuery):
+async def remove_from_favorites_process(callback: CallbackQuery, db: DatabaseManager):
     """Обработка удаления из избранного"""
     book_id = int(callback.data.split("_")[3])
     user_id = callback.from_user.id
@@ -317,9 +418,9 @@ async def remove_from_favorites_process(callback: CallbackQuery):
         await callback.answer("Произошла ошибка при удалении ❌")
 
 @router.callback_query(F.data == "back_to_profile")
-async def back_to_profile(callback: CallbackQuery):
+async def back_to_profile(callback: CallbackQuery, db: DatabaseManager):
     """Возврат к профилю"""
-    await my_profile(callback.message)
+    await my_profile(callback.message, db)
 
 @router.message(F.text == "🔙 Главное меню")
 async def main_menu(message: Message):
@@ -0,0 +1,40 @@
+# import_catalog.py - Импорт каталога книг из CSV/JSONL из командной строки
+import argparse
+import asyncio
+
+from config import Config
+from database.database import DatabaseManager
+from database.importer import detect_format, import_books
+
+async def run_import(path: str, fmt: str, batch_size: int):
+    """Импорт файла с выводом прогресса после каждой пачки"""
+    db = DatabaseManager()
+    await db.init_db()
+    
+    async def report(stats):
+        print(
+            f"⏳ Прочитано: {stats['read']}, добавлено: {stats['inserted']}, "
+            f"дублей: {stats['duplicates']}, с ошибками: {stats['invalid']}",
+            end='\r', flush=True
+        )
+    
+    try:
+        with open(path, encoding='utf-8-sig', newline='') as stream:
+            stats = await import_books(db, stream, fmt, batch_size, report)
+    finally:
+        await db.close()
+    
+    print()
+    print(f"✅ Импорт завершен: добавлено {stats['inserted']} из {stats['read']} записей")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Импорт книг из CSV или JSONL")
+    parser.add_argument('path', help="файл с колонками/ключами title, author, year, description, genre, subgenre")
+    parser.add_argument('--format', choices=('csv', 'jsonl'), help="по умолчанию - по расширению файла")
+    parser.add_argument('--batch-size', type=int, default=Config.IMPORT_BATCH_SIZE)
+    args = parser.parse_args()
+    
+    fmt = args.format or detect_format(args.path)
+    if fmt is None:
+        parser.error("не удалось определить формат файла, укажите --format")
+    asyncio.run(run_import(args.path, fmt, args.batch_size))
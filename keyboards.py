@@ -1,6 +1,9 @@
 # keyboards.py - Модуль клавиатур
 from aiogram.types import ReplyKeyboardMarkup, KeyboardButton, InlineKeyboardMarkup, InlineKeyboardButton
 
+from config import Config
+from utils import get_genre_emoji
+
 def get_main_keyboard(is_admin: bool = False) -> ReplyKeyboardMarkup:
     """Основная клавиатура пользователя"""
     buttons = [
@@ -18,10 +21,10 @@ def get_main_keyboard(is_admin: bool = False) -> ReplyKeyboardMarkup:
     )
 
 def get_genres_keyboard() -> InlineKeyboardMarkup:
-    """Клавиатура выбора жанров"""
+    """Клавиатура выбора жанров (жанры каталога - Config.GENRES)"""
     return InlineKeyboardMarkup(inline_keyboard=[
-        [InlineKeyboardButton(text="📚 Литература", callback_data="genre_Литература_0")],
-        [InlineKeyboardButton(text="💻 Тех литература", callback_data="genre_Тех литература_0")]
+        [InlineKeyboardButton(text=f"{get_genre_emoji(genre)} {genre}", callback_data=f"genre_{genre}_0")]
+        for genre in Config.GENRES
     ])
 
 def get_admin_keyboard() -> ReplyKeyboardMarkup:
@@ -29,8 +32,10 @@ def get_admin_keyboard() -> ReplyKeyboardMarkup:
     return ReplyKeyboardMarkup(
         keyboard=[
             [KeyboardButton(text="➕ Добавить книгу")],
+            [KeyboardButton(text="📥 Импорт книг")],
             [KeyboardButton(text="✏️ Редактировать книги")],
             [KeyboardButton(text="📊 Статистика")],
+            [KeyboardButton(text="📣 Рассылка")],
             [KeyboardButton(text="🔙 Главное меню")]
         ],
         resize_keyboard=True,
@@ -92,36 +97,28 @@ def get_confirm_delete_keyboard(book_id: int) -> InlineKeyboardMarkup:
         [InlineKeyboardButton(text="❌ Отмена", callback_data=f"edit_book_{book_id}")]
     ])
 
-def get_genre_selection_keyboard() -> InlineKeyboardMarkup:
-    """Клавиатура выбора жанра при добавлении книги"""
+def get_broadcast_confirm_keyboard() -> InlineKeyboardMarkup:
+    """Клавиатура подтверждения рассылки"""
     return InlineKeyboardMarkup(inline_keyboard=[
-        [InlineKeyboardButton(text="📚 Литература", callback_data="admin_genre_Литература")],
-        [InlineKeyboardButton(text="💻 Тех литература", callback_data="admin_genre_Тех литература")]
+        [InlineKeyboardButton(text="✅ Отправить всем", callback_data="broadcast_confirm")],
+        [InlineKeyboardButton(text="❌ Отмена", callback_data="broadcast_cancel")]
     ])
 
-def get_literature_subgenres_keyboard() -> InlineKeyboardMarkup:
-    """Поджанры литературы"""
+def get_genre_selection_keyboard() -> InlineKeyboardMarkup:
+    """Клавиатура выбора жанра при добавлении книги"""
     return InlineKeyboardMarkup(inline_keyboard=[
-        [InlineKeyboardButton(text="📖 Художественная", callback_data="admin_subgenre_Художественная")],
-        [InlineKeyboardButton(text="📚 Классическая", callback_data="admin_subgenre_Классическая")],
-        [InlineKeyboardButton(text="🕵️ Детектив", callback_data="admin_subgenre_Детектив")],
-        [InlineKeyboardButton(text="💝 Роман", callback_data="admin_subgenre_Роман")],
-        [InlineKeyboardButton(text="🚀 Фантастика", callback_data="admin_subgenre_Фантастика")],
-        [InlineKeyboardButton(text="🎭 Драма", callback_data="admin_subgenre_Драма")],
-        [InlineKeyboardButton(text="⏭️ Пропустить", callback_data="admin_subgenre_")]
+        [InlineKeyboardButton(text=f"{get_genre_emoji(genre)} {genre}", callback_data=f"admin_genre_{genre}")]
+        for genre in Config.GENRES
     ])
 
-def get_technical_subgenres_keyboard() -> InlineKeyboardMarkup:
-    """Поджанры технической литературы"""
-    return InlineKeyboardMarkup(inline_keyboard=[
-        [InlineKeyboardButton(text="💻 Программирование", callback_data="admin_subgenre_Программирование")],
-        [InlineKeyboardButton(text="🔧 Инженерия", callback_data="admin_subgenre_Инженерия")],
-        [InlineKeyboardButton(text="🔬 Наука", callback_data="admin_subgenre_Наука")],
-        [InlineKeyboardButton(text="🏗️ Архитектура", callback_data="admin_subgenre_Архитектура")],
-        [InlineKeyboardButton(text="📊 Экономика", callback_data="admin_subgenre_Экономика")],
-        [InlineKeyboardButton(text="🏥 Медицина", callback_data="admin_subgenre_Медицина")],
-        [InlineKeyboardButton(text="⏭️ Пропустить", callback_data="admin_subgenre_")]
-    ])
+def get_subgenres_keyboard(genre: str) -> InlineKeyboardMarkup:
+    """Поджанры жанра при добавлении книги"""
+    buttons = [
+        [InlineKeyboardButton(text=f"{get_genre_emoji(subgenre)} {subgenre}", callback_data=f"admin_subgenre_{subgenre}")]
+        for subgenre in Config.GENRES.get(genre, ())
+    ]
+    buttons.append([InlineKeyboardButton(text="⏭️ Пропустить", callback_data="admin_subgenre_")])
+    return InlineKeyboardMarkup(inline_keyboard=buttons)
 
 def get_favorites_management_keyboard() -> InlineKeyboardMarkup:
     """Клавиатура управления избранным"""
@@ -7,6 +7,8 @@ from aiogram.fsm.storage.memory import MemoryStorage
 from config import Config
 from database.database import DatabaseManager
 from handlers import user, admin
+from broadcast import resume_broadcast, stop_broadcasts
+from middlewares.database import DatabaseMiddleware
 
 # Настройка логирования
 logging.basicConfig(
@@ -25,18 +27,39 @@ async def main():
     if not Config.ADMIN_IDS or Config.ADMIN_IDS == [0]:
         logger.warning("ADMIN_IDS не установлены! Функции администратора будут недоступны.")
     
+    # Инициализация базы данных - один движок и пул на весь процесс
+    db = DatabaseManager()
+    await db.init_db()
+    logger.info("База данных инициализирована")
+    
+    # Отчет о фактических настройках SQLite и фоновый checkpoint WAL
+    sqlite_settings = await db.get_sqlite_settings()
+    if sqlite_settings:
+        logger.info(f"Настройки SQLite: {sqlite_settings}")
+    
+    background_tasks = []
+    if str(sqlite_settings.get('journal_mode', '')).lower() == 'wal' and Config.SQLITE_WAL_CHECKPOINT_INTERVAL > 0:
+        background_tasks.append(asyncio.create_task(db.run_wal_checkpoints()))
+    
+    # Счетчики книг по жанрам и профили вкуса заполняет миграция, расхождения исправляет периодическая сверка
+    if Config.GENRE_COUNTS_RECONCILE_INTERVAL > 0:
+        background_tasks.append(asyncio.create_task(db.run_genre_counts_reconcile()))
+    
+    # Соседи книг по совместному избранному: расчет в фоне сразу после запуска
+    if Config.RECOMMENDER_REFRESH_INTERVAL > 0:
+        background_tasks.append(asyncio.create_task(db.run_recommender_refresh()))
+    
     # Инициализация бота и диспетчера
     bot = Bot(token=Config.BOT_TOKEN)
     dp = Dispatcher(storage=MemoryStorage())
+    dp.update.middleware(DatabaseMiddleware(db))
     
     # Подключение роутеров
     dp.include_router(user.router)
     dp.include_router(admin.router)
     
-    # Инициализация базы данных
-    db = DatabaseManager()
-    await db.init_db()
-    logger.info("База данных инициализирована")
+    # Рассылка, прерванная остановкой бота, продолжается с сохраненного места
+    await resume_broadcast(bot, db)
     
     # Информация о запуске
     logger.info("Бот запускается...")
@@ -50,7 +73,12 @@ async def main():
     except Exception as e:
         logger.error(f"Ошибка при работе бота: {e}")
     finally:
+        for task in background_tasks:
+            task.cancel()
+        await asyncio.gather(*background_tasks, return_exceptions=True)
+        await stop_broadcasts()
         await bot.session.close()
+        await db.close()
         logger.info("Бот завершил работу")
 
 if __name__ == "__main__":
@@ -0,0 +1,24 @@
+# middlewares/database.py - Передача общего менеджера БД и сессии апдейта в обработчики
+from typing import Any, Awaitable, Callable, Dict
+
+from aiogram import BaseMiddleware
+from aiogram.types import TelegramObject
+
+from database.database import DatabaseManager
+
+class DatabaseMiddleware(BaseMiddleware):
+    """Пробрасывает DatabaseManager в обработчики и открывает одну сессию на апдейт"""
+    
+    def __init__(self, db: DatabaseManager):
+        self.db = db
+    
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any]
+    ) -> Any:
+        data['db'] = self.db
+        # Все вызовы db внутри обработчика идут через эту сессию, коммит - один раз в конце
+        async with self.db.session_scope():
+            return await handler(event, data)
\ No newline at end of file
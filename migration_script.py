@@ -1,20 +1,36 @@
+# migration_script.py - Применение миграций схемы из командной строки
+import argparse
 import asyncio
-from sqlalchemy import text
+
 from database.database import DatabaseManager
+from database.migrations import LATEST_VERSION, MIGRATIONS, get_schema_version, migrate
 
-async def migrate_database():
-    """Миграция для добавления полей файлов"""
+async def run_migrations(target: int = None, status_only: bool = False):
+    """Применение недостающих миграций (или только вывод текущей версии)"""
     db = DatabaseManager()
+    try:
+        current = await get_schema_version(db)
+        print(f"Версия схемы: {current} из {LATEST_VERSION}")
+        if status_only:
+            for migration in MIGRATIONS:
+                mark = "✅" if migration.version <= current else "⏳"
+                print(f"{mark} {migration.version}. {migration.description}")
+            return
+        
+        applied = await migrate(db, target)
+    finally:
+        await db.close()
     
-    async with db.engine.begin() as conn:
-        try:
-            await conn.execute(text("ALTER TABLE books ADD COLUMN file_id VARCHAR(255)"))
-            await conn.execute(text("ALTER TABLE books ADD COLUMN file_name VARCHAR(255)"))
-            await conn.execute(text("ALTER TABLE books ADD COLUMN file_size INTEGER"))
-            await conn.execute(text("ALTER TABLE books ADD COLUMN file_type VARCHAR(50)"))
-            print("✅ Миграция успешно выполнена!")
-        except Exception as e:
-            print(f"❌ Ошибка миграции: {e}")
+    for migration in applied:
+        print(f"✅ {migration.version}. {migration.description}")
+    if not applied:
+        print("✅ Схема уже актуальна")
 
 if __name__ == "__main__":
-    asyncio.run(migrate_database())
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Миграции схемы базы данных")
+    parser.add_argument('--target', type=int, help="Применить миграции до этой версии включительно")
+    parser.add_argument('--status', action='store_true', help="Только показать примененные миграции")
+    args = parser.parse_args()
+    if args.target is not None and not 1 <= args.target <= LATEST_VERSION:
+        parser.error(f"--target должен быть от 1 до {LATEST_VERSION}")
+    asyncio.run(run_migrations(args.target, args.status))
\ No newline at end of file
@@ -14,6 +14,11 @@ class AdminStates(StatesGroup):
     edit_waiting_book_id = State()
     edit_waiting_field = State()
     edit_waiting_value = State()
+    
+    waiting_for_import_file = State()
+    
+    waiting_for_broadcast_text = State()
+    confirming_broadcast = State()
 
 class SearchStates(StatesGroup):
     """Состояния для поиска книг"""
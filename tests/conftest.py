@@ -0,0 +1,27 @@
+# tests/conftest.py - Общие фикстуры тестов
+import asyncio
+
+import pytest
+
+from database.database import DatabaseManager
+
+@pytest.fixture
+def db_url(tmp_path) -> str:
+    """Отдельный файл SQLite на тест"""
+    return f"sqlite+aiosqlite:///{tmp_path / 'bot.db'}"
+
+@pytest.fixture
+def with_db(db_url):
+    """Запуск сценария scenario(db) на свежей базе со всеми миграциями; пул закрывается после сценария"""
+    def run(scenario):
+        async def main():
+            db = DatabaseManager(db_url)
+            await db.init_db()
+            try:
+                return await scenario(db)
+            finally:
+                await db.close()
+        
+        return asyncio.run(main())
+    
+    return run
@@ -0,0 +1,46 @@
+# tests/test_book_card.py - Клавиатура карточки книги одинакова при открытии и после нажатия ❤️
+from types import SimpleNamespace
+
+import pytest
+
+from config import Config
+from handlers.user import toggle_favorite
+
+class FakeCallback:
+    """CallbackQuery без Telegram: запоминает ответ и новую клавиатуру"""
+    
+    def __init__(self, data: str, user_id: int):
+        self.data = data
+        self.from_user = SimpleNamespace(id=user_id)
+        self.answers = []
+        self.markup = None
+        self.message = SimpleNamespace(edit_reply_markup=self._edit_reply_markup)
+    
+    async def answer(self, text):
+        self.answers.append(text)
+    
+    async def _edit_reply_markup(self, reply_markup):
+        self.markup = reply_markup
+
+def callbacks(markup):
+    return [button.callback_data for row in markup.inline_keyboard for button in row]
+
+@pytest.fixture
+def direct_favorites(monkeypatch):
+    monkeypatch.setattr(Config, 'FAVORITES_WRITE_DELAY', 0.0)
+
+def test_toggle_keeps_every_card_action(with_db, direct_favorites):
+    async def scenario(db):
+        await db.add_user(1)
+        book_id = await db.add_book("Книга", "Автор", 2000, "", "Литература",
+                                    file_id="file", file_name="book.pdf", file_size=1024, file_type="pdf")
+        callback = FakeCallback(f"toggle_favorite_{book_id}", user_id=1)
+        await toggle_favorite(callback, db)
+        return book_id, callback
+    
+    book_id, callback = with_db(scenario)
+    assert callback.answers == ["Книга добавлена в избранное ❤️"]
+    assert callbacks(callback.markup) == [
+        f"toggle_favorite_{book_id}", f"download_file_{book_id}", f"similar_{book_id}", "genre_Литература_0"
+    ]
+    assert callback.markup.inline_keyboard[0][0].text == "💔 Удалить из избранного"
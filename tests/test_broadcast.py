@@ -0,0 +1,85 @@
+# tests/test_broadcast.py - Рассылка: общий лимит скорости, курсор по пользователям, статус после ошибки
+import asyncio
+import time
+from types import SimpleNamespace
+
+from broadcast import BroadcastEngine, TokenBucket
+
+class FakeBot:
+    """Записывает отправленные сообщения вместо Telegram"""
+    
+    def __init__(self):
+        self.sent = []
+    
+    async def send_message(self, chat_id, text):
+        self.sent.append(chat_id)
+        return SimpleNamespace(message_id=len(self.sent))
+    
+    async def edit_message_text(self, text, chat_id, message_id):
+        pass
+
+def test_token_bucket_limits_rate():
+    async def scenario():
+        bucket = TokenBucket(rate=100)
+        started = time.monotonic()
+        for _ in range(21):
+            await bucket.acquire()
+        return time.monotonic() - started
+    
+    # Первый токен сразу, остальные 20 - не быстрее 100 в секунду
+    assert asyncio.run(scenario()) >= 0.19
+
+def test_token_bucket_pause_delays_everyone():
+    async def scenario():
+        bucket = TokenBucket(rate=1000)
+        await bucket.acquire()
+        bucket.pause(0.1)
+        started = time.monotonic()
+        await asyncio.gather(bucket.acquire(), bucket.acquire())
+        return time.monotonic() - started
+    
+    assert asyncio.run(scenario()) >= 0.1
+
+def test_broadcast_reaches_every_user_once(with_db):
+    bot = FakeBot()
+    
+    async def scenario(db):
+        for telegram_id in range(100, 125):
+            await db.add_user(telegram_id)
+        broadcast = await db.create_broadcast("Новости", admin_chat_id=1)
+        await BroadcastEngine(bot, db, broadcast, rate=1000, workers=4, chunk_size=10).run()
+        return await db.get_active_broadcast()
+    
+    assert with_db(scenario) is None
+    users = [chat_id for chat_id in bot.sent if chat_id != 1]
+    assert sorted(users) == list(range(100, 125))
+
+def test_failed_broadcast_does_not_block_new_ones(with_db):
+    bot = FakeBot()
+    
+    async def scenario(db):
+        for telegram_id in range(100, 125):
+            await db.add_user(telegram_id)
+        broadcast = await db.create_broadcast("Новости", admin_chat_id=1)
+        
+        get_users_after = db.get_users_after
+        
+        async def failing_get_users_after(after_id, limit):
+            if after_id:
+                raise RuntimeError("database is locked")
+            return await get_users_after(after_id, limit)
+        
+        db.get_users_after = failing_get_users_after
+        await BroadcastEngine(bot, db, broadcast, rate=1000, workers=4, chunk_size=10).run()
+        db.get_users_after = get_users_after
+        
+        active = await db.get_active_broadcast()
+        async with db.session_maker() as session:
+            stored = await session.get(type(broadcast), broadcast.id)
+        return active, stored
+    
+    active, stored = with_db(scenario)
+    assert active is None
+    assert (stored.status, stored.sent, stored.last_user_id) == ('failed', 10, 10)
+    # Администратор получил сообщение об ошибке
+    assert bot.sent[-1] == 1
@@ -0,0 +1,33 @@
+# tests/test_delete_books.py - Удаление книг: каскад избранного в БД и сброс in-process состояния
+import pytest
+
+from config import Config
+
+@pytest.fixture
+def direct_favorites(monkeypatch):
+    monkeypatch.setattr(Config, 'FAVORITES_WRITE_DELAY', 0.0)
+
+def test_delete_books_cascades_favorites(with_db, direct_favorites):
+    async def scenario(db):
+        await db.add_user(1, 'reader')
+        kept = await db.add_book("Остается", "Автор", 2000, "", "Литература")
+        removed = [await db.add_book(f"Удаляется {i}", "Автор", 2001, "", "Литература") for i in range(2)]
+        for book_id in [kept, *removed]:
+            await db.add_to_favorites(1, book_id)
+        # Множество избранного загружено в кэш до удаления
+        assert await db.is_book_in_favorites(1, removed[0])
+        epoch = db._favorites_epoch
+        
+        deleted = await db.delete_books(removed + [10 ** 6])
+        stats = await db.get_catalog_stats(ttl=0)
+        return (deleted, db._favorites_epoch > epoch, await db.is_book_in_favorites(1, removed[0]),
+                [book.id for book in await db.get_user_favorite_books(1)], kept, stats,
+                await db.reconcile_genre_affinity())
+    
+    deleted, epoch_bumped, still_favorite, favorites, kept, stats, affinity_drift = with_db(scenario)
+    assert deleted == 2
+    assert epoch_bumped
+    assert not still_favorite
+    assert favorites == [kept]
+    assert stats['total_favorites'] == 1
+    assert affinity_drift == 0
@@ -0,0 +1,53 @@
+# tests/test_exporter.py - Потоковая выгрузка каталога и пользователей; выгрузка читается импортом
+import gzip
+import json
+
+import pytest
+
+from database.exporter import EXPORT_FIELDS, export_rows
+from database.importer import import_books
+
+BOOKS = [
+    ("Война и мир", "Лев Толстой", 1869, "Роман-эпопея, \"в кавычках\"\nи с переводом строки", "Литература", "Классическая"),
+    ("Чистый код", "Роберт Мартин", 2008, "", "Тех литература", "Программирование"),
+    ("Без поджанра", "Автор", 2020, "Описание", "Литература", None),
+]
+
+@pytest.mark.parametrize('fmt', ['csv', 'jsonl'])
+def test_exported_catalog_imports_back(with_db, tmp_path, db_url, fmt):
+    path = tmp_path / f"books.{fmt}.gz"
+    
+    async def export_scenario(db):
+        for title, author, year, description, genre, subgenre in BOOKS:
+            await db.add_book(title, author, year, description, genre, subgenre)
+        return await export_rows(db.stream_books(batch_size=2), EXPORT_FIELDS['books'], str(path), fmt, compress=True)
+    
+    assert with_db(export_scenario) == len(BOOKS)
+    
+    async def import_scenario(db):
+        # В тот же каталог - все книги дубли; в пустой - все добавляются
+        with gzip.open(path, 'rt', encoding='utf-8', newline='') as stream:
+            same = await import_books(db, stream, fmt)
+        await db.delete_books([book.id for book in await db.get_all_books()])
+        with gzip.open(path, 'rt', encoding='utf-8', newline='') as stream:
+            fresh = await import_books(db, stream, fmt)
+        books = [await db.get_book_by_id(book.id) for book in await db.get_all_books()]
+        return same, fresh, books
+    
+    same, fresh, books = with_db(import_scenario)
+    assert same['duplicates'] == len(BOOKS) and same['invalid'] == 0
+    assert fresh['inserted'] == len(BOOKS)
+    assert sorted((b.title, b.author, b.year, b.description, b.genre, b.subgenre) for b in books) == sorted(BOOKS)
+
+def test_export_users_jsonl(with_db, tmp_path):
+    path = tmp_path / "users.jsonl"
+    
+    async def scenario(db):
+        for telegram_id in (30, 10, 20):
+            await db.add_user(telegram_id, f"user{telegram_id}")
+        return await export_rows(db.stream_users(batch_size=2), EXPORT_FIELDS['users'], str(path), 'jsonl')
+    
+    assert with_db(scenario) == 3
+    rows = [json.loads(line) for line in path.read_text(encoding='utf-8').splitlines()]
+    assert [row['telegram_id'] for row in rows] == [30, 10, 20]
+    assert set(rows[0]) == {'id', 'telegram_id', 'username'}
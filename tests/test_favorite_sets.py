@@ -0,0 +1,46 @@
+# tests/test_favorite_sets.py - Множества избранного в памяти и учет их объема в кэше
+import pytest
+
+from config import Config
+from database.cache import LRUCache
+
+def test_lru_cache_evicts_by_bytes():
+    cache = LRUCache(maxsize=10, max_bytes=100, sizeof=len)
+    cache.set('a', 'x' * 60)
+    cache.set('b', 'y' * 30)
+    cache.set('c', 'z' * 30)
+    assert cache.get('a') is None
+    assert cache.current_bytes == 60
+    # Значение больше лимита не кэшируется
+    cache.set('d', 'w' * 200)
+    assert cache.get('d') is None
+
+@pytest.fixture
+def direct_favorites(monkeypatch):
+    monkeypatch.setattr(Config, 'FAVORITES_WRITE_DELAY', 0.0)
+
+def test_favorite_set_changes_update_cache_bytes(with_db, direct_favorites):
+    async def scenario(db):
+        user_id = await db.add_user(1, 'reader')
+        book_ids = [await db.add_book(f"Книга {i}", "Автор", 2000, "", "Литература") for i in range(300)]
+        
+        await db.add_to_favorites(1, book_ids[0])
+        # Первая проверка загружает множество в кэш
+        assert await db.is_book_in_favorites(1, book_ids[0])
+        empty_bytes = db._favorite_ids.current_bytes
+        
+        for book_id in book_ids[1:]:
+            assert await db.toggle_favorite(1, book_id) is True
+        cached = db._favorite_ids.get(user_id)
+        full = (len(cached), db._favorite_ids.current_bytes, db._favorite_ids.sizeof(cached))
+        
+        for book_id in book_ids[1:]:
+            assert await db.toggle_favorite(1, book_id) is False
+        final = (len(cached), db._favorite_ids.current_bytes, db._favorite_ids.sizeof(cached))
+        return empty_bytes, full, final
+    
+    empty_bytes, (count, full_bytes, full_size), (final_count, final_bytes, final_size) = with_db(scenario)
+    assert count == 300
+    assert full_bytes == full_size > empty_bytes
+    assert final_count == 1
+    assert final_bytes == final_size
@@ -0,0 +1,19 @@
+# tests/test_genre_counts.py - Поддерживаемые счетчики книг по жанрам
+
+def test_genre_counts_follow_book_writes(with_db):
+    async def scenario(db):
+        book_id = await db.add_book("Книга", "Автор", 2000, "", "Литература", "Детектив")
+        await db.add_book("Книга 2", "Автор", 2001, "", "Литература")
+        before = await db.get_books_count_by_genre("Литература")
+        await db.update_book_field(book_id, 'genre', "Тех литература")
+        moved = (await db.get_books_count_by_genre("Литература"), await db.get_books_count_by_genre("Тех литература"))
+        await db.delete_book(book_id)
+        after = await db.get_books_count_by_genre("Тех литература")
+        drift = await db.reconcile_genre_counts()
+        return before, moved, after, drift
+    
+    before, moved, after, drift = with_db(scenario)
+    assert before == 2
+    assert moved == (1, 1)
+    assert after == 0
+    assert drift == 0
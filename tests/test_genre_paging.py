@@ -0,0 +1,22 @@
+# tests/test_genre_paging.py - Страницы жанра по курсору (year, id)
+
+def test_keyset_pages_cover_genre_without_gaps(with_db):
+    async def scenario(db):
+        # Одинаковые годы проверяют, что курсор различает книги по id
+        for index in range(7):
+            await db.add_book(f"Книга {index}", "Автор", 2000 + index // 2, "", "Литература")
+        await db.add_book("Чужой жанр", "Автор", 2005, "", "Тех литература")
+        
+        first = await db.get_books_by_genre("Литература", limit=3)
+        second = await db.get_books_by_genre("Литература", limit=3, after=(first[-1].year, first[-1].id))
+        third = await db.get_books_by_genre("Литература", limit=3, after=(second[-1].year, second[-1].id))
+        back = await db.get_books_by_genre("Литература", limit=3, before=(second[0].year, second[0].id))
+        return first, second, third, back
+    
+    first, second, third, back = with_db(scenario)
+    pages = first + second + third
+    assert len(pages) == 7
+    assert len({book.id for book in pages}) == 7
+    assert [(book.year, book.id) for book in pages] == sorted(((b.year, b.id) for b in pages), reverse=True)
+    # Шаг назад от второй страницы возвращает первую в том же порядке
+    assert back == first
@@ -0,0 +1,59 @@
+# tests/test_importer.py - Потоковый импорт каталога: проверка записей, дубли, пачки
+import io
+import json
+
+from database.importer import detect_format, import_books, validate_record
+
+def record(**fields):
+    base = {'title': "Книга", 'author': "Автор", 'year': "2001", 'description': "", 'genre': "Литература"}
+    base.update(fields)
+    return base
+
+def test_detect_format():
+    assert detect_format("books.CSV") == 'csv'
+    assert detect_format("books.ndjson") == 'jsonl'
+    assert detect_format("books.xlsx") is None
+
+def test_validate_record_normalizes_fields():
+    assert validate_record(record(title="  Книга\t1 ", subgenre="")) == {
+        'title': "Книга 1", 'author': "Автор", 'year': 2001, 'description': "",
+        'genre': "Литература", 'subgenre': None
+    }
+    assert validate_record(record(genre="Тех литература", subgenre="Наука"))['subgenre'] == "Наука"
+
+def test_validate_record_rejects_bad_rows():
+    assert validate_record(None) is None
+    assert validate_record(record(author="")) is None
+    assert validate_record(record(year="не год")) is None
+
+def test_validate_record_accepts_only_manual_entry_genres():
+    # Жанры вне меню недоступны пользователям, "_" ломает callback_data genre_<жанр>_<страница>
+    assert validate_record(record(genre="Поэзия")) is None
+    assert validate_record(record(genre="Лите_ратура")) is None
+    assert validate_record(record(genre="Литература" * 10)) is None
+    # Поджанр чужого жанра
+    assert validate_record(record(subgenre="Программирование")) is None
+
+def test_import_counts_invalid_genres_and_duplicates(with_db):
+    lines = [
+        json.dumps(record(title="Первая"), ensure_ascii=False),
+        json.dumps(record(title="ПЕРВАЯ"), ensure_ascii=False),
+        json.dumps(record(title="Вторая", genre="Комиксы"), ensure_ascii=False),
+        "{битая строка",
+        json.dumps(record(title="Третья", genre="Тех литература", subgenre="Наука"), ensure_ascii=False),
+    ]
+    progress = []
+    
+    async def report(stats):
+        progress.append(dict(stats))
+    
+    async def scenario(db):
+        stats = await import_books(db, io.StringIO('\n'.join(lines)), 'jsonl', batch_size=2, progress=report)
+        again = await import_books(db, io.StringIO('\n'.join(lines)), 'jsonl', batch_size=2)
+        return stats, again, await db.get_genre_counts()
+    
+    stats, again, counts = with_db(scenario)
+    assert stats == {'read': 5, 'inserted': 2, 'duplicates': 1, 'invalid': 2}
+    assert len(progress) == 3
+    assert again == {'read': 5, 'inserted': 0, 'duplicates': 3, 'invalid': 2}
+    assert counts == {("Литература", ''): 1, ("Тех литература", "Наука"): 1}
@@ -0,0 +1,15 @@
+from config import Config
+from keyboards import get_genres_keyboard, get_genre_selection_keyboard, get_subgenres_keyboard
+
+
+def callbacks(keyboard):
+    return [button.callback_data for row in keyboard.inline_keyboard for button in row]
+
+
+def test_genre_keyboards_follow_config():
+    assert callbacks(get_genres_keyboard()) == [f"genre_{genre}_0" for genre in Config.GENRES]
+    assert callbacks(get_genre_selection_keyboard()) == [f"admin_genre_{genre}" for genre in Config.GENRES]
+    
+    for genre, subgenres in Config.GENRES.items():
+        expected = [f"admin_subgenre_{subgenre}" for subgenre in subgenres] + ["admin_subgenre_"]
+        assert callbacks(get_subgenres_keyboard(genre)) == expected
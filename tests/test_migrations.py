@@ -0,0 +1,111 @@
+# tests/test_migrations.py - Версионированные миграции: новые базы, базы исходной версии бота, --target
+import asyncio
+import os
+import sqlite3
+import subprocess
+import sys
+from pathlib import Path
+
+import pytest
+
+from database.database import DatabaseManager
+from database.migrations import LATEST_VERSION, MIGRATIONS, get_schema_version, migrate
+
+ROOT = Path(__file__).resolve().parent.parent
+
+# Схема исходной версии бота: без ключей поиска, уникального индекса избранного и каскада
+LEGACY_SCHEMA = """
+CREATE TABLE users (id INTEGER PRIMARY KEY, telegram_id INTEGER NOT NULL UNIQUE, username VARCHAR(255));
+CREATE TABLE books (
+    id INTEGER PRIMARY KEY, title VARCHAR(500) NOT NULL, author VARCHAR(255) NOT NULL,
+    year INTEGER NOT NULL, description TEXT NOT NULL, genre VARCHAR(100) NOT NULL, subgenre VARCHAR(100)
+);
+CREATE TABLE favorite_books (
+    id INTEGER PRIMARY KEY,
+    user_id INTEGER NOT NULL REFERENCES users (id),
+    book_id INTEGER NOT NULL REFERENCES books (id)
+);
+INSERT INTO users (id, telegram_id, username) VALUES (1, 100, 'reader');
+INSERT INTO books (id, title, author, year, description, genre, subgenre) VALUES
+    (1, 'Ёлки-палки', 'Иван Иванов', 2001, 'Описание', 'Литература', 'Роман'),
+    (2, 'Python', 'Петр Петров', 2010, 'Учебник', 'Тех литература', NULL);
+INSERT INTO favorite_books (id, user_id, book_id) VALUES (1, 1, 1), (2, 1, 1), (3, 1, 2);
+"""
+
+def run(scenario, url):
+    async def main():
+        db = DatabaseManager(url)
+        try:
+            return await scenario(db)
+        finally:
+            await db.close()
+    
+    return asyncio.run(main())
+
+def test_versions_are_contiguous():
+    assert [migration.version for migration in MIGRATIONS] == list(range(1, LATEST_VERSION + 1))
+
+def test_fresh_database_reaches_latest_version(db_url):
+    async def scenario(db):
+        applied = await migrate(db)
+        again = await migrate(db)
+        return [m.version for m in applied], again, await get_schema_version(db)
+    
+    applied, again, version = run(scenario, db_url)
+    assert applied == list(range(1, LATEST_VERSION + 1))
+    assert again == []
+    assert version == LATEST_VERSION
+
+def test_partial_target_then_rest(db_url):
+    async def scenario(db):
+        first = await migrate(db, target=3)
+        version = await get_schema_version(db)
+        rest = await migrate(db)
+        return [m.version for m in first], version, [m.version for m in rest]
+    
+    first, version, rest = run(scenario, db_url)
+    assert first == [1, 2, 3]
+    assert version == 3
+    assert rest == list(range(4, LATEST_VERSION + 1))
+
+@pytest.mark.parametrize('target', [0, -1, LATEST_VERSION + 1, 20])
+def test_target_outside_known_versions_is_rejected(db_url, target):
+    async def scenario(db):
+        await migrate(db)
+        with pytest.raises(ValueError):
+            await migrate(db, target=target)
+        return await get_schema_version(db)
+    
+    assert run(scenario, db_url) == LATEST_VERSION
+
+def test_legacy_database_is_upgraded_in_place(tmp_path, db_url):
+    with sqlite3.connect(tmp_path / 'bot.db') as conn:
+        conn.executescript(LEGACY_SCHEMA)
+    
+    async def scenario(db):
+        await db.init_db()
+        favorites = [book.id for book in await db.get_user_favorite_books(100)]
+        found = [book.id for book in await db.search_books_by_title("елки")]
+        counts = dict(await db.get_genre_counts())
+        deleted = await db.delete_book(2)
+        after_delete = [book.id for book in await db.get_user_favorite_books(100)]
+        return await get_schema_version(db), favorites, found, counts, deleted, after_delete
+    
+    version, favorites, found, counts, deleted, after_delete = run(scenario, db_url)
+    assert version == LATEST_VERSION
+    # Дубль избранного удален, ключи поиска заполнены, счетчики жанров посчитаны
+    assert sorted(favorites) == [1, 2]
+    assert found == [1]
+    assert counts == {('Литература', 'Роман'): 1, ('Тех литература', ''): 1}
+    # Избранное удаленной книги удаляет каскад
+    assert deleted and after_delete == [1]
+
+@pytest.mark.parametrize('target', ['12', '0'])
+def test_cli_rejects_target_above_latest(tmp_path, target):
+    env = dict(os.environ, DATABASE_URL=f"sqlite+aiosqlite:///{tmp_path / 'bot.db'}")
+    result = subprocess.run(
+        [sys.executable, 'migration_script.py', '--target', target],
+        cwd=ROOT, env=env, capture_output=True, text=True
+    )
+    assert result.returncode == 2
+    assert '--target' in result.stderr
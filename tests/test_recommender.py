@@ -0,0 +1,75 @@
+# tests/test_recommender.py - Соседи книг: совместное избранное и TF-IDF индекс по тексту
+from config import Config
+from database.recommender import ContentIndex, cofavorite_neighbors
+
+DOCUMENTS = [
+    (1, "Основы программирования на Python", "Иванов", "Язык python для начинающих программистов"),
+    (2, "Python для анализа данных", "Петров", "Анализ данных на языке python"),
+    (3, "Садоводство", "Сидоров", "Огород и сад на даче"),
+    (4, "Сад и огород", "Смирнов", "Дача, сад, урожай"),
+]
+
+def test_cofavorite_neighbors_rank_by_cosine():
+    baskets = [[10, 11], [11, 10], [10, 12]]
+    neighbors = cofavorite_neighbors(baskets, top_k=5)
+    assert [other for other, _ in neighbors[10]] == [11, 12]
+    assert neighbors[11][0][1] > neighbors[12][0][1]
+
+def test_refresh_cofavorite_neighbors_in_process(with_db, monkeypatch):
+    monkeypatch.setattr(Config, 'FAVORITES_WRITE_DELAY', 0.0)
+    # Маленькие пачки курсора: корзина пользователя собирается из нескольких пачек
+    monkeypatch.setattr(Config, 'RECOMMENDER_BATCH_SIZE', 2)
+    
+    async def scenario(db):
+        ids = [await db.add_book(f"Книга {i}", "Автор", 2000, "", "Литература") for i in range(4)]
+        for telegram_id, books in ((1, ids[:3]), (2, ids[:2]), (3, [ids[0], ids[3]])):
+            await db.add_user(telegram_id)
+            for book_id in books:
+                await db.add_to_favorites(telegram_id, book_id)
+        pairs = await db.refresh_cofavorite_neighbors()
+        return ids, pairs, await db.get_recommendations_for_user(2, limit=2)
+    
+    ids, pairs, recommended = with_db(scenario)
+    assert pairs == 8
+    assert [book.id for book in recommended] == [ids[2], ids[3]]
+
+def test_content_index_finds_similar_books():
+    neighbors = ContentIndex(DOCUMENTS).neighbors(top_k=1)
+    assert neighbors[1][0][0] == 2
+    assert neighbors[3][0][0] == 4
+
+def test_content_index_update_touches_only_changed_books():
+    index = ContentIndex(DOCUMENTS)
+    idf, untouched = dict(index.idf), dict(index.vectors[2])
+    
+    # Книга 1 переписана про сад, книга 4 удалена
+    index.update([(1, "Сад на даче", "Иванов", "Огород и урожай")], [1, 4])
+    
+    assert index.idf == idf
+    assert index.vectors[2] == untouched
+    assert 4 not in index.vectors
+    assert all(4 not in books for books in index.postings.values())
+    assert index.neighbors(top_k=1, book_ids=[1])[1][0][0] == 3
+
+def test_content_index_goes_stale_after_many_changes():
+    index = ContentIndex(DOCUMENTS)
+    index.update(DOCUMENTS[:1], [1])
+    assert not index.is_stale()
+    index.update(DOCUMENTS[1:3], [2, 3])
+    assert index.is_stale()
+
+def test_refresh_content_neighbors_incrementally(with_db):
+    async def scenario(db):
+        ids = [await db.add_book(title, author, 2000, description, "Тех литература")
+               for _, title, author, description in DOCUMENTS]
+        await db.refresh_content_neighbors()
+        before = await db.get_similar_books(ids[0], limit=1)
+        await db.update_book_field(ids[0], 'description', "Огород, сад и урожай на даче")
+        await db.update_book_field(ids[0], 'title', "Сад на даче")
+        await db.refresh_content_neighbors([ids[0]])
+        after = await db.get_similar_books(ids[0], limit=1)
+        return ids, before, after
+    
+    ids, before, after = with_db(scenario)
+    assert before[0].id == ids[1]
+    assert after[0].id in (ids[2], ids[3])
@@ -0,0 +1,44 @@
+# tests/test_search.py - Поиск книг: префикс по нормализованным ключам и FTS5 с ранжированием
+from database.search import build_fts_query, normalize_search_text
+
+def test_normalize_search_text_folds_case_and_yo():
+    assert normalize_search_text("  Ёлка, ЁЖИК!  ") == "елка ежик"
+    assert normalize_search_text("") == ''
+
+def test_build_fts_query_uses_prefix_tokens():
+    assert build_fts_query("Война и мир") == '"война"* "и"* "мир"*'
+
+def test_search_is_case_insensitive_for_cyrillic(with_db):
+    async def scenario(db):
+        await db.add_book("Война и мир", "Лев Толстой", 1869, "Роман-эпопея", "Литература")
+        await db.add_book("Анна Каренина", "Лев Толстой", 1877, "Роман", "Литература")
+        return await db.search_books_by_title("ВОЙНА")
+    
+    books = with_db(scenario)
+    assert [book.title for book in books] == ["Война и мир"]
+
+def test_search_puts_prefix_matches_before_fulltext(with_db):
+    async def scenario(db):
+        await db.add_book("Мастер и Маргарита", "Михаил Булгаков", 1967, "", "Литература")
+        await db.add_book("Собачье сердце", "Михаил Булгаков", 1925, "Повесть про мастер-класс", "Литература")
+        await db.add_book("Мастерская", "Иван Иванов", 2001, "", "Тех литература")
+        assert db.fts_enabled
+        return await db.search_books_by_title("мастер")
+    
+    titles = [book.title for book in with_db(scenario)]
+    # Совпадения по началу названия идут первыми по алфавиту, совпадение в описании - после них
+    assert titles == ["Мастер и Маргарита", "Мастерская", "Собачье сердце"]
+
+def test_search_pages_across_prefix_and_fulltext(with_db):
+    async def scenario(db):
+        for year in range(2000, 2004):
+            await db.add_book(f"Python {year}", "Автор", year, "", "Тех литература")
+        await db.add_book("Учебник", "Автор", 2010, "Основы python", "Тех литература")
+        first = await db.search_books_by_title("python", limit=3)
+        second = await db.search_books_by_title("python", limit=3, offset=3)
+        return first, second
+    
+    first, second = with_db(scenario)
+    assert len(first) == 3 and len(second) == 2
+    assert not {book.id for book in first} & {book.id for book in second}
+    assert second[-1].title == "Учебник"
@@ -0,0 +1,159 @@
+# tests/test_write_behind.py - Отложенная запись избранного: склейка нажатий и запись в транзакции апдейта
+import asyncio
+
+import pytest
+
+from config import Config
+from database.write_behind import FavoriteWriteBuffer
+
+@pytest.fixture
+def slow_flush(monkeypatch):
+    """Фоновая пачка не успевает записаться во время теста; блокировка SQLite ждет недолго"""
+    monkeypatch.setattr(Config, 'FAVORITES_WRITE_DELAY', 60.0)
+    monkeypatch.setattr(Config, 'DB_CONNECT_TIMEOUT', 1.0)
+    monkeypatch.setattr(Config, 'SQLITE_BUSY_TIMEOUT', 1000)
+
+def test_buffer_coalesces_taps_on_one_pair():
+    written = []
+    
+    async def apply(changes):
+        written.append(changes)
+    
+    async def scenario():
+        buffer = FavoriteWriteBuffer(apply, delay=60)
+        buffer.put(1, 10, True, stored=False)
+        buffer.put(1, 10, False, stored=True)
+        buffer.put(1, 10, True, stored=False)
+        # Четное число нажатий - писать нечего
+        buffer.put(1, 11, False, stored=True)
+        buffer.put(1, 11, True, stored=False)
+        await buffer.close()
+        return buffer
+    
+    buffer = asyncio.run(scenario())
+    assert written == [{(1, 10): True}]
+    assert buffer.coalesced == 3
+    assert buffer.written == 1
+
+def test_restore_keeps_newer_taps():
+    async def apply(changes):
+        pass
+    
+    async def scenario():
+        buffer = FavoriteWriteBuffer(apply, delay=60)
+        buffer.put(1, 10, True, stored=False)
+        buffer.put(2, 20, True, stored=False)
+        taken = buffer.take_user(1)
+        buffer.put(1, 10, False, stored=True)
+        buffer.restore(taken)
+        state = (buffer.get(1, 10), buffer.get(2, 20))
+        await buffer.close()
+        return taken, state
+    
+    taken, state = asyncio.run(scenario())
+    assert taken == {(1, 10): (False, True)}
+    assert state == (False, True)
+
+def test_pending_taps_flush_inside_update_transaction(with_db, slow_flush):
+    async def scenario(db):
+        await db.add_user(1, 'reader')
+        first = await db.add_book("Первая", "Автор", 2000, "", "Литература")
+        second = await db.add_book("Вторая", "Автор", 2001, "", "Литература")
+        assert await db.toggle_favorite_deferred(1, first) is True
+        
+        # Транзакция апдейта уже пишет; отложенное нажатие должно записаться через нее же
+        async with db.session_scope():
+            await db.add_to_favorites(1, second)
+            books = await db.get_user_favorite_books(1)
+        
+        # Записанное нажатие ушло из буфера, состояние - в множестве избранного
+        assert db._favorites_buffer.get(db._user_ids.get(1), first) is None
+        return [book.id for book in books], [first, second]
+    
+    books, expected = with_db(scenario)
+    assert sorted(books) == expected
+
+def test_rolled_back_update_returns_taps_to_buffer(with_db, slow_flush):
+    async def scenario(db):
+        user_id = await db.add_user(1, 'reader')
+        book_id = await db.add_book("Книга", "Автор", 2000, "", "Литература")
+        await db.toggle_favorite_deferred(1, book_id)
+        
+        with pytest.raises(RuntimeError):
+            async with db.session_scope():
+                assert [book.id for book in await db.get_user_favorite_books(1)] == [book_id]
+                raise RuntimeError("обработчик упал")
+        
+        pending = db._favorites_buffer.get(user_id, book_id)
+        await db._favorites_buffer.flush()
+        return pending, await db.get_user_favorite_books(1), book_id
+    
+    pending, books, book_id = with_db(scenario)
+    assert pending is True
+    assert [book.id for book in books] == [book_id]
+
+def test_tap_during_blocked_flush_sees_batch_in_flight(with_db, slow_flush):
+    async def scenario(db):
+        user_id = await db.add_user(1, 'reader')
+        book_id = await db.add_book("Книга", "Автор", 2000, "", "Литература")
+        
+        # Запись пачки останавливается до коммита, пока тест не разрешит продолжить
+        started, release = asyncio.Event(), asyncio.Event()
+        apply = db._favorites_buffer._apply
+        
+        async def blocked_apply(changes):
+            started.set()
+            await release.wait()
+            await apply(changes)
+        
+        db._favorites_buffer._apply = blocked_apply
+        tap1 = await db.toggle_favorite_deferred(1, book_id)
+        flush = asyncio.create_task(db._favorites_buffer.flush())
+        await started.wait()
+        
+        tap2 = await db.toggle_favorite_deferred(1, book_id)
+        seen = (await db.is_book_in_favorites(1, book_id), (await db.get_book_view(1, book_id)).is_favorite,
+                await db.favorite_book_ids(1, [book_id]))
+        
+        release.set()
+        await flush
+        await db._favorites_buffer.flush()
+        in_db = [book.id for book in await db.get_user_favorite_books(1)]
+        return tap1, tap2, seen, in_db, db._favorites_buffer.get(user_id, book_id)
+    
+    tap1, tap2, seen, in_db, pending = with_db(scenario)
+    assert (tap1, tap2) == (True, False)
+    assert seen == (False, False, set())
+    assert in_db == []
+    assert pending is None
+
+def test_failed_flush_keeps_db_state_for_newer_taps():
+    written = []
+    
+    async def scenario():
+        started, release = asyncio.Event(), asyncio.Event()
+        
+        async def apply(changes):
+            if not started.is_set():
+                # Первая пачка падает уже после того, как поверх нее нажали еще раз
+                started.set()
+                await release.wait()
+                raise RuntimeError("database is locked")
+            written.append(changes)
+        
+        buffer = FavoriteWriteBuffer(apply, delay=60)
+        buffer.put(1, 10, True, stored=False)
+        flush = asyncio.create_task(buffer.flush())
+        await started.wait()
+        # Два нажатия поверх записываемой пачки: снять и снова добавить
+        buffer.put(1, 10, not buffer.get(1, 10), stored=True)
+        buffer.put(1, 10, not buffer.get(1, 10), stored=False)
+        release.set()
+        with pytest.raises(RuntimeError):
+            await flush
+        await buffer.close()
+        return buffer.get(1, 10)
+    
+    assert asyncio.run(scenario()) is None
+    # В БД книги нет, желаемое состояние - в избранном: нажатие не должно потеряться
+    assert written == [{(1, 10): True}]
@@ -1,22 +1,24 @@
 # utils.py - Вспомогательные функции
+from typing import Union
 from config import Config
+from database.read_models import BookSummary, BookDetail
 
 def is_admin(user_id: int) -> bool:
     """Проверка является ли пользователь администратором"""
     return user_id in Config.ADMIN_IDS
 
-def format_book_info(book: dict, show_description: bool = True) -> str:
+def format_book_info(book: Union[BookSummary, BookDetail], show_description: bool = True) -> str:
     """Форматирование информации о книге с учетом файлов"""
-    text = f"📖 {book['title']}\n"
-    text += f"👤 Автор: {book['author']}\n"
-    text += f"📅 Год: {book['year']}\n"
-    text += f"🏷️ Жанр: {book['genre']}"
+    text = f"📖 {book.title}\n"
+    text += f"👤 Автор: {book.author}\n"
+    text += f"📅 Год: {book.year}\n"
+    text += f"🏷️ Жанр: {book.genre}"
     
-    if book['subgenre']:
-        text += f" / {book['subgenre']}"
+    if book.subgenre:
+        text += f" / {book.subgenre}"
     
     if show_description:
-        description = book['description']
+        description = book.description
         if len(description) > 200:
             description = description[:200] + "..."
         text += f"\n\n📝 Описание:\n{description}"
@@ -55,7 +57,7 @@ def format_books_list(books: list, show_details: bool = False) -> str:
         if show_details:
             text += format_book_info(book, show_description=False) + "\n\n"
         else:
-            text += f"📖 {book['title']} - {book['author']} ({book['year']})\n"
+            text += f"📖 {book.title} - {book.author} ({book.year})\n"
     
     return text.strip()
 
@@ -107,11 +109,33 @@ def format_profile_stats(favorite_count: int, recommendations_count: int) -> str
     stats += f"💡 Рекомендаций: {recommendations_count}"
     return stats
 
-def format_admin_stats(total_books: int, total_users: int, literature_books: int, tech_books: int) -> str:
+# Подписи in-process кэшей DatabaseManager в статистике
+CACHE_NAMES = {
+    'books': 'Карточки книг',
+    'users': 'Известные пользователи',
+    'user_ids': 'ID пользователей',
+    'recommendations': 'Рекомендации',
+    'favorite_sets': 'Избранное пользователей'
+}
+
+def format_admin_stats(stats: dict, cache_stats: dict = None) -> str:
     """Форматирование статистики для админа"""
-    stats = "📊 Статистика бота:\n\n"
-    stats += f"📚 Всего книг: {total_books}\n"
-    stats += f"👥 Всего пользователей: {total_users}\n\n"
-    stats += f"📖 Литература: {literature_books} книг\n"
-    stats += f"💻 Тех литература: {tech_books} книг"
-    return stats
\ No newline at end of file
+    text = "📊 Статистика бота:\n\n"
+    text += f"📚 Всего книг: {stats['total_books']}\n"
+    text += f"📎 С файлами: {stats['books_with_files']} ({format_file_size(stats['total_file_size'])})\n"
+    text += f"👥 Всего пользователей: {stats['total_users']}\n"
+    text += f"❤️ В избранном: {stats['total_favorites']} (у {stats['users_with_favorites']} пользователей)\n"
+    
+    for genre, count in sorted(stats['genres'].items()):
+        text += f"\n{get_genre_emoji(genre)} {genre}: {count} книг\n"
+        for (subgenre_genre, subgenre), subgenre_count in sorted(stats['subgenres'].items()):
+            if subgenre_genre == genre:
+                text += f"   • {subgenre}: {subgenre_count}\n"
+    
+    if cache_stats:
+        text += "\n🗄️ Кэши:\n"
+        for name, cache in cache_stats.items():
+            text += f"   • {CACHE_NAMES.get(name, name)}: {cache['size']} записей, попаданий {cache['hit_rate']:.0%}"
+            text += f" ({cache['hits']}/{cache['hits'] + cache['misses']})\n"
+    
+    return text
\ No newline at end of file